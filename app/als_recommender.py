@@ -0,0 +1,323 @@
+"""
+als_recommender.py - рекомендации на матричной факторизации (ALS) по оценкам из reviews.
+
+Факторы пользователей и фильмов обучаются офлайн и сохраняются в .npz:
+
+    python -m app.als_recommender train
+    python -m app.als_recommender train --mode implicit --factors 64 --iterations 20
+
+Запрос рекомендаций — одно произведение матрицы факторов фильмов на вектор
+пользователя и частичная сортировка (argpartition). Пользователь, которого не
+было при обучении (или у которого одна-две оценки), получает вектор "fold-in":
+одно решение k×k системы по его текущим оценкам и готовым факторам фильмов.
+
+Пакетный режим считает top-N сразу для всех пользователей блоками U @ V.T:
+
+    python -m app.als_recommender batch --top-n 10 > als_recommendations.csv
+
+Режимы:
+  * explicit — факторизация самих оценок (центрированных средним), регуляризация λ·n;
+  * implicit — оценки как уверенность c = 1 + alpha·rating (Hu, Koren, Volinsky, 2008).
+"""
+import argparse
+import csv
+import os
+import sys
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .collaborative_filtering import CFModel, _ratings_query, _titles_query
+from .config import settings
+from .database import SessionLocal
+from .executor import run_in_model_executor
+from .metrics import timed
+from .models import Review
+
+MODES = ("explicit", "implicit")
+
+
+def _user_ratings_query(user_id: int):
+    return select(Review.movie_id, Review.rating).where(Review.user_id == user_id)
+
+
+def _solve_rows(ratings: sparse.csr_matrix, fixed: np.ndarray, reg: float, mode: str, alpha: float) -> np.ndarray:
+    """Один полушаг ALS: при фиксированных факторах fixed решает по системе k×k на каждую строку ratings."""
+    factors = fixed.shape[1]
+    eye = np.eye(factors)
+    result = np.zeros((ratings.shape[0], factors))
+    gram = fixed.T @ fixed if mode == "implicit" else None
+    for row in range(ratings.shape[0]):
+        start, stop = ratings.indptr[row], ratings.indptr[row + 1]
+        if start == stop:
+            continue
+        result[row] = _solve_one(fixed[ratings.indices[start:stop]], ratings.data[start:stop], reg, mode, alpha, eye, gram)
+    return result
+
+
+def _solve_one(fixed_rows: np.ndarray, values: np.ndarray, reg: float, mode: str, alpha: float, eye: np.ndarray, gram: Optional[np.ndarray]) -> np.ndarray:
+    if mode == "implicit":
+        # (YᵀY + Yᵢᵀ(Cᵢ - I)Yᵢ + λI) x = Yᵢᵀ Cᵢ pᵢ, где pᵢ = 1 для оценённых фильмов
+        confidence = 1.0 + alpha * values
+        a = gram + (fixed_rows.T * (confidence - 1.0)) @ fixed_rows + reg * eye
+        b = fixed_rows.T @ confidence
+    else:
+        a = fixed_rows.T @ fixed_rows + reg * len(values) * eye
+        b = fixed_rows.T @ values
+    return np.linalg.solve(a, b)
+
+
+class ALSModel:
+    """Обученные факторы: строки user_factors/item_factors соответствуют user_ids/movie_ids."""
+
+    def __init__(self, user_ids, movie_ids, user_factors, item_factors, mode: str, regularization: float, alpha: float, mean: float):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.mode = mode
+        self.regularization = regularization
+        self.alpha = alpha
+        self.mean = mean  # средняя оценка (explicit-режим обучается на центрированных оценках)
+
+    @classmethod
+    def train(
+        cls,
+        rows,
+        factors: int = settings.ALS_FACTORS,
+        regularization: float = settings.ALS_REGULARIZATION,
+        iterations: int = settings.ALS_ITERATIONS,
+        mode: str = settings.ALS_MODE,
+        alpha: float = settings.ALS_ALPHA,
+        seed: int = 0,
+    ) -> Optional["ALSModel"]:
+        """Обучает факторы по тройкам (user_id, movie_id, rating)."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown ALS mode: {mode!r}, expected one of {MODES}")
+        matrix = CFModel.from_rows(rows, min_user_ratings=1, min_movie_ratings=1)
+        if matrix is None:
+            return None
+
+        ratings = matrix.ratings.astype(np.float64)
+        mean = float(ratings.data.mean()) if mode == "explicit" else 0.0
+        if mode == "explicit":
+            ratings.data -= mean
+        by_item = ratings.T.tocsr()
+
+        rng = np.random.default_rng(seed)
+        user_factors = rng.normal(scale=0.1, size=(ratings.shape[0], factors))
+        item_factors = rng.normal(scale=0.1, size=(ratings.shape[1], factors))
+        for _ in range(iterations):
+            user_factors = _solve_rows(ratings, item_factors, regularization, mode, alpha)
+            item_factors = _solve_rows(by_item, user_factors, regularization, mode, alpha)
+
+        return cls(matrix.user_ids, matrix.movie_ids, user_factors, item_factors, mode, regularization, alpha, mean)
+
+    def save(self, path: str = settings.ALS_MODEL_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Через временный файл и os.replace: ALSModelStore перечитывает модель по mtime
+        # и не должен увидеть недописанный zip
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            user_ids=self.user_ids,
+            movie_ids=self.movie_ids,
+            user_factors=self.user_factors,
+            item_factors=self.item_factors,
+            mode=np.array(self.mode),
+            regularization=np.array(self.regularization),
+            alpha=np.array(self.alpha),
+            mean=np.array(self.mean),
+        )
+        os.replace(tmp_path, f"{path}.npz")
+
+    @classmethod
+    def load(cls, path: str = settings.ALS_MODEL_PATH) -> Optional["ALSModel"]:
+        if not os.path.exists(f"{path}.npz"):
+            return None
+        data = np.load(f"{path}.npz")
+        return cls(
+            data["user_ids"],
+            data["movie_ids"],
+            data["user_factors"],
+            data["item_factors"],
+            str(data["mode"]),
+            float(data["regularization"]),
+            float(data["alpha"]),
+            float(data["mean"]),
+        )
+
+    def user_vector(self, user_id: int, rated: list[tuple[int, int]]) -> Optional[np.ndarray]:
+        """
+        Вектор пользователя: обученный, а для новых пользователей — fold-in по его оценкам.
+
+        Args:
+            rated: текущие оценки пользователя (movie_id, rating).
+        """
+        row = np.searchsorted(self.user_ids, user_id)
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return self.user_factors[row]
+
+        movie_ids = np.array([movie_id for movie_id, _ in rated], dtype=np.int64)
+        known = np.isin(movie_ids, self.movie_ids)
+        if not known.any():
+            return None
+        values = np.array([rating for _, rating in rated], dtype=np.float64)[known] - self.mean
+        fixed = self.item_factors[np.searchsorted(self.movie_ids, movie_ids[known])].astype(np.float64)
+        eye = np.eye(fixed.shape[1])
+        gram = self.item_factors.T.astype(np.float64) @ self.item_factors if self.mode == "implicit" else None
+        return _solve_one(fixed, values, self.regularization, self.mode, self.alpha, eye, gram).astype(np.float32)
+
+    def recommend(self, user_id: int, rated: list[tuple[int, int]], top_n: int) -> list[int]:
+        """ID фильмов top-N: одно произведение item_factors @ u и argpartition, без уже оценённых."""
+        vector = self.user_vector(user_id, rated)
+        if vector is None:
+            return []
+        scores = self.item_factors @ vector
+        scores[np.isin(self.movie_ids, [movie_id for movie_id, _ in rated])] = -np.inf
+        return self.movie_ids[_top_indices(scores, top_n)].tolist()
+
+    def recommend_all(self, seen: sparse.csr_matrix, top_n: int, block_size: int = 1024) -> Iterator[tuple[int, list[int]]]:
+        """
+        Пакетный top-N для всех обученных пользователей: блоки U @ V.T и argpartition по строкам.
+
+        Args:
+            seen: матрица пользователи×фильмы (в порядке user_ids/movie_ids) с уже оценёнными фильмами.
+        """
+        top_n = min(top_n, len(self.movie_ids))
+        for start in range(0, len(self.user_ids), block_size):
+            stop = min(start + block_size, len(self.user_ids))
+            scores = self.user_factors[start:stop] @ self.item_factors.T
+            block_seen = seen[start:stop].tocoo()
+            scores[block_seen.row, block_seen.col] = -np.inf
+            top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            for offset in range(stop - start):
+                row_top = top[offset][np.isfinite(scores[offset, top[offset]])]
+                yield int(self.user_ids[start + offset]), self.movie_ids[row_top].tolist()
+
+
+def _top_indices(scores: np.ndarray, top_n: int) -> np.ndarray:
+    top_n = min(top_n, int(np.isfinite(scores).sum()))
+    if top_n <= 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class ALSModelStore:
+    """Лениво читает модель с диска и перечитывает её, когда файл перезаписан командой train."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._model: Optional[ALSModel] = None
+        self._mtime: Optional[float] = None
+
+    def get(self) -> Optional[ALSModel]:
+        try:
+            mtime = os.path.getmtime(f"{self.path}.npz")
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self._model = ALSModel.load(self.path)
+                self._mtime = mtime
+            return self._model
+
+
+als_store = ALSModelStore(settings.ALS_MODEL_PATH)
+
+
+@timed("recommend_als")
+def als_recommendations(db: Session, user_id: int, top_n: int = 5) -> list[str]:
+    """
+    Рекомендации по обученным ALS-факторам (python -m app.als_recommender train).
+
+    Returns:
+        Список названий фильмов; пустой, если модель ещё не обучена.
+    """
+    model = als_store.get()
+    if model is None:
+        return []
+    rated = [tuple(row) for row in db.execute(_user_ratings_query(user_id)).all()]
+    movie_ids = model.recommend(user_id, rated, top_n)
+    if not movie_ids:
+        return []
+    titles = dict(db.execute(_titles_query(movie_ids)).all())
+    return [titles[movie_id] for movie_id in movie_ids if movie_id in titles]
+
+@timed("recommend_als")
+async def als_recommendations_async(db: AsyncSession, user_id: int, top_n: int = 5) -> list[str]:
+    """Асинхронный вариант: перечитывание модели после переобучения и fold-in идут в пуле моделей."""
+    model = await run_in_model_executor(als_store.get)
+    if model is None:
+        return []
+    rated = [tuple(row) for row in (await db.execute(_user_ratings_query(user_id))).all()]
+    movie_ids = await run_in_model_executor(model.recommend, user_id, rated, top_n)
+    if not movie_ids:
+        return []
+    titles = dict((await db.execute(_titles_query(movie_ids))).all())
+    return [titles[movie_id] for movie_id in movie_ids if movie_id in titles]
+
+
+def _seen_matrix(model: ALSModel, rows) -> sparse.csr_matrix:
+    """Уже оценённые фильмы в порядке строк/столбцов модели (неизвестные пользователи и фильмы отбрасываются)."""
+    data = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+    data = data[np.isin(data[:, 0], model.user_ids) & np.isin(data[:, 1], model.movie_ids)]
+    return sparse.csr_matrix(
+        (np.ones(len(data)), (np.searchsorted(model.user_ids, data[:, 0]), np.searchsorted(model.movie_ids, data[:, 1]))),
+        shape=(len(model.user_ids), len(model.movie_ids)),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Обучение ALS и пакетные рекомендации")
+    commands = parser.add_subparsers(dest="command", required=True)
+    # Общие опции подкоманд: python -m app.als_recommender train --path ...
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--path", default=settings.ALS_MODEL_PATH, help="путь к файлу модели без расширения")
+
+    train = commands.add_parser("train", parents=[common], help="обучить факторы по таблице reviews и сохранить их")
+    train.add_argument("--mode", choices=MODES, default=settings.ALS_MODE)
+    train.add_argument("--factors", type=int, default=settings.ALS_FACTORS)
+    train.add_argument("--regularization", type=float, default=settings.ALS_REGULARIZATION)
+    train.add_argument("--iterations", type=int, default=settings.ALS_ITERATIONS)
+    train.add_argument("--alpha", type=float, default=settings.ALS_ALPHA)
+
+    batch = commands.add_parser("batch", parents=[common], help="top-N для всех пользователей в CSV (user_id,rank,movie_id)")
+    batch.add_argument("--top-n", type=int, default=10)
+    batch.add_argument("--output", default="-", help="путь к CSV (- для stdout)")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        rows = db.execute(_ratings_query()).all()
+
+    if args.command == "train":
+        model = ALSModel.train(rows, args.factors, args.regularization, args.iterations, args.mode, args.alpha)
+        if model is None:
+            print("no ratings to train on")
+            return
+        model.save(args.path)
+        print(f"ALS ({model.mode}) trained: {len(model.user_ids)} users, {len(model.movie_ids)} movies")
+        return
+
+    model = ALSModel.load(args.path)
+    if model is None:
+        sys.exit(f"model not found: {args.path}.npz (run train first)")
+    stream = open(args.output, "w", encoding="utf-8", newline="") if args.output != "-" else sys.stdout
+    with stream:
+        writer = csv.writer(stream)
+        writer.writerow(["user_id", "rank", "movie_id"])
+        for user_id, movie_ids in model.recommend_all(_seen_matrix(model, rows), args.top_n):
+            writer.writerows((user_id, rank, movie_id) for rank, movie_id in enumerate(movie_ids))
+
+
+if __name__ == "__main__":
+    main()
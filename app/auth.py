@@ -1,11 +1,18 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from . import models, crud, database
+from .cache import MemoryBackend
+from .config import settings
+from .executor import run_in_model_executor
 
 SECRET_KEY = "supersecretjwtkey"
 ALGORITHM = "HS256"
@@ -20,6 +27,40 @@ def verify_password(plain_password, hashed_password):
 def hash_password(password):
     return pwd_context.hash(password)
 
+# Аутентифицированный пользователь: всё, что эндпоинтам нужно знать о нём
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    name: str
+    email: str
+
+# Пользователи по ID из токена: TTL + LRU в памяти процесса.
+# Изменения через ORM сбрасывают запись сразу (в этом процессе), остальные воркеры увидят их через TTL.
+# Поэтому удалённый пользователь остаётся авторизованным до AUTH_PRINCIPAL_CACHE_TTL_SECONDS в других
+# воркерах, а при AUTH_EMBED_USER_CLAIMS — до истечения токена (ACCESS_TOKEN_EXPIRE_MINUTES); его записи
+# отклоняет внешний ключ на users, и такой IntegrityError превращается в 401 (см. is_deleted_user_error).
+principal_cache = MemoryBackend(settings.AUTH_PRINCIPAL_CACHE_SIZE)
+
+# Внешние ключи на users: нарушение означает, что автор запроса уже удалён
+USER_FOREIGN_KEYS = ("reviews_user_id_fkey",)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    principal_cache.delete(str(target.id))
+
+def is_deleted_user_error(exc: IntegrityError) -> bool:
+    """Запись отклонена внешним ключом на users — пользователь из ещё действующего токена удалён."""
+    message = str(exc.orig)
+    return any(constraint in message for constraint in USER_FOREIGN_KEYS)
+
+def token_claims(user) -> dict:
+    """Содержимое токена: sub, а при AUTH_EMBED_USER_CLAIMS — ещё имя и email (тогда /me и проверки владельца не ходят в БД)."""
+    claims = {"sub": str(user.id)}
+    if settings.AUTH_EMBED_USER_CLAIMS:
+        claims.update(name=user.name, email=user.email)
+    return claims
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -37,7 +78,19 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    return (await db.execute(select(models.User).where(models.User.email == email))).scalar_one_or_none()
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email_async(db, email)
+    if not user:
+        return False
+    # bcrypt намеренно медленный — проверяем пароль вне event loop
+    if not await run_in_model_executor(verify_password, password, user.hashed_password):
+        return False
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -46,11 +99,22 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = int(payload.get("sub"))
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
+    except (JWTError, TypeError, ValueError):
         raise credentials_exception
-    return user
+
+    # Токен уже содержит всё нужное — БД не нужна (изменения пользователя видны после перевыпуска токена)
+    if settings.AUTH_EMBED_USER_CLAIMS and "name" in payload and "email" in payload:
+        return Principal(id=user_id, name=payload["name"], email=payload["email"])
+
+    cache_ttl = settings.AUTH_PRINCIPAL_CACHE_TTL_SECONDS
+    principal = principal_cache.get(str(user_id)) if cache_ttl > 0 else None
+    if principal is None:
+        row = (await db.execute(
+            select(models.User.id, models.User.name, models.User.email).where(models.User.id == user_id)
+        )).one_or_none()
+        if row is None:
+            raise credentials_exception
+        principal = Principal(id=row.id, name=row.name, email=row.email)
+        if cache_ttl > 0:
+            principal_cache.set(str(user_id), principal, cache_ttl)
+    return principal
@@ -0,0 +1,302 @@
+"""
+cache.py - кеш результатов рекомендаций с инвалидацией по записи отзывов.
+
+Результат эндпоинта кешируется по ключу (алгоритм, пользователь, параметры, версии).
+Версии — счётчики в том же хранилище:
+  * version:reviews — глобальная версия отзывов, растёт при каждой записи отзыва
+    (при CACHE_GLOBAL_INVALIDATION=false не растёт: чужие записи ждут TTL);
+  * version:user:<id> — версия пользователя, растёт при записи его отзыва.
+Старые записи не удаляются явно: после смены версии их ключи больше не запрашиваются
+и вытесняются по LRU/TTL. Отзыв, записанный во время вычисления, тоже безопасен —
+результат ляжет под старую версию, а следующий запрос пойдёт уже по новой.
+
+Хранилища (CACHE_BACKEND):
+  * memory — TTL + LRU в памяти процесса (у каждого воркера свой кеш и свои версии).
+    Подходит только для одного процесса API: запись отзыва сбрасывает версии лишь
+    в обработавшем её воркере, остальные отдают автору старый результат до CACHE_TTL_SECONDS;
+  * redis  — Redis-совместимое хранилище (CACHE_REDIS_URL): кеш и версии общие для
+    всех воркеров и для CLI-пересчётов (app.clustering, app.item_neighbors).
+    Эндпоинты ходят в него асинхронным клиентом (redis.asyncio) и не блокируют event loop.
+
+MemoryBackend также хранит кеш пользователей из токенов (app/auth.py).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_VERSION = "version:reviews"
+
+
+def _user_version(user_id: int) -> str:
+    return f"version:user:{user_id}"
+
+
+class MemoryBackend:
+    """TTL + LRU в памяти процесса: не больше max_entries записей, давно не читанные вытесняются."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counters(self, names: list[str]) -> Optional[list[int]]:
+        with self._lock:
+            return [self._counters.get(name, 0) for name in names]
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def size(self) -> Optional[int]:
+        return len(self._entries)
+
+    # Асинхронный интерфейс для event loop: операции в памяти не блокируют, поэтому просто делегируют
+
+    async def get_async(self, key: str) -> Any:
+        return self.get(key)
+
+    async def set_async(self, key: str, value: Any, ttl: float) -> None:
+        self.set(key, value, ttl)
+
+    async def counters_async(self, names: list[str]) -> Optional[list[int]]:
+        return self.counters(names)
+
+    async def incr_async(self, name: str) -> None:
+        self.incr(name)
+
+
+class RedisBackend:
+    """
+    Redis-совместимое хранилище (Redis, Valkey, KeyDB). Значения хранятся в JSON с TTL,
+    вытеснение — по maxmemory-policy самого сервера.
+
+    Ошибки сервера не ломают эндпоинты: чтение считается промахом, а без версий
+    кеш обходится целиком (иначе можно отдать результат, устаревший после записи).
+
+    Методы *_async — для event loop (redis.asyncio), остальные — для синхронного кода
+    (threadpool, app.worker, CLI).
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "movies:rec:"):
+        import redis
+
+        self.url = url
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._error = redis.RedisError
+        self.prefix = prefix
+        self._async_redis = None
+        self._async_loop = None
+
+    def _async_client(self):
+        """Асинхронный клиент текущего event loop (соединения redis.asyncio привязаны к циклу)."""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            import redis.asyncio
+
+            self._async_redis = redis.asyncio.Redis.from_url(self.url, socket_timeout=0.5)
+            self._async_loop = loop
+        return self._async_redis
+
+    def get(self, key: str) -> Any:
+        try:
+            raw = self._redis.get(self.prefix + key)
+        except self._error as exc:
+            logger.warning("cache get failed: %s", exc)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            self._redis.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+        except self._error as exc:
+            logger.warning("cache set failed: %s", exc)
+
+    def delete(self, key: str) -> None:
+        try:
+            self._redis.delete(self.prefix + key)
+        except self._error as exc:
+            logger.warning("cache delete failed: %s", exc)
+
+    def counters(self, names: list[str]) -> Optional[list[int]]:
+        try:
+            values = self._redis.mget([self.prefix + name for name in names])
+        except self._error as exc:
+            logger.warning("cache versions are unavailable, bypassing cache: %s", exc)
+            return None
+        return [int(value or 0) for value in values]
+
+    def incr(self, name: str) -> None:
+        try:
+            self._redis.incr(self.prefix + name)
+        except self._error as exc:
+            # Инвалидация не прошла: записи устареют только по TTL
+            logger.error("cache invalidation failed for %s: %s", name, exc)
+
+    async def get_async(self, key: str) -> Any:
+        try:
+            raw = await self._async_client().get(self.prefix + key)
+        except self._error as exc:
+            logger.warning("cache get failed: %s", exc)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    async def set_async(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            await self._async_client().set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+        except self._error as exc:
+            logger.warning("cache set failed: %s", exc)
+
+    async def counters_async(self, names: list[str]) -> Optional[list[int]]:
+        try:
+            values = await self._async_client().mget([self.prefix + name for name in names])
+        except self._error as exc:
+            logger.warning("cache versions are unavailable, bypassing cache: %s", exc)
+            return None
+        return [int(value or 0) for value in values]
+
+    async def incr_async(self, name: str) -> None:
+        try:
+            await self._async_client().incr(self.prefix + name)
+        except self._error as exc:
+            logger.error("cache invalidation failed for %s: %s", name, exc)
+
+    def size(self) -> Optional[int]:
+        return None  # DBSIZE считает ключи всего сервера, а не только наши
+
+
+class RecommendationCache:
+    """Кеш результатов рекомендаций по пользователю и алгоритму со счётчиками попаданий."""
+
+    def __init__(self, backend, ttl: float, global_invalidation: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.global_invalidation = global_invalidation
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    async def _key(self, algorithm: str, user_id: Optional[int], params: tuple) -> Optional[str]:
+        names = [GLOBAL_VERSION] if user_id is None else [GLOBAL_VERSION, _user_version(user_id)]
+        versions = await self.backend.counters_async(names)
+        if versions is None:
+            return None
+        return ":".join([algorithm, str(user_id), *map(str, params), "v", *map(str, versions)])
+
+    def _count(self, counter: Counter, algorithm: str) -> None:
+        with self._lock:
+            counter[algorithm] += 1
+
+    async def get_or_compute_async(
+        self, algorithm: str, user_id: Optional[int], compute: Callable[[], Awaitable[Any]], *params
+    ) -> Any:
+        """
+        Возвращает результат из кеша или вычисляет его через compute() и сохраняет.
+
+        Args:
+            algorithm (str): имя алгоритма (часть ключа и метка в статистике).
+            user_id (int | None): пользователь; None — результат общий для всех.
+            compute (callable): корутина-функция, вычисляющая результат (не None, сериализуемый в JSON).
+            *params: параметры запроса, влияющие на результат.
+        """
+        key = await self._key(algorithm, user_id, params) if settings.CACHE_ENABLED else None
+        if key is not None:
+            value = await self.backend.get_async(key)
+            if value is not None:
+                self._count(self.hits, algorithm)
+                return value
+        self._count(self.misses, algorithm)
+        value = await compute()
+        if key is not None:
+            await self.backend.set_async(key, value, self.ttl)
+        return value
+
+    def reviews_written(self, user_id: int) -> None:
+        """Вызывается после коммита новых отзывов пользователя user_id."""
+        self.backend.incr(_user_version(user_id))
+        if self.global_invalidation:
+            self.backend.incr(GLOBAL_VERSION)
+
+    async def reviews_written_async(self, user_id: int) -> None:
+        """Асинхронный вариант reviews_written (для кода в event loop)."""
+        await self.backend.incr_async(_user_version(user_id))
+        if self.global_invalidation:
+            await self.backend.incr_async(GLOBAL_VERSION)
+
+    def invalidate_all(self) -> None:
+        """Сбрасывает все записи (например, после офлайн-пересчёта кластеров или соседей)."""
+        self.backend.incr(GLOBAL_VERSION)
+
+    async def invalidate_all_async(self) -> None:
+        """Асинхронный вариант invalidate_all."""
+        await self.backend.incr_async(GLOBAL_VERSION)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = dict(self.hits), dict(self.misses)
+        total_hits, total_misses = sum(hits.values()), sum(misses.values())
+        lookups = total_hits + total_misses
+        return {
+            "enabled": settings.CACHE_ENABLED,
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl,
+            "global_invalidation": self.global_invalidation,
+            "entries": self.backend.size(),
+            "hits": total_hits,
+            "misses": total_misses,
+            "hit_ratio": round(total_hits / lookups, 4) if lookups else 0.0,
+            "by_algorithm": {
+                algorithm: {"hits": hits.get(algorithm, 0), "misses": misses.get(algorithm, 0)}
+                for algorithm in sorted(set(hits) | set(misses))
+            },
+        }
+
+
+def _make_backend():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend(settings.CACHE_REDIS_URL)
+    if settings.CACHE_BACKEND == "memory":
+        if settings.ENRICHMENT_MODE == "queue" and settings.CACHE_ENABLED:
+            # Отзывы обогащает app.worker в другом процессе: сбросить кеш в памяти API он не может,
+            # и автор до CACHE_TTL_SECONDS видел бы рекомендации без своего отзыва
+            raise ValueError("ENRICHMENT_MODE=queue requires CACHE_BACKEND=redis (or CACHE_ENABLED=false)")
+        return MemoryBackend(settings.CACHE_MAX_ENTRIES)
+    raise ValueError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND!r}, expected memory or redis")
+
+
+recommendation_cache = RecommendationCache(_make_backend(), settings.CACHE_TTL_SECONDS, settings.CACHE_GLOBAL_INVALIDATION)
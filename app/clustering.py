@@ -1,73 +1,281 @@
-import re
+"""
+clustering.py - тематическая кластеризация фильмов по текстам отзывов.
+
+Обучение (TF-IDF и KMeans по reviews.processed_text) выполняется офлайн; векторайзер и
+центроиды сохраняются в joblib-файл, а кластеры фильмов — в таблицу movie_clusters:
+
+    python -m app.clustering
+    python -m app.clustering --clusters 8 --mode minibatch --batch-size 2048
+
+GET /clustered-movies только читает сохранённые кластеры. Фильмы, появившиеся
+после обучения, получают ближайший центроид (transform + predict) без переобучения.
+Если модель ещё не обучалась, первый запрос обучает её сам; обучение (и из CLI, и из
+запроса) идёт под advisory-блокировкой PostgreSQL, поэтому параллельные обучения не смешивают
+файл модели и содержимое movie_clusters.
+Режим minibatch обучает MiniBatchKMeans через partial_fit по чанкам — для больших корпусов.
+"""
+import argparse
+import os
+import threading
 from collections import defaultdict
-from functools import lru_cache
-
-import pymorphy2
-import nltk
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-
-# Скачиваем стоп-слова один раз
-nltk.download('stopwords')
-from nltk.corpus import stopwords
-
-# Инициализация морфоанализатора и стоп-слов
-morph = pymorphy2.MorphAnalyzer()
-stop_words = set(stopwords.words('russian'))
-
-# Регулярка для токенизации русских слов
-WORD_RE = re.compile(r'[а-яё]+', re.IGNORECASE)
-
-@lru_cache(maxsize=100_000)
-def lemmatize_word(word: str) -> str:
-    """Лемматизация с кешированием."""
-    return morph.parse(word)[0].normal_form
-
-def preprocess_text(text: str) -> str:
-    """Токенизация, лемматизация и удаление стоп-слов."""
-    words = WORD_RE.findall(text.lower())
-    lemmas = [lemmatize_word(w) for w in words]
-    filtered = [lemma for lemma in lemmas if lemma not in stop_words]
-    return ' '.join(filtered)
-
-def cluster_movies_by_reviews(db, num_clusters: int = 5) -> dict[int, list[str]]:
-    """Кластеризация фильмов по тематике отзывов."""
-    from app.models import Review, Movie
-
-    # Загружаем все отзывы
-    reviews = db.query(Review).all()
-    if not reviews:
-        return {}
-
-    # Группируем отзывы по movie_id с предобработкой
+from typing import Optional
+
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.cache import recommendation_cache
+from app.config import settings
+from app.executor import run_in_model_executor
+from app.metrics import timed
+# Предобработка вынесена в text_preprocessing; имена оставлены здесь для обратной совместимости
+from app.text_preprocessing import lemmatize_word, preprocess_text, preprocess_texts
+
+MODES = ("kmeans", "minibatch")
+
+# Ключ pg_advisory_xact_lock для обучения кластеров (общий для всех процессов)
+FIT_LOCK_KEY = 0x636C7573  # "clus"
+
+def _documents(reviews) -> tuple[list[int], list[str]]:
+    """
+    Группирует отзывы по фильму: один документ на фильм.
+
+    Используется сохранённый reviews.processed_text; отзывы без него
+    (ещё не прошедшие бэкфилл) предобрабатываются одной пачкой.
+    """
+    missing = [review_text for _, review_text, processed in reviews if processed is None]
+    computed = iter(preprocess_texts(missing)) if missing else iter(())
+
     reviews_by_movie = defaultdict(list)
-    for review in reviews:
-        reviews_by_movie[review.movie_id].append(preprocess_text(review.review_text))
+    for movie_id, _, processed in reviews:
+        reviews_by_movie[movie_id].append(processed if processed is not None else next(computed))
+    return list(reviews_by_movie.keys()), [" ".join(texts) for texts in reviews_by_movie.values()]
+
+
+class ClusterModel:
+    """Обученные TF-IDF-векторайзер и центроиды кластеров."""
+
+    def __init__(self, vectorizer, kmeans, batch_size: int):
+        self.vectorizer = vectorizer
+        self.kmeans = kmeans
+        self.batch_size = batch_size
+
+    @classmethod
+    @timed("cluster_fit")
+    def fit(cls, documents: list[str], num_clusters: int, mode: str = "kmeans", batch_size: int = 1024) -> "ClusterModel":
+        if mode not in MODES:
+            raise ValueError(f"Unknown clustering mode: {mode!r}, expected one of {MODES}")
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+
+        num_clusters = min(num_clusters, len(documents))
+
+        # Векторизация TF-IDF
+        vectorizer = TfidfVectorizer()
+        if mode == "kmeans":
+            tfidf_matrix = vectorizer.fit_transform(documents)
+            kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=10).fit(tfidf_matrix)
+            return cls(vectorizer, kmeans, batch_size)
+
+        # MiniBatchKMeans: словарь строится за один проход, центроиды дообучаются по чанкам
+        vectorizer.fit(documents)
+        kmeans = MiniBatchKMeans(n_clusters=num_clusters, random_state=42, batch_size=batch_size)
+        first = max(batch_size, num_clusters)  # первый partial_fit должен видеть хотя бы num_clusters документов
+        kmeans.partial_fit(vectorizer.transform(documents[:first]))
+        for start in range(first, len(documents), batch_size):
+            kmeans.partial_fit(vectorizer.transform(documents[start:start + batch_size]))
+        return cls(vectorizer, kmeans, batch_size)
+
+    @timed("cluster_predict")
+    def predict(self, documents: list[str]) -> list[int]:
+        """Номер ближайшего центроида для каждого документа (по чанкам, без переобучения)."""
+        labels = []
+        for start in range(0, len(documents), self.batch_size):
+            chunk = self.vectorizer.transform(documents[start:start + self.batch_size])
+            labels.extend(int(label) for label in self.kmeans.predict(chunk))
+        return labels
+
+    def save(self, path: str = settings.CLUSTER_MODEL_PATH) -> None:
+        import joblib
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Через временный файл: ClusterModelStore в других процессах не прочитает недописанную модель
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({"vectorizer": self.vectorizer, "kmeans": self.kmeans, "batch_size": self.batch_size}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = settings.CLUSTER_MODEL_PATH) -> Optional["ClusterModel"]:
+        if not os.path.exists(path):
+            return None
+        import joblib
+
+        data = joblib.load(path)
+        return cls(data["vectorizer"], data["kmeans"], data["batch_size"])
 
-    # Формируем список документов для кластеризации
-    movie_ids = list(reviews_by_movie.keys())
-    processed_reviews = [" ".join(texts) for texts in reviews_by_movie.values()]
 
-    if not processed_reviews:
-        return {}
+class ClusterModelStore:
+    """Лениво читает модель с диска и перечитывает её после переобучения."""
 
-    # Векторизация TF-IDF
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(processed_reviews)
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._model: Optional[ClusterModel] = None
+        self._mtime: Optional[float] = None
 
-    # Кластеризация KMeans
-    kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
-    clusters = kmeans.fit_predict(tfidf_matrix)
+    def get(self) -> Optional[ClusterModel]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self._model = ClusterModel.load(self.path)
+                self._mtime = mtime
+            return self._model
 
-    # Получаем все фильмы за один запрос (чтобы избежать N+1)
-    movies = db.query(Movie).filter(Movie.id.in_(movie_ids)).all()
-    movie_map = {m.id: m.title for m in movies}
 
+cluster_store = ClusterModelStore(settings.CLUSTER_MODEL_PATH)
+
+
+def _fit_lock_stmt():
+    # Держится до конца транзакции: обучение, запись файла модели и замена movie_clusters идут одним блоком
+    return select(func.pg_advisory_xact_lock(FIT_LOCK_KEY))
+
+def _reviews_query():
+    from app.models import Review
+    return select(Review.movie_id, Review.review_text, Review.processed_text)
+
+def _unassigned_reviews_query():
+    # Отзывы фильмов, у которых ещё нет кластера (появились после обучения)
+    from app.models import Review, MovieCluster
+    return _reviews_query().where(~exists().where(MovieCluster.movie_id == Review.movie_id))
+
+def _assignments_query():
+    from app.models import Movie, MovieCluster
+    return (
+        select(MovieCluster.cluster_id, Movie.title)
+        .join(Movie, Movie.id == MovieCluster.movie_id)
+        .order_by(MovieCluster.cluster_id, Movie.id)
+    )
+
+def _assign_stmt(movie_ids: list[int], labels: list[int]):
+    # ON CONFLICT DO NOTHING: параллельные запросы могут назначать один и тот же новый фильм
+    from app.models import MovieCluster
+    return (
+        pg_insert(MovieCluster)
+        .values([{"movie_id": movie_id, "cluster_id": label} for movie_id, label in zip(movie_ids, labels)])
+        .on_conflict_do_nothing(index_elements=[MovieCluster.movie_id])
+    )
+
+def _fit_and_predict(reviews, num_clusters: int, mode: str, batch_size: int) -> tuple[ClusterModel, list[int], list[int]]:
+    """Обучает модель по отзывам и сохраняет её. Возвращает модель, ID фильмов и их кластеры."""
+    movie_ids, documents = _documents(reviews)
+    model = ClusterModel.fit(documents, num_clusters, mode, batch_size)
+    model.save(cluster_store.path)
+    return model, movie_ids, model.predict(documents)
+
+def _predict_new(model: ClusterModel, reviews) -> tuple[list[int], list[int]]:
+    movie_ids, documents = _documents(reviews)
+    return movie_ids, model.predict(documents)
+
+def fit_clusters(
+    db,
+    num_clusters: int = settings.CLUSTER_COUNT,
+    mode: str = settings.CLUSTER_MODE,
+    batch_size: int = settings.CLUSTER_BATCH_SIZE,
+    only_if_missing: bool = False,
+) -> int:
+    """
+    Обучает кластеризацию по всем отзывам и заменяет кластеры фильмов в movie_clusters.
+
+    Args:
+        only_if_missing (bool): ничего не делать, если модель уже обучена (например, параллельным
+            запросом, пока этот ждал блокировку).
+
+    Returns:
+        int: количество фильмов с назначенным кластером.
+    """
+    from app.models import MovieCluster
+
+    db.execute(_fit_lock_stmt())
+    if only_if_missing and cluster_store.get() is not None:
+        db.rollback()
+        return 0
+    reviews = db.execute(_reviews_query()).all()
+    db.execute(delete(MovieCluster))
+    total = 0
+    if reviews:
+        _, movie_ids, labels = _fit_and_predict(reviews, num_clusters, mode, batch_size)
+        db.execute(insert(MovieCluster), [{"movie_id": m, "cluster_id": c} for m, c in zip(movie_ids, labels)])
+        total = len(movie_ids)
+    db.commit()
+    recommendation_cache.invalidate_all()
+    return total
+
+@timed("clustering")
+def cluster_movies_by_reviews(db) -> dict[int, list[str]]:
+    """Кластеры фильмов по тематике отзывов (из movie_clusters; новые фильмы назначаются по ближайшему центроиду)."""
+    model = cluster_store.get()
+    if model is None:
+        # Модель ещё не обучалась — обучаем один раз, дальше запросы только читают
+        fit_clusters(db, only_if_missing=True)
+    else:
+        reviews = db.execute(_unassigned_reviews_query()).all()
+        if reviews:
+            db.execute(_assign_stmt(*_predict_new(model, reviews)))
+            db.commit()
+    return _group_titles(db.execute(_assignments_query()).all())
+
+@timed("clustering")
+async def cluster_movies_by_reviews_async(db) -> dict[int, list[str]]:
+    """Асинхронный вариант: предобработка, обучение и transform выполняются в пуле моделей."""
+    from app.models import MovieCluster
+
+    model = cluster_store.get()
+    if model is None:
+        # Как fit_clusters(only_if_missing=True): остальные запросы ждут блокировку и видят готовую модель
+        await db.execute(_fit_lock_stmt())
+        if cluster_store.get() is not None:
+            await db.rollback()
+        else:
+            reviews = (await db.execute(_reviews_query())).all()
+            await db.execute(delete(MovieCluster))
+            if reviews:
+                _, movie_ids, labels = await run_in_model_executor(
+                    _fit_and_predict, reviews, settings.CLUSTER_COUNT, settings.CLUSTER_MODE, settings.CLUSTER_BATCH_SIZE
+                )
+                await db.execute(_assign_stmt(movie_ids, labels))
+            await db.commit()
+            await recommendation_cache.invalidate_all_async()
+    else:
+        reviews = (await db.execute(_unassigned_reviews_query())).all()
+        if reviews:
+            await db.execute(_assign_stmt(*await run_in_model_executor(_predict_new, model, reviews)))
+            await db.commit()
+    return _group_titles((await db.execute(_assignments_query())).all())
+
+def _group_titles(rows) -> dict[int, list[str]]:
     # Формируем результат: кластер -> список названий фильмов
     result = defaultdict(list)
-    for idx, cluster_id in enumerate(clusters):
-        movie_title = movie_map.get(movie_ids[idx])
-        if movie_title:
-            result[int(cluster_id)].append(movie_title)
+    for cluster_id, movie_title in rows:
+        result[int(cluster_id)].append(movie_title)
 
     return dict(result)
+
+
+def main() -> None:
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Обучение тематической кластеризации фильмов по отзывам")
+    parser.add_argument("--clusters", type=int, default=settings.CLUSTER_COUNT)
+    parser.add_argument("--mode", choices=MODES, default=settings.CLUSTER_MODE)
+    parser.add_argument("--batch-size", type=int, default=settings.CLUSTER_BATCH_SIZE, help="размер чанка для minibatch")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        total = fit_clusters(db, args.clusters, args.mode, args.batch_size)
+    print(f"movie_clusters refreshed: {total} movies")
+
+
+if __name__ == "__main__":
+    main()
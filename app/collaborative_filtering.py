@@ -1,13 +1,214 @@
-import pandas as pd
+"""
+collaborative_filtering.py - user-based коллаборативная фильтрация на разреженной матрице.
+
+Матрица пользователь×фильм хранится в scipy CSR по целочисленным ID и строится
+из таблицы reviews раз в CF_MODEL_TTL_SECONDS (CFModelCache). На запрос считается
+только строка сходства запрашивающего пользователя: разреженное произведение
+S @ s_u и нормы строк. Память — O(nnz), без плотного pivot и матрицы users×users.
+
+Item-based вариант (item_based_recommendations) читает предрасчитанные соседи фильмов
+из movie_neighbors (см. app/item_neighbors.py) и сливает их одним SQL-запросом.
+"""
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
-from .models import Review
+from .config import settings
+from .executor import run_in_model_executor
+from .metrics import timed
+from .models import Review, Movie, MovieNeighbor
+
+def _ratings_query():
+    # Только целочисленные колонки — названия фильмов нужны лишь для итоговых top-N
+    return select(Review.user_id, Review.movie_id, Review.rating)
+
+def _titles_query(movie_ids: list[int]):
+    return select(Movie.id, Movie.title).where(Movie.id.in_(movie_ids))
+
+
+class CFModel:
+    """
+    Разреженная модель пользователь×фильм.
+
+    ratings — средняя оценка пользователя фильму (как pivot_table с mean),
+    scaled — те же оценки после MinMax-масштабирования по столбцам (как MinMaxScaler
+    над плотной матрицей с нулями), norms — нормы строк scaled для косинусного сходства.
+    """
+
+    def __init__(self, user_ids: np.ndarray, movie_ids: np.ndarray, ratings: sparse.csr_matrix):
+        self.user_ids = user_ids      # отсортированные ID пользователей (строки)
+        self.movie_ids = movie_ids    # отсортированные ID фильмов (столбцы)
+        self.ratings = ratings
+        self.scaled = self._minmax_scale(ratings)
+        self.norms = np.sqrt(np.asarray(self.scaled.multiply(self.scaled).sum(axis=1)).ravel())
+        self.built_at = time.monotonic()
+
+    @classmethod
+    @timed("cf_matrix_build")
+    def from_rows(cls, rows, min_user_ratings: int = 2, min_movie_ratings: int = 2) -> Optional["CFModel"]:
+        """
+        Строит модель из троек (user_id, movie_id, rating).
+        Пользователи и фильмы с числом оценок ниже порогов отбрасываются
+        (оба порога считаются по исходным строкам, как и раньше).
+        """
+        data = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+        if len(data) == 0:
+            return None
+        users, movies, values = data[:, 0], data[:, 1], data[:, 2].astype(np.float64)
+
+        # Фильтруем малоактивных пользователей и малооцененные фильмы
+        user_codes, user_idx, user_counts = np.unique(users, return_inverse=True, return_counts=True)
+        movie_codes, movie_idx, movie_counts = np.unique(movies, return_inverse=True, return_counts=True)
+        keep = (user_counts[user_idx] >= min_user_ratings) & (movie_counts[movie_idx] >= min_movie_ratings)
+        if not keep.any():
+            return None
+        users, movies, values = users[keep], movies[keep], values[keep]
+
+        user_ids, rows_idx = np.unique(users, return_inverse=True)
+        movie_ids, cols_idx = np.unique(movies, return_inverse=True)
+
+        # Повторные оценки одного фильма одним пользователем усредняются
+        pair = rows_idx * len(movie_ids) + cols_idx
+        pairs, pair_idx = np.unique(pair, return_inverse=True)
+        mean = np.bincount(pair_idx, weights=values) / np.bincount(pair_idx)
+
+        ratings = sparse.csr_matrix(
+            (mean, (pairs // len(movie_ids), pairs % len(movie_ids))),
+            shape=(len(user_ids), len(movie_ids)),
+        )
+        return cls(user_ids, movie_ids, ratings)
+
+    @staticmethod
+    def _minmax_scale(ratings: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        MinMax-масштабирование столбцов без уплотнения матрицы.
+
+        Неявные нули участвуют в минимуме: если у столбца есть хотя бы один ноль,
+        минимум равен 0 и нули остаются нулями, т.е. разреженность сохраняется.
+        """
+        n_users = ratings.shape[0]
+        csc = ratings.tocsc()
+        nnz = np.diff(csc.indptr)
+        col_max = np.maximum.reduceat(csc.data, csc.indptr[:-1])
+        col_min = np.where(nnz < n_users, 0.0, np.minimum.reduceat(csc.data, csc.indptr[:-1]))
+        scale = col_max - col_min
+        scale[scale == 0] = 1.0
+
+        scaled = ratings.copy()
+        scaled.data = (scaled.data - col_min[scaled.indices]) / scale[scaled.indices]
+        return scaled
+
+    def recommend(self, user_id: int, top_n: int, similarity_threshold: float) -> list[int]:
+        """Возвращает ID фильмов top-N для пользователя (пустой список, если он не в модели)."""
+        row = np.searchsorted(self.user_ids, user_id)
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            return []
+
+        # Косинусное сходство только для строки пользователя: S @ s_u / (|S_i| * |s_u|)
+        user_norm = self.norms[row]
+        if user_norm == 0:
+            return []
+        dots = np.asarray((self.scaled @ self.scaled[row].T).todense()).ravel()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = np.where(self.norms > 0, dots / (self.norms * user_norm), 0.0)
+
+        # Берём только похожих пользователей с порогом
+        similar = np.flatnonzero(similarity >= similarity_threshold)
+        similar = similar[similar != row]
+        if len(similar) == 0:
+            return []
+
+        # Взвешиваем рейтинги похожих пользователей
+        weights = similarity[similar]
+        predicted = (self.ratings[similar].T @ weights) / weights.sum()
+
+        # Убираем уже оценённые фильмы
+        seen = self.ratings[row].indices
+        predicted[seen] = -np.inf
+        candidates = len(self.movie_ids) - len(seen)
+        top_n = min(top_n, candidates)
+        if top_n <= 0:
+            return []
+
+        # Частичная сортировка: argpartition по top-N, затем сортировка только их
+        top = np.argpartition(-predicted, top_n - 1)[:top_n]
+        top = top[np.argsort(-predicted[top], kind="stable")]
+        return self.movie_ids[top].tolist()
+
+
+class CFModelCache:
+    """
+    Кеш моделей с периодическим обновлением (TTL).
+
+    Пока модель перестраивается, остальные запросы обслуживаются предыдущей версией.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._models: dict[tuple[int, int], Optional[CFModel]] = {}
+        self._built_at: dict[tuple[int, int], float] = {}
+        self._refreshing: set[tuple[int, int]] = set()
+
+    def _claim_refresh(self, key) -> bool:
+        """True, если вызывающий должен перестроить модель сам (иначе можно отдать текущую)."""
+        with self._lock:
+            fresh = key in self._built_at and time.monotonic() - self._built_at[key] < self.ttl
+            if fresh:
+                return False
+            if key in self._built_at and key in self._refreshing:
+                return False  # модель уже перестраивается другим запросом — отдаём старую
+            self._refreshing.add(key)
+            return True
 
+    def _store(self, key, model: Optional[CFModel]) -> None:
+        with self._lock:
+            self._models[key] = model
+            self._built_at[key] = time.monotonic()
+            self._refreshing.discard(key)
+
+    def _release(self, key) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def get(self, db: Session, min_user_ratings: int, min_movie_ratings: int) -> Optional[CFModel]:
+        key = (min_user_ratings, min_movie_ratings)
+        if self._claim_refresh(key):
+            try:
+                rows = db.execute(_ratings_query()).all()
+                self._store(key, CFModel.from_rows(rows, *key))
+            finally:
+                self._release(key)
+        return self._models.get(key)
+
+    async def get_async(self, db: AsyncSession, min_user_ratings: int, min_movie_ratings: int) -> Optional[CFModel]:
+        key = (min_user_ratings, min_movie_ratings)
+        if self._claim_refresh(key):
+            try:
+                rows = (await db.execute(_ratings_query())).all()
+                self._store(key, await run_in_model_executor(CFModel.from_rows, rows, *key))
+            finally:
+                self._release(key)
+        return self._models.get(key)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._built_at.clear()
+
+
+cf_model_cache = CFModelCache(settings.CF_MODEL_TTL_SECONDS)
+
+
+@timed("recommend_collaborative")
 def collaborative_filtering_recommendations(db: Session, user_id: int, top_n: int = 5, similarity_threshold: float = 0.3, min_user_ratings=2, min_movie_ratings=2) -> list[str]:
     """
     Коллаборативная фильтрация с фильтрацией по активности и порогом схожести.
-    
+
     Args:
         db: Сессия базы данных.
         user_id: ID пользователя, для которого делаем рекомендации.
@@ -15,62 +216,73 @@ def collaborative_filtering_recommendations(db: Session, user_id: int, top_n: in
         similarity_threshold: Минимальный порог сходства для учёта пользователя.
         min_user_ratings: Минимальное число оценок у пользователя для участия.
         min_movie_ratings: Минимальное число оценок у фильма для участия.
-    
+
     Returns:
         Список названий фильмов для рекомендации.
     """
-        
-    reviews = db.query(Review).all()
-    if not reviews:
+    model = cf_model_cache.get(db, min_user_ratings, min_movie_ratings)
+    if model is None:
         return []
-
-    data = [{"user_id": r.user_id, "movie_title": r.movie.title, "rating": r.rating} for r in reviews]
-    df = pd.DataFrame(data)
-    
-    # Фильтруем малоактивных пользователей и малооцененные фильмы
-    user_counts = df['user_id'].value_counts()
-    movie_counts = df['movie_title'].value_counts()
-
-    df = df[df['user_id'].isin(user_counts[user_counts >= min_user_ratings].index)]
-    df = df[df['movie_title'].isin(movie_counts[movie_counts >= min_movie_ratings].index)]
-
-    user_movie_matrix = df.pivot_table(index='user_id', columns='movie_title', values='rating').fillna(0)
-
-    if user_id not in user_movie_matrix.index:
+    movie_ids = model.recommend(user_id, top_n, similarity_threshold)
+    if not movie_ids:
         return []
+    titles = dict(db.execute(_titles_query(movie_ids)).all())
+    return [titles[movie_id] for movie_id in movie_ids if movie_id in titles]
 
-    # Масштабируем рейтинги для корректного расчёта сходства
-    scaler = MinMaxScaler()
-    user_movie_scaled = pd.DataFrame(
-        scaler.fit_transform(user_movie_matrix),
-        index=user_movie_matrix.index,
-        columns=user_movie_matrix.columns
-    )
-
-    # Косинусное сходство между всеми пользователями
-    similarity_matrix = cosine_similarity(user_movie_scaled)
-    similarity_df = pd.DataFrame(similarity_matrix, index=user_movie_matrix.index, columns=user_movie_matrix.index)
+@timed("recommend_collaborative")
+async def collaborative_filtering_recommendations_async(db: AsyncSession, user_id: int, top_n: int = 5, similarity_threshold: float = 0.3, min_user_ratings=2, min_movie_ratings=2) -> list[str]:
+    """Асинхронный вариант: модель строится в пуле моделей, запрос к ней занимает миллисекунды."""
+    model = await cf_model_cache.get_async(db, min_user_ratings, min_movie_ratings)
+    if model is None:
+        return []
+    movie_ids = model.recommend(user_id, top_n, similarity_threshold)
+    if not movie_ids:
+        return []
+    titles = dict((await db.execute(_titles_query(movie_ids))).all())
+    return [titles[movie_id] for movie_id in movie_ids if movie_id in titles]
 
-    # Берём только похожих пользователей с порогом
-    similar_users = similarity_df.loc[user_id]
-    similar_users = similar_users[similar_users >= similarity_threshold]
-    similar_users = similar_users.drop(user_id, errors='ignore')
 
-    if similar_users.empty:
-        return []
+def _item_based_query(user_id: int, top_n: int, min_rating: int):
+    """
+    Слияние списков соседей фильмов, которые пользователь оценил не ниже min_rating.
 
-    # Фильмы, которые пользователь уже оценил
-    seen_movies = user_movie_matrix.loc[user_id][user_movie_matrix.loc[user_id] > 0].index
+    Оценка кандидата — сумма similarity × rating по всем понравившимся фильмам,
+    у которых он в соседях; уже оценённые пользователем фильмы исключаются.
+    """
+    liked = (
+        select(Review.movie_id, Review.rating)
+        .where(Review.user_id == user_id, Review.rating >= min_rating)
+        .subquery()
+    )
+    watched = exists().where(Review.user_id == user_id, Review.movie_id == MovieNeighbor.neighbor_id)
+    score = func.sum(MovieNeighbor.similarity * liked.c.rating)
+    return (
+        select(Movie.title)
+        .select_from(MovieNeighbor)
+        .join(liked, liked.c.movie_id == MovieNeighbor.movie_id)
+        .join(Movie, Movie.id == MovieNeighbor.neighbor_id)
+        .where(~watched)
+        .group_by(Movie.id, Movie.title)
+        .order_by(score.desc(), Movie.id)
+        .limit(top_n)
+    )
 
-    # Взвешиваем рейтинги похожих пользователей
-    weighted_ratings = user_movie_matrix.loc[similar_users.index].T.dot(similar_users)
-    sum_of_weights = similar_users.sum()
-    predicted_scores = weighted_ratings / sum_of_weights
+@timed("recommend_item_based")
+def item_based_recommendations(db: Session, user_id: int, top_n: int = 5, min_rating: int = settings.ITEM_CF_MIN_RATING) -> list[str]:
+    """
+    Item-based коллаборативная фильтрация по предрасчитанным соседям (python -m app.item_neighbors).
 
-    # Убираем уже оценённые фильмы
-    predicted_scores = predicted_scores.drop(index=seen_movies, errors='ignore')
+    Args:
+        db: Сессия базы данных.
+        user_id: ID пользователя, для которого делаем рекомендации.
+        top_n: Количество рекомендаций.
+        min_rating: С какой оценки фильм пользователя считается понравившимся.
 
-    # Сортируем и берём топ-N рекомендаций
-    top_recommendations = predicted_scores.sort_values(ascending=False).head(top_n).index.tolist()
+    Returns:
+        Список названий фильмов для рекомендации.
+    """
+    return list(db.scalars(_item_based_query(user_id, top_n, min_rating)).all())
 
-    return top_recommendations
+@timed("recommend_item_based")
+async def item_based_recommendations_async(db: AsyncSession, user_id: int, top_n: int = 5, min_rating: int = settings.ITEM_CF_MIN_RATING) -> list[str]:
+    return list((await db.scalars(_item_based_query(user_id, top_n, min_rating))).all())
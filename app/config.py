@@ -14,12 +14,126 @@ class Settings(BaseSettings):
     DB_PASS: str
     DB_NAME: str
 
+    # Настройки пула соединений (для каждого процесса и каждого движка — sync и async)
+    DB_POOL_SIZE: int = 5           # постоянных соединений в пуле
+    DB_MAX_OVERFLOW: int = 10       # сколько соединений можно открыть сверх DB_POOL_SIZE под нагрузкой
+    DB_POOL_TIMEOUT: float = 30     # сколько секунд ждать свободное соединение
+    DB_POOL_RECYCLE: int = 1800     # пересоздавать соединения старше N секунд (-1 — никогда)
+    DB_POOL_PRE_PING: bool = True   # проверять соединение перед выдачей из пула
+    # Режим для PgBouncer (transaction pooling): без собственного пула и без prepared statements
+    DB_PGBOUNCER_MODE: bool = False
+
+    # Путь (без расширения) для сохранения FAISS-индекса фильмов между перезапусками
+    MOVIE_INDEX_PATH: str = "data/movie_index"
+    # Как часто процесс API подтягивает в индекс фильмов эмбеддинги, записанные другими процессами
+    MOVIE_INDEX_SYNC_SECONDS: int = 30
+
+    # Тип FAISS-индекса фильмов: flat | ivf_flat | hnsw | ivf_pq (см. semantic_embeddings.INDEX_KINDS)
+    FAISS_INDEX_KIND: str = "flat"
+    FAISS_NLIST: int = 100              # число кластеров IVF
+    FAISS_NPROBE: int = 10              # сколько кластеров IVF просматривать при поиске
+    FAISS_HNSW_M: int = 32              # число связей вершины графа HNSW
+    FAISS_EF_SEARCH: int = 64           # ширина поиска HNSW
+    FAISS_PQ_M: int = 16                # число подвекторов PQ (должно делить размерность)
+    FAISS_TRAIN_SAMPLE: int = 50_000    # размер подвыборки для обучения IVF/PQ
+    FAISS_REBUILD_INTERVAL: int = 60    # секунды между пересборками HNSW (он не умеет remove_ids)
+
+    # Микро-батчинг классификации тональности: одновременные запросы объединяются в один проход модели
+    SENTIMENT_BATCHING: bool = True
+    SENTIMENT_BATCH_MAX_SIZE: int = 32      # максимальный размер пачки
+    SENTIMENT_BATCH_MAX_WAIT_MS: float = 5  # сколько ждать попутные запросы после первого
+    # То же для эмбеддингов в инференс-сайдкаре: MiniLM легче классификатора, пачка может быть больше
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5
+
+    # Размер выделенного пула потоков для CPU-тяжёлых вызовов моделей из async-эндпоинтов
+    MODEL_EXECUTOR_WORKERS: int = 4
+
+    # Ленивая загрузка моделей (app/model_registry.py)
+    ENABLE_ML: bool = True              # false — API-only воркер без ML-стека
+    MODEL_WARMUP: str = ""              # модели для загрузки при старте через запятую ("all" — все)
+    MODEL_ALLOW_DOWNLOADS: bool = True  # false — только локальный кеш HuggingFace/nltk, без сети
+
+    # Где выполняется инференс: local — в каждом воркере, sidecar — в общем процессе app.inference_server
+    INFERENCE_BACKEND: str = "local"
+    INFERENCE_SOCKET_PATH: str = "/tmp/movies_reviews_inference.sock"
+    INFERENCE_TIMEOUT: float = 30
+    # Веса трансформеров из mmap model.safetensors: страницы общие для всех процессов на машине
+    MODEL_WEIGHTS_MMAP: bool = False
+    # Рантайм трансформеров: torch — PyTorch eager, onnx — ONNX Runtime (python -m app.onnx_backend export)
+    MODEL_RUNTIME: str = "torch"
+    ONNX_MODEL_DIR: str = "data/onnx"
+    ONNX_QUANTIZED: bool = False      # int8-версия моделей (export --quantize)
+    ONNX_INTRA_OP_THREADS: int = 0    # потоки внутри одного прогона модели; 0 — по числу ядер
+
+    # Обогащение отзыва (тональность, эмбеддинг, агрегаты): sync — в запросе записи,
+    # queue — POST /reviews только вставляет отзыв и задачу, считает python -m app.worker
+    ENRICHMENT_MODE: str = "sync"
+    ENRICHMENT_BATCH_SIZE: int = 64             # сколько задач воркер берёт за один проход моделей
+    ENRICHMENT_POLL_INTERVAL: float = 1.0       # пауза воркера, когда очередь пуста
+    ENRICHMENT_MAX_ATTEMPTS: int = 5            # после стольких ошибок отзыв помечается failed
+    ENRICHMENT_RETRY_BASE_SECONDS: float = 10   # задержка повтора: base * 2^(попытка - 1), не больше max
+    ENRICHMENT_RETRY_MAX_SECONDS: float = 3600
+
+    # GET /reviews: размер страницы по умолчанию и максимальный (keyset-пагинация по курсору)
+    REVIEWS_PAGE_SIZE: int = 50
+    REVIEWS_PAGE_MAX_SIZE: int = 500
+
+    # Как часто (в секундах) перестраивать разреженную матрицу оценок для коллаборативной фильтрации
+    CF_MODEL_TTL_SECONDS: int = 300
+
+    # Item-based рекомендации: сколько соседей хранить на фильм и с какой оценки фильм считается понравившимся
+    ITEM_CF_NEIGHBORS: int = 50
+    ITEM_CF_MIN_RATING: int = 7
+
+    # ALS-факторизация (python -m app.als_recommender train): режим explicit|implicit и гиперпараметры
+    ALS_MODEL_PATH: str = "data/als_model"
+    ALS_MODE: str = "explicit"
+    ALS_FACTORS: int = 32
+    ALS_REGULARIZATION: float = 0.1
+    ALS_ITERATIONS: int = 15
+    ALS_ALPHA: float = 10.0   # implicit: уверенность c = 1 + alpha * rating
+
+    # Тематическая кластеризация фильмов (python -m app.clustering): kmeans или minibatch (partial_fit по чанкам)
+    CLUSTER_MODEL_PATH: str = "data/movie_clusters.joblib"
+    CLUSTER_COUNT: int = 5
+    CLUSTER_MODE: str = "kmeans"
+    CLUSTER_BATCH_SIZE: int = 1024
+
+    # Кеш результатов моделей по содержимому текста (app/inference_cache.py): LRU в памяти
+    # (записей на модель) и общий SQLite-файл; пустой путь — только память
+    INFERENCE_CACHE_ENABLED: bool = True
+    INFERENCE_CACHE_SIZE: int = 20_000
+    INFERENCE_CACHE_PATH: str = "data/inference_cache.sqlite"
+
+    # Общий для всех процессов кеш лемм pymorphy2 (SQLite); пустая строка — только кеш в памяти
+    LEMMA_CACHE_PATH: str = "data/lemmas.sqlite"
+
+    # Авторизация: кеш пользователей по ID из токена (0 — без кеша) и имя/email прямо в JWT
+    AUTH_PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    AUTH_PRINCIPAL_CACHE_SIZE: int = 10_000
+    AUTH_EMBED_USER_CLAIMS: bool = False
+
+    # Кеш рекомендаций (app/cache.py): memory — в процессе воркера, redis — общий для всех воркеров
+    CACHE_ENABLED: bool = True
+    CACHE_BACKEND: str = "memory"
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_TTL_SECONDS: int = 300
+    CACHE_MAX_ENTRIES: int = 10_000
+    # false — новый отзыв сбрасывает кеш только автора, у остальных результаты обновятся по TTL
+    CACHE_GLOBAL_INVALIDATION: bool = True
+
 
     # Свойство, которое возвращает URL подключения для SQLAlchemy с драйвером psycopg2
     @property
     def DATABASE_URL_psycopg2(self):
         return f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # Свойство, которое возвращает URL подключения для асинхронного движка с драйвером asyncpg
+    @property
+    def DATABASE_URL_asyncpg(self):
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
     # Значения будут загружаться из файла `.env`
     model_config = SettingsConfigDict(env_file=".env")
 
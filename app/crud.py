@@ -1,13 +1,25 @@
 """
 crud.py - функции для создания и получения данных из базы.
 """
-from typing import Optional
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional, Sequence
+from sqlalchemy import func, literal_column, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from . import models
+from .config import settings
+from .pagination import decode_cursor, encode_cursor
 
-from .sentiment_types import SentimentEnum
-from .sentiment import classify_sentiment
+from .sentiment_types import EnrichmentStatus, SentimentEnum
+from .sentiment import classify_sentiment, classify_sentiment_async
+from .semantic_embeddings import get_embeddings
+from .embedding_store import save_review_embeddings, save_review_embeddings_async
+from .executor import run_in_model_executor
+from .movie_index import movie_index
+from .movie_stats import record_reviews, record_reviews_async
+from .text_preprocessing import preprocess_text
+from .cache import recommendation_cache
 
 
 
@@ -35,40 +47,305 @@ def get_or_create_movie(db: Session, title: str) -> models.Movie:
     return movie
 
 
-def create_review(db: Session, movie_id: int, rating: int, review_text: str, sentiment: str, user_id: int) -> models.Review:
-    sentiment = classify_sentiment(review_text)
-    review = models.Review(movie_id=movie_id, rating=rating, review_text=review_text, sentiment=sentiment, user_id=user_id)
+async def get_or_create_movie_async(db: AsyncSession, title: str) -> models.Movie:
+    """Асинхронный вариант get_or_create_movie."""
+    movie = (await db.execute(select(models.Movie).where(models.Movie.title == title))).scalar_one_or_none()
+
+    if movie is None:
+        movie = models.Movie(title=title)
+        db.add(movie)
+        await db.commit()
+        await db.refresh(movie)
+
+    return movie
+
+
+def _pending_review(movie_id: int, rating: int, review_text: str, user_id: int, sentiment: Optional[SentimentEnum]) -> models.Review:
+    """Отзыв без обогащения (ENRICHMENT_MODE=queue): тональность (если не передана), эмбеддинг и агрегаты посчитает app.worker."""
+    return models.Review(
+        movie_id=movie_id, rating=rating, review_text=review_text, sentiment=sentiment, user_id=user_id,
+        enrichment_status=EnrichmentStatus.pending,
+    )
+
+
+def create_review(db: Session, movie_id: int, rating: int, review_text: str, user_id: int, sentiment: Optional[SentimentEnum] = None) -> models.Review:
+    if settings.ENRICHMENT_MODE == "queue":
+        # Отзыв и задача обогащения пишутся одной транзакцией, модели в запросе не вызываются
+        review = _pending_review(movie_id, rating, review_text, user_id, sentiment)
+        db.add(review)
+        db.flush()
+        db.add(models.EnrichmentJob(review_id=review.id))
+        db.commit()
+        db.refresh(review)
+        recommendation_cache.reviews_written(user_id)
+        return review
+
+    # Тональность считается здесь один раз, если вызывающий код не передал её сам
+    if sentiment is None:
+        sentiment = classify_sentiment(review_text)
+    # Лемматизированный текст для кластеризации считается один раз при записи
+    processed_text = preprocess_text(review_text)
+    review = models.Review(movie_id=movie_id, rating=rating, review_text=review_text, processed_text=processed_text, sentiment=sentiment, user_id=user_id)
     db.add(review)
+    db.flush()  # получаем review.id до коммита
+
+    # Эмбеддинг считается один раз при записи
+    embeddings = get_embeddings([review_text])
+
+    # Агрегаты фильма (movie_stats) обновляются в той же транзакции
+    record_reviews(db, [(movie_id, sentiment, rating)])
+    # Эмбеддинг — последним перед коммитом: его created_at должен быть близок к моменту коммита (MovieIndex.sync)
+    save_review_embeddings(db, [review.id], embeddings)
     db.commit()
     db.refresh(review)
+
+    # Инкрементально обновляем вектор фильма в индексе — только после успешного коммита
+    movie_index.add_review(movie_id, embeddings[0])
+    # Закешированные рекомендации автора (и глобальные — см. CACHE_GLOBAL_INVALIDATION) устарели
+    recommendation_cache.reviews_written(user_id)
+    return review
+
+
+async def create_review_async(db: AsyncSession, movie_id: int, rating: int, review_text: str, user_id: int, sentiment: Optional[SentimentEnum] = None) -> models.Review:
+    """Асинхронный вариант create_review: инференс моделей выполняется вне event loop."""
+    if settings.ENRICHMENT_MODE == "queue":
+        review = _pending_review(movie_id, rating, review_text, user_id, sentiment)
+        db.add(review)
+        await db.flush()
+        db.add(models.EnrichmentJob(review_id=review.id))
+        await db.commit()
+        await db.refresh(review)
+        await recommendation_cache.reviews_written_async(user_id)
+        return review
+
+    if sentiment is None:
+        sentiment = await classify_sentiment_async(review_text)
+    embeddings = await run_in_model_executor(get_embeddings, [review_text])
+    processed_text = await run_in_model_executor(preprocess_text, review_text)
+
+    review = models.Review(movie_id=movie_id, rating=rating, review_text=review_text, processed_text=processed_text, sentiment=sentiment, user_id=user_id)
+    db.add(review)
+    await db.flush()
+
+    await record_reviews_async(db, [(movie_id, sentiment, rating)])
+    await save_review_embeddings_async(db, [review.id], embeddings)
+    await db.commit()
+    await db.refresh(review)
+
+    # Под блокировкой индекса (её держит и FAISS-поиск), а для HNSW/IVF возможна пересборка — не в event loop
+    await run_in_model_executor(movie_index.add_review, movie_id, embeddings[0])
+    # Закешированные рекомендации автора (и глобальные — см. CACHE_GLOBAL_INVALIDATION) устарели
+    await recommendation_cache.reviews_written_async(user_id)
     return review
 
 
 
-def get_reviews(db: Session, movie_filter: Optional[str] = None, sentiment_filter: Optional[str] = None) -> list[models.Review]:
+# Колонки, которые можно запросить в GET /reviews?fields=...
+REVIEW_COLUMNS = {
+    "id": models.Review.id,
+    "movie_title": models.Movie.title,
+    "rating": models.Review.rating,
+    "review_text": models.Review.review_text,
+    "sentiment": models.Review.sentiment,
+    "enrichment_status": models.Review.enrichment_status,
+    "created_at": models.Review.created_at,
+}
+
+
+def _search_query(search: str):
+    """tsquery из строки поиска: слова, "фразы в кавычках", or, -исключение (синтаксис websearch_to_tsquery)."""
+    return func.websearch_to_tsquery(literal_column(f"'{models.SEARCH_CONFIG}'"), search)
+
+
+def _filtered_reviews_query(
+    fields: Sequence[str],
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    search: Optional[str] = None,
+):
+    """Выбор колонок fields (ключи REVIEW_COLUMNS) с фильтрами; None — некорректный фильтр по тональности."""
+    names = dict.fromkeys(fields)
+    query = select(*(REVIEW_COLUMNS[name].label(name) for name in names)).select_from(models.Review)
+
+    # Фильм нужен только ради названия или фильтра по нему
+    if "movie_title" in names or movie_filter:
+        query = query.join(models.Movie, models.Review.movie_id == models.Movie.id)
+
+    # Если указана фильтрация по названию фильма (регистр — не важен; индекс ix_movies_title_trgm)
+    if movie_filter:
+        query = query.where(models.Movie.title.ilike(f"%{movie_filter}%"))
+
+    if sentiment_filter:
+        try:
+            sentiment_enum = SentimentEnum(sentiment_filter.lower())
+            query = query.where(models.Review.sentiment == sentiment_enum)
+        except ValueError:
+            return None # некорректный фильтр по тональности
+
+    # Полнотекстовый поиск по тексту отзыва (GIN-индекс ix_reviews_search_vector)
+    if search:
+        query = query.where(models.Review.search_vector.op("@@")(_search_query(search)))
+
+    return query
+
+
+def _reviews_query(
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    after: Optional[tuple] = None,
+    limit: int = settings.REVIEWS_PAGE_SIZE,
+    search: Optional[str] = None,
+):
+    """
+    Строит запрос страницы отзывов (общий для синхронной и асинхронной сессии).
+
+    Отзывы идут от новых к старым по (created_at, id) — по индексу ix_reviews_created_at_id,
+    а при поиске search — по релевантности ts_rank, затем по id.
+    Выбираются только нужные колонки, без ORM-объектов и ленивой загрузки фильма;
+    id и created_at (и rank при поиске) выбираются всегда — из них строится курсор следующей страницы.
+    Запрашивается limit + 1 строка: лишняя показывает, что страница не последняя.
+
+    Returns:
+        Select | None: запрос или None, если фильтр по тональности некорректен.
+    """
+    query = _filtered_reviews_query(["id", "created_at", *(fields or REVIEW_COLUMNS)], movie_filter, sentiment_filter, search)
+    if query is None:
+        return None
+
+    if search:
+        key = (func.ts_rank(models.Review.search_vector, _search_query(search)), models.Review.id)
+        query = query.add_columns(key[0].label("rank"))
+    else:
+        key = (models.Review.created_at, models.Review.id)
+
+    # Keyset: продолжаем строго после последней строки предыдущей страницы
+    if after is not None:
+        query = query.where(tuple_(*key) < after)
+
+    limit = min(limit, settings.REVIEWS_PAGE_MAX_SIZE)
+    return query.order_by(*(column.desc() for column in key)).limit(limit + 1)
+
+
+def _after(cursor: Optional[str], search: Optional[str]) -> Optional[tuple]:
+    if not cursor:
+        return None
+    if search:
+        return decode_cursor(cursor, float, int)
+    return decode_cursor(cursor, datetime.fromisoformat, int)
+
+
+def _page(rows: list, limit: int, search: Optional[str]) -> tuple[list, Optional[str]]:
+    limit = min(limit, settings.REVIEWS_PAGE_MAX_SIZE)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.rank if search else last.created_at, last.id)
+
+
+def get_reviews(
+    db: Session,
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    cursor: Optional[str] = None,
+    limit: int = settings.REVIEWS_PAGE_SIZE,
+    search: Optional[str] = None,
+) -> tuple[list, Optional[str]]:
     """
-    Получает список всех отзывов, с возможностью фильтрации по названию фильма.
+    Получает страницу отзывов (от новых к старым) с фильтрацией по фильму, тональности и тексту.
 
     Args:
         db (Session): текущая сессия БД.
         movie_filter (str, optional): строка для фильтрации названия фильма.
+        sentiment_filter (str, optional): тональность (positive / neutral / negative).
+        fields (Sequence[str], optional): какие колонки выбрать (ключи REVIEW_COLUMNS), по умолчанию все.
+        cursor (str, optional): курсор из предыдущей страницы; некорректный — ValueError.
+        limit (int): размер страницы, не больше REVIEWS_PAGE_MAX_SIZE.
+        search (str, optional): полнотекстовый поиск по тексту отзыва; результаты — по релевантности.
 
     Returns:
-        list[Review]: список отзывов, удовлетворяющих условиям.
+        tuple[list[Row], str | None]: строки страницы и курсор следующей (None — страница последняя).
     """
-    # Начальный запрос: объединение отзывов и фильмов
-    query = db.query(models.Review).join(models.Movie)
+    query = _reviews_query(movie_filter, sentiment_filter, fields, _after(cursor, search), limit, search)
+    if query is None:
+        return [], None
+    return _page(list(db.execute(query).all()), limit, search)
 
-    # Если указана фильтрация по названию фильма (регистр — не важен)
-    if movie_filter:
-        query = query.filter(models.Movie.title.ilike(f"%{movie_filter}%"))
 
-    if sentiment_filter:
-        try:
-            sentiment_enum = SentimentEnum(sentiment_filter.lower())
-            query = query.filter(models.Review.sentiment == sentiment_enum)
-        except ValueError:
-            return [] # некорректный фильтр по тональности
+async def get_reviews_async(
+    db: AsyncSession,
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    cursor: Optional[str] = None,
+    limit: int = settings.REVIEWS_PAGE_SIZE,
+    search: Optional[str] = None,
+) -> tuple[list, Optional[str]]:
+    """Асинхронный вариант get_reviews."""
+    query = _reviews_query(movie_filter, sentiment_filter, fields, _after(cursor, search), limit, search)
+    if query is None:
+        return [], None
+    return _page(list((await db.execute(query)).all()), limit, search)
+
+
+def _export_query(
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    since: Optional[datetime] = None,
+    search: Optional[str] = None,
+):
+    """Все колонки отзывов с фильтрами get_reviews и since, от старых к новым (удобно для инкрементальной выгрузки)."""
+    query = _filtered_reviews_query(list(REVIEW_COLUMNS), movie_filter, sentiment_filter, search)
+    if query is None:
+        return None
+    if since is not None:
+        query = query.where(models.Review.created_at >= since)
+    return query.order_by(models.Review.created_at, models.Review.id)
+
+
+def iter_reviews_export(
+    db: Session,
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    since: Optional[datetime] = None,
+    batch_size: int = 1000,
+    search: Optional[str] = None,
+) -> Iterator:
+    """
+    Построчно отдаёт отзывы для выгрузки, не загружая таблицу в память.
+
+    yield_per включает серверный курсор (stream_results): строки приходят из БД
+    пачками по batch_size, поэтому память не зависит от размера выгрузки.
+
+    Args:
+        db (Session): текущая сессия БД.
+        movie_filter, sentiment_filter, search: фильтры, как в get_reviews.
+        since (datetime, optional): только отзывы, созданные не раньше этого момента.
+        batch_size (int): размер пачки серверного курсора.
+
+    Yields:
+        Row: строки с колонками REVIEW_COLUMNS.
+    """
+    query = _export_query(movie_filter, sentiment_filter, since, search)
+    if query is None:
+        return
+    yield from db.execute(query.execution_options(yield_per=batch_size))
 
 
-    return query.all()
+async def iter_reviews_export_async(
+    db: AsyncSession,
+    movie_filter: Optional[str] = None,
+    sentiment_filter: Optional[str] = None,
+    since: Optional[datetime] = None,
+    batch_size: int = 1000,
+    search: Optional[str] = None,
+) -> AsyncIterator:
+    """Асинхронный вариант iter_reviews_export (AsyncSession.stream — тоже серверный курсор)."""
+    query = _export_query(movie_filter, sentiment_filter, since, search)
+    if query is None:
+        return
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for row in result:
+        yield row
@@ -1,21 +1,77 @@
-#from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from uuid import uuid4
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from sqlalchemy import URL, create_engine, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from .config import settings
+from .metrics import track_queries
+from .pool_metrics import instrumented_pool, track_checkouts
+
+
+def _pool_options(name: str, is_async: bool) -> dict:
+    """
+    Параметры пула для create_engine / create_async_engine из настроек.
+
+    В режиме PgBouncer пулом управляет PgBouncer: свой пул не держим (NullPool),
+    а asyncpg не должен кешировать prepared statements — в transaction pooling
+    следующий запрос может попасть на другое серверное соединение.
+    """
+    if settings.DB_PGBOUNCER_MODE:
+        options = {"poolclass": instrumented_pool(NullPool, name)}
+        if is_async:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+        return options
+
+    return {
+        "poolclass": instrumented_pool(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 
 # Создание синхронного движка подключения к базе данных PostgreSQL
 # Строка подключения берётся из .env через config.py (через settings.DATABASE_URL_psycopg2)
+# Используется CLI-командами, миграциями и фоновыми задачами
 engine = create_engine(
     url=settings.DATABASE_URL_psycopg2,
-    echo=False
+    echo=False,
+    **_pool_options("sync", is_async=False)
 )
 
+# Асинхронный движок (asyncpg) — используется эндпоинтами FastAPI
+async_engine = create_async_engine(
+    url=settings.DATABASE_URL_asyncpg,
+    echo=False,
+    **_pool_options("async", is_async=True)
+)
+
+# Счётчики выданных соединений для метрик пула
+track_checkouts(engine, "sync")
+track_checkouts(async_engine.sync_engine, "async")
+
+# Число и длительность SQL-запросов для /metrics
+track_queries(engine, "sync")
+track_queries(async_engine.sync_engine, "async")
+
 # Создание фабрики сессий
 # autocommit=False — изменения сохраняются только после явного вызова commit()
 # autoflush=False — SQLAlchemy не будет автоматически сбрасывать изменения в БД перед каждым запросом
 # bind=engine — указываем, какой движок использовать
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Фабрика асинхронных сессий
+# expire_on_commit=False — после commit() атрибуты объектов остаются доступны без ленивой подгрузки,
+# которая в асинхронном режиме невозможна
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 
 # Базовый класс для всех моделей (через declarative mapping API)
 # От него наследуются все таблицы (модели)
@@ -32,3 +88,11 @@ def get_db():
     """
     with SessionLocal() as db: # Контекстный менеджер автоматически закрывает сессию после выхода из блока
         yield db # Генератор — возвращает активную сессию, используется в эндпоинтах
+
+
+async def get_async_db():
+    """
+    Асинхронный аналог get_db: отдаёт AsyncSession для async-эндпоинтов.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
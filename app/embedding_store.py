@@ -0,0 +1,220 @@
+"""
+embedding_store.py - хранение предвычисленных эмбеддингов отзывов.
+
+Эмбеддинг считается один раз при записи отзыва и сохраняется в таблицу
+review_embeddings вместе с версией модели. Рекомендатель только читает
+готовые векторы пачкой.
+
+Бэкфилл для существующих отзывов (и для отзывов с устаревшей версией модели):
+
+    python -m app.embedding_store --batch-size 256
+"""
+import argparse
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Review, ReviewEmbedding
+from .semantic_embeddings import (
+    EMBEDDING_VERSION,
+    embedding_to_bytes,
+    embeddings_from_bytes,
+    get_embeddings,
+)
+
+
+def _current_embedding_join():
+    """Условие соединения отзыва с эмбеддингом актуальной версии."""
+    return and_(
+        ReviewEmbedding.review_id == Review.id,
+        ReviewEmbedding.model_version == EMBEDDING_VERSION,
+    )
+
+
+def review_embeddings_upsert(review_ids: list[int], embeddings: np.ndarray):
+    """
+    Строит multi-row upsert эмбеддингов (общий для синхронной и асинхронной сессии).
+
+    created_at — момент выполнения оператора (clock_timestamp), а не начала транзакции, и обновляется
+    при перезаписи: по нему MovieIndex.sync находит и новые, и пересчитанные бэкфиллом векторы.
+    """
+    rows = [
+        {
+            "review_id": review_id,
+            "model_version": EMBEDDING_VERSION,
+            "vector": embedding_to_bytes(emb),
+            "created_at": func.clock_timestamp(),
+        }
+        for review_id, emb in zip(review_ids, embeddings)
+    ]
+    stmt = insert(ReviewEmbedding).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[ReviewEmbedding.review_id],
+        set_={
+            "model_version": stmt.excluded.model_version,
+            "vector": stmt.excluded.vector,
+            "created_at": stmt.excluded.created_at,
+        },
+    )
+
+
+def save_review_embeddings(db: Session, review_ids: list[int], embeddings: np.ndarray) -> None:
+    """
+    Сохраняет (или перезаписывает) эмбеддинги отзывов одним multi-row upsert.
+    Коммит остаётся на стороне вызывающего кода.
+
+    Args:
+        db (Session): текущая сессия БД.
+        review_ids (list[int]): ID отзывов.
+        embeddings (np.ndarray): матрица (n, dim) нормализованных векторов.
+    """
+    if review_ids:
+        db.execute(review_embeddings_upsert(review_ids, embeddings))
+
+
+async def save_review_embeddings_async(db: AsyncSession, review_ids: list[int], embeddings: np.ndarray) -> None:
+    """Асинхронный вариант save_review_embeddings."""
+    if review_ids:
+        await db.execute(review_embeddings_upsert(review_ids, embeddings))
+
+
+def load_movie_vector_sums(db: Session, movie_ids: Optional[list[int]] = None) -> tuple[list[int], np.ndarray, np.ndarray]:
+    """
+    Загружает все актуальные эмбеддинги одним запросом и суммирует их по фильмам.
+
+    Args:
+        movie_ids (list[int], optional): только эти фильмы (по умолчанию — все).
+
+    Returns:
+        tuple[list[int], np.ndarray, np.ndarray]: ID фильмов, матрица сумм векторов
+        и количество отзывов с эмбеддингом у каждого фильма.
+    """
+    query = select(Review.movie_id, ReviewEmbedding.vector).join(ReviewEmbedding, _current_embedding_join())
+    if movie_ids is not None:
+        query = query.where(Review.movie_id.in_(movie_ids))
+    rows = db.execute(query).all()
+    if not rows:
+        return [], np.empty((0, 0), dtype="float32"), np.empty(0, dtype="int64")
+
+    vectors = embeddings_from_bytes([r.vector for r in rows])
+    movie_ids, inverse, counts = np.unique(
+        np.array([r.movie_id for r in rows]), return_inverse=True, return_counts=True
+    )
+
+    sums = np.zeros((len(movie_ids), vectors.shape[1]), dtype="float32")
+    np.add.at(sums, inverse, vectors)
+
+    return movie_ids.tolist(), sums, counts
+
+
+def load_movie_vectors(db: Session) -> tuple[list[int], np.ndarray]:
+    """
+    Загружает все актуальные эмбеддинги одним запросом и усредняет их по фильмам.
+
+    Returns:
+        tuple[list[int], np.ndarray]: ID фильмов и матрица нормализованных средних векторов.
+    """
+    movie_ids, sums, _ = load_movie_vector_sums(db)
+    if not movie_ids:
+        return [], sums
+
+    # После нормализации сумма даёт то же направление, что и среднее
+    return movie_ids, sums / np.linalg.norm(sums, axis=1, keepdims=True)
+
+
+def _user_vectors_query(user_id: int, sentiment=None):
+    query = (
+        select(Review.movie_id, ReviewEmbedding.vector)
+        .outerjoin(ReviewEmbedding, _current_embedding_join())
+        .where(Review.user_id == user_id)
+    )
+    if sentiment is not None:
+        query = query.where(Review.sentiment == sentiment)
+    return query
+
+
+def _user_vectors_from_rows(rows) -> tuple[set[int], np.ndarray]:
+    movie_ids = {r.movie_id for r in rows}
+    vectors = embeddings_from_bytes([r.vector for r in rows if r.vector is not None])
+    return movie_ids, vectors
+
+
+def load_user_vectors(db: Session, user_id: int, sentiment=None) -> tuple[set[int], np.ndarray]:
+    """
+    Загружает эмбеддинги отзывов пользователя (опционально — только с заданной тональностью).
+
+    Returns:
+        tuple[set[int], np.ndarray]: ID фильмов из этих отзывов (включая отзывы ещё без эмбеддинга)
+        и матрица их векторов.
+    """
+    return _user_vectors_from_rows(db.execute(_user_vectors_query(user_id, sentiment)).all())
+
+
+async def load_user_vectors_async(db: AsyncSession, user_id: int, sentiment=None) -> tuple[set[int], np.ndarray]:
+    """Асинхронный вариант load_user_vectors."""
+    return _user_vectors_from_rows((await db.execute(_user_vectors_query(user_id, sentiment))).all())
+
+
+def backfill_embeddings(db: Session, batch_size: int = 256, limit: Optional[int] = None) -> int:
+    """
+    Считает эмбеддинги для отзывов, у которых их нет или версия модели устарела.
+
+    Args:
+        db (Session): текущая сессия БД.
+        batch_size (int): размер пачки для модели и для одного коммита.
+        limit (int, optional): максимальное число обрабатываемых отзывов.
+
+    Returns:
+        int: количество пересчитанных отзывов.
+    """
+    processed = 0
+    last_id = 0
+    while limit is None or processed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - processed)
+        rows = db.execute(
+            select(Review.id, Review.review_text)
+            .outerjoin(ReviewEmbedding, ReviewEmbedding.review_id == Review.id)
+            .where(
+                Review.id > last_id,
+                or_(ReviewEmbedding.review_id.is_(None), ReviewEmbedding.model_version != EMBEDDING_VERSION),
+            )
+            .order_by(Review.id)
+            .limit(size)
+        ).all()
+        if not rows:
+            break
+
+        embeddings = get_embeddings([r.review_text for r in rows])
+        save_review_embeddings(db, [r.id for r in rows], embeddings)
+        db.commit()
+
+        processed += len(rows)
+        last_id = rows[-1].id
+        print(f"embedded {processed} reviews (last id {last_id})")
+
+    return processed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бэкфилл эмбеддингов отзывов")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        total = backfill_embeddings(db, batch_size=args.batch_size, limit=args.limit)
+        if total:
+            # Сохранённый индекс фильмов устарел — пересобираем его, чтобы API подхватил новые векторы при старте
+            from .movie_index import movie_index
+            movie_index.build(db)
+            movie_index.save()
+    print(f"done: {total} reviews embedded with {EMBEDDING_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
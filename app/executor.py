@@ -0,0 +1,26 @@
+"""
+executor.py - выделенный пул потоков для CPU-тяжёлых вызовов моделей.
+
+Async-эндпоинты не должны блокировать event loop инференсом трансформеров,
+FAISS-поиском, TF-IDF/KMeans и т.п. — такие вызовы уходят сюда. Пул отделён
+от стандартного threadpool Starlette, чтобы модели не вытесняли остальные задачи.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+
+model_executor = ThreadPoolExecutor(max_workers=settings.MODEL_EXECUTOR_WORKERS, thread_name_prefix="model")
+
+
+async def run_in_model_executor(func: Callable[..., T], *args, **kwargs) -> T:
+    """Выполняет func(*args, **kwargs) в пуле моделей и дожидается результата, не блокируя event loop."""
+    loop = asyncio.get_running_loop()
+    # Контекст копируется, как в threadpool Starlette: SQL-запросы из пула попадают в метрики своего HTTP-запроса
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(model_executor, functools.partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,109 @@
+"""
+export.py - потоковая выгрузка отзывов в NDJSON или CSV.
+
+Строки читаются серверным курсором (crud.iter_reviews_export) и сразу пишутся
+в выход небольшими кусками, поэтому память не зависит от размера выгрузки.
+Колонки совпадают с форматом импорта (app/ingest.py) плюс id, sentiment, enrichment_status и created_at.
+
+    python -m app.export --format csv --output reviews.csv
+    python -m app.export --sentiment negative --since 2026-10-01T00:00:00 > negative.ndjson
+
+По HTTP то же самое отдаёт GET /reviews/export.
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+from .crud import REVIEW_COLUMNS, iter_reviews_export
+from .database import SessionLocal
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+FIELDS = list(REVIEW_COLUMNS)
+
+# Примерный размер одного куска ответа: меньше — больше системных вызовов, больше — дольше до первого байта
+CHUNK_SIZE = 64 * 1024
+
+
+def _record(row) -> dict:
+    record = dict(row._mapping)
+    for name in ("sentiment", "enrichment_status"):
+        # sentiment = NULL у отзывов, ещё ждущих обогащения (ENRICHMENT_MODE=queue)
+        if record[name] is not None:
+            record[name] = record[name].value
+    record["created_at"] = record["created_at"].isoformat()
+    return record
+
+
+class ChunkWriter:
+    """Копит отформатированные строки и отдаёт их кусками примерно по CHUNK_SIZE символов."""
+
+    def __init__(self, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt!r}, expected one of {FORMATS}")
+        self.buffer = io.StringIO()
+        self._csv = csv.DictWriter(self.buffer, fieldnames=FIELDS) if fmt == "csv" else None
+        if self._csv:
+            self._csv.writeheader()
+
+    def write(self, row) -> Optional[str]:
+        if self._csv:
+            self._csv.writerow(_record(row))
+        else:
+            self.buffer.write(json.dumps(_record(row), ensure_ascii=False) + "\n")
+        return self.flush() if self.buffer.tell() >= CHUNK_SIZE else None
+
+    def flush(self) -> str:
+        chunk = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+
+def export_chunks(rows: Iterable, fmt: str) -> Iterator[str]:
+    writer = ChunkWriter(fmt)
+    for row in rows:
+        chunk = writer.write(row)
+        if chunk:
+            yield chunk
+    tail = writer.flush()
+    if tail:
+        yield tail
+
+
+async def export_chunks_async(rows: AsyncIterable, fmt: str) -> AsyncIterator[str]:
+    """Асинхронный вариант export_chunks для StreamingResponse."""
+    writer = ChunkWriter(fmt)
+    async for row in rows:
+        chunk = writer.write(row)
+        if chunk:
+            yield chunk
+    tail = writer.flush()
+    if tail:
+        yield tail
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка отзывов в NDJSON/CSV")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--output", default="-", help="путь к файлу (- для stdout)")
+    parser.add_argument("--movie", default=None, help="подстрока названия фильма")
+    parser.add_argument("--sentiment", default=None, help="positive / neutral / negative")
+    parser.add_argument("--query", default=None, help="полнотекстовый поиск по тексту отзыва")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None, help="только отзывы не раньше (ISO 8601)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="размер пачки серверного курсора")
+    args = parser.parse_args()
+
+    stream = open(args.output, "w", encoding="utf-8", newline="") if args.output != "-" else sys.stdout
+    with stream, SessionLocal() as db:
+        rows = iter_reviews_export(db, args.movie, args.sentiment, args.since, args.batch_size, search=args.query)
+        for chunk in export_chunks(rows, args.format):
+            stream.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+inference_cache.py - кеш результатов моделей (тональность, эмбеддинги) по содержимому текста.
+
+Короткие отзывы часто повторяются дословно («Отличный фильм!»), и прогонять их через
+трансформер каждый раз незачем. Ключ — sha256 от версии модели и нормализованного текста
+(Unicode NFC, пробелы схлопнуты): одинаковый для всех процессов и машин, а смена модели,
+рантайма (MODEL_RUNTIME, ONNX_QUANTIZED) или EMBEDDING_VERSION просто даёт новые ключи.
+
+Два уровня, как у кеша лемм (app/text_preprocessing.py):
+  * LRU в памяти процесса — не больше INFERENCE_CACHE_SIZE записей на модель;
+  * общий SQLite-файл INFERENCE_CACHE_PATH — переживает перезапуски и разделяется
+    воркерами uvicorn, app.worker и CLI (пустая строка — только память).
+Ошибки SQLite не ломают инференс: запись считается промахом.
+
+Статистика попаданий: GET /metrics/inference-cache. Размер и очистка дискового уровня:
+
+    python -m app.inference_cache
+    python -m app.inference_cache --clear
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Sequence
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Все кеши процесса — для статистики
+caches: list["InferenceCache"] = []
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация перед хешированием: не меняет токены, которые увидит модель."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def runtime_tag() -> str:
+    """Часть версии модели, зависящая от рантайма: int8-ONNX отвечает чуть иначе, чем PyTorch."""
+    if settings.MODEL_RUNTIME == "onnx":
+        return "onnx-int8" if settings.ONNX_QUANTIZED else "onnx"
+    return settings.MODEL_RUNTIME
+
+
+class InferenceCache:
+    """
+    Кеш text -> результат модели: LRU в памяти плюс общий SQLite-файл.
+
+    Блокировка защищает только LRU и счётчики; чтение и запись SQLite идут без неё,
+    через соединение своего потока, поэтому потоки пула моделей и микро-батчера не ждут
+    чужой диск (и блокировку записи WAL, которую держит другой процесс).
+    Соединения открываются лениво и заново после fork.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        encode: Callable[[Any], bytes],
+        decode: Callable[[bytes], Any],
+        path: str = settings.INFERENCE_CACHE_PATH,
+        max_memory_size: int = settings.INFERENCE_CACHE_SIZE,
+    ):
+        self.name = name
+        self.version = version
+        self.encode = encode
+        self.decode = decode
+        self.path = path
+        self.max_memory_size = max_memory_size
+        self._memory: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        caches.append(self)
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # читатели не блокируют писателя из другого процесса
+            conn.execute("CREATE TABLE IF NOT EXISTS inference_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _remember(self, key: str, value: Any) -> None:
+        """Кладёт значение в LRU (вызывается под self._lock)."""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: set[str]) -> dict[str, Any]:
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            self.memory_hits += len(found)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+
+        rows = []
+        try:
+            conn = self._connection()
+            if conn is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows += conn.execute(f"SELECT key, value FROM inference_cache WHERE key IN ({placeholders})", chunk).fetchall()
+        except sqlite3.Error as exc:
+            logger.warning("inference cache read failed: %s", exc)
+            rows = []
+        from_disk = {key: self.decode(raw) for key, raw in rows}
+
+        with self._lock:
+            for key, value in from_disk.items():
+                self._remember(key, value)
+            self.disk_hits += len(from_disk)
+            self.misses += len(missing) - len(from_disk)
+        found.update(from_disk)
+        return found
+
+    def _store(self, values: dict[str, Any]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._remember(key, value)
+        try:
+            conn = self._connection()
+            if conn is not None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO inference_cache (key, value) VALUES (?, ?)",
+                    [(key, self.encode(value)) for key, value in values.items()],
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("inference cache write failed: %s", exc)
+
+    def get_or_compute(self, texts: list[str], compute: Callable[[list[str]], Sequence]) -> list:
+        """
+        Возвращает результаты для texts; compute вызывается одной пачкой только для текстов,
+        которых нет ни в одном уровне кеша (повторы внутри пачки считаются один раз).
+        """
+        if not settings.INFERENCE_CACHE_ENABLED or not texts:
+            return list(compute(texts))
+
+        keys = [self.key(text) for text in texts]
+        found = self._lookup(set(keys))
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            computed = dict(zip(missing, compute(list(missing.values()))))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "version": self.version,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def stats() -> dict:
+    return {
+        "enabled": settings.INFERENCE_CACHE_ENABLED,
+        "path": settings.INFERENCE_CACHE_PATH or None,
+        "models": {cache.name: cache.stats() for cache in caches},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Кеш результатов моделей по содержимому текста")
+    parser.add_argument("--clear", action="store_true", help="удалить все записи SQLite-файла")
+    args = parser.parse_args()
+
+    conn = InferenceCache("all", "", bytes, bytes)._connection()
+    if conn is None:
+        parser.exit(1, "INFERENCE_CACHE_PATH is empty, there is no on-disk cache\n")
+    if args.clear:
+        # Все модели лежат в одной таблице
+        conn.execute("DELETE FROM inference_cache")
+        conn.commit()
+    count = conn.execute("SELECT count(*) FROM inference_cache").fetchone()[0]
+    print(f"{settings.INFERENCE_CACHE_PATH}: {count} entries")
+
+
+if __name__ == "__main__":
+    main()
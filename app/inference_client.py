@@ -0,0 +1,121 @@
+"""
+inference_client.py - клиент инференс-сайдкара (app/inference_server.py) по Unix-сокету.
+
+При INFERENCE_BACKEND=sidecar воркеры API не загружают модели сами, а отправляют
+пачки текстов одному процессу-сайдкару на машине. Веса лежат в памяти один раз,
+а сайдкар дополнительно объединяет запросы разных воркеров в общие пачки.
+
+Формат кадра (в обе стороны): два 4-байтовых big-endian числа — длина JSON-заголовка
+и длина бинарной части, затем сами заголовок и бинарная часть (для эмбеддингов —
+матрица float32, форма передаётся в заголовке).
+"""
+import asyncio
+import json
+import socket
+import struct
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+
+_LENGTHS = struct.Struct(">II")
+
+
+class InferenceError(RuntimeError):
+    """Сайдкар вернул ошибку или недоступен."""
+
+
+def encode_frame(header: dict, payload: bytes = b"") -> bytes:
+    data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return _LENGTHS.pack(len(data), len(payload)) + data + payload
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("inference sidecar closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(sock: socket.socket) -> tuple[dict, bytes]:
+    header_size, payload_size = _LENGTHS.unpack(_recv_exactly(sock, _LENGTHS.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    return header, _recv_exactly(sock, payload_size) if payload_size else b""
+
+
+async def read_frame_async(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    header_size, payload_size = _LENGTHS.unpack(await reader.readexactly(_LENGTHS.size))
+    header = json.loads(await reader.readexactly(header_size))
+    return header, await reader.readexactly(payload_size) if payload_size else b""
+
+
+class InferenceClient:
+    """Синхронный клиент: по одному постоянному соединению на поток."""
+
+    def __init__(self, socket_path: str, timeout: float):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        sock: Optional[socket.socket] = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def call(self, op: str, texts: list[str]) -> tuple[dict, bytes]:
+        request = encode_frame({"op": op, "texts": texts})
+        # Одна повторная попытка, только при обрыве соединения: сайдкар мог перезапуститься
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                sock.sendall(request)
+                header, payload = read_frame(sock)
+                break
+            except TimeoutError as exc:
+                # Сайдкар перегружен: повтор удвоил бы задержку и его работу. Ответ мог прийти позже
+                # и сбить кадры, поэтому соединение закрывается
+                self._close()
+                raise InferenceError(f"inference sidecar timed out after {self.timeout}s") from exc
+            except (ConnectionError, FileNotFoundError) as exc:
+                self._close()
+                if attempt:
+                    raise InferenceError(f"inference sidecar is unavailable at {self.socket_path}: {exc}") from exc
+            except OSError as exc:
+                self._close()
+                raise InferenceError(f"inference sidecar request failed: {exc}") from exc
+        if "error" in header:
+            raise InferenceError(header["error"])
+        return header, payload
+
+    def sentiment(self, texts: list[str]) -> list[str]:
+        return self.call("sentiment", texts)[0]["labels"]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        header, payload = self.call("embed", texts)
+        return np.frombuffer(payload, dtype="float32").reshape(header["shape"])
+
+    def preprocess(self, texts: list[str]) -> list[str]:
+        return self.call("preprocess", texts)[0]["texts"]
+
+
+client = InferenceClient(settings.INFERENCE_SOCKET_PATH, settings.INFERENCE_TIMEOUT)
+
+
+def use_sidecar() -> bool:
+    return settings.INFERENCE_BACKEND == "sidecar"
@@ -0,0 +1,108 @@
+"""
+inference_server.py - инференс-сайдкар: одна копия моделей на машину для всех воркеров API.
+
+Сайдкар слушает Unix-сокет и выполняет запросы воркеров, запущенных с
+INFERENCE_BACKEND=sidecar (см. app/inference_client.py):
+  * sentiment  — тональность пачки текстов;
+  * embed      — эмбеддинги MiniLM (матрица float32);
+  * preprocess — лемматизация pymorphy2 для кластеризации;
+  * status     — какие модели загружены.
+
+Тексты из одновременных запросов разных воркеров объединяются в общие пачки
+(MicroBatcher), поэтому проход модели обслуживает сразу несколько воркеров.
+
+    python -m app.inference_server
+    python -m app.inference_server --socket /run/movies/inference.sock --no-warmup
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+import numpy as np
+
+from .batching import MicroBatcher
+from .config import settings
+from .executor import run_in_model_executor
+from .inference_client import encode_frame, read_frame_async
+from .model_registry import registry
+from .semantic_embeddings import get_embeddings_local
+from .sentiment import classify_sentiment_local
+from .text_preprocessing import preprocess_texts_local
+
+logger = logging.getLogger(__name__)
+
+sentiment_batcher = MicroBatcher(
+    classify_sentiment_local, settings.SENTIMENT_BATCH_MAX_SIZE, settings.SENTIMENT_BATCH_MAX_WAIT_MS, name="sidecar-sentiment"
+)
+embedding_batcher = MicroBatcher(
+    lambda texts: list(get_embeddings_local(texts)), settings.EMBEDDING_BATCH_MAX_SIZE, settings.EMBEDDING_BATCH_MAX_WAIT_MS, name="sidecar-embeddings"
+)
+
+
+async def _batched(batcher: MicroBatcher, texts: list[str]) -> list:
+    return await asyncio.gather(*(asyncio.wrap_future(batcher.submit(text)) for text in texts))
+
+
+async def handle_request(op: str, texts: list[str]) -> tuple[dict, bytes]:
+    if op == "sentiment":
+        return {"labels": [label.value for label in await _batched(sentiment_batcher, texts)]}, b""
+    if op == "embed":
+        if not texts:
+            # (0, dim) от самой модели, а не (0, 0): клиенты склеивают результат с другими эмбеддингами
+            matrix = await run_in_model_executor(get_embeddings_local, [])
+        else:
+            matrix = np.stack(await _batched(embedding_batcher, texts)).astype("float32")
+        return {"shape": list(matrix.shape)}, matrix.tobytes()
+    if op == "preprocess":
+        return {"texts": await run_in_model_executor(preprocess_texts_local, texts)}, b""
+    if op == "status":
+        return registry.status(), b""
+    raise ValueError(f"unknown op: {op!r}")
+
+
+async def serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Обслуживает постоянное соединение одного потока воркера: запрос — ответ, по порядку."""
+    try:
+        while True:
+            try:
+                request, _ = await read_frame_async(reader)
+            except asyncio.IncompleteReadError:
+                break
+            try:
+                header, payload = await handle_request(request.get("op"), request.get("texts", []))
+            except Exception as exc:
+                logger.exception("inference request failed")
+                header, payload = {"error": f"{type(exc).__name__}: {exc}"}, b""
+            writer.write(encode_frame(header, payload))
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(socket_path: str, warmup: bool) -> None:
+    if warmup:
+        await run_in_model_executor(registry.warmup, ["all"])
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # сокет остался от предыдущего запуска
+    server = await asyncio.start_unix_server(serve_connection, path=socket_path)
+    os.chmod(socket_path, 0o660)
+    logger.info("inference sidecar listening on %s", socket_path)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Инференс-сайдкар для воркеров API (INFERENCE_BACKEND=sidecar)")
+    parser.add_argument("--socket", default=settings.INFERENCE_SOCKET_PATH, help="путь к Unix-сокету")
+    parser.add_argument("--no-warmup", action="store_true", help="грузить модели при первом запросе, а не при старте")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Сам сайдкар всегда считает локально
+    settings.INFERENCE_BACKEND = "local"
+    asyncio.run(serve(args.socket, warmup=not args.no_warmup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+ingest.py - массовый импорт отзывов из NDJSON/CSV.
+
+Вход читается потоково, чанками по chunk_size строк. На каждый чанк:
+  * названия фильмов разрешаются одним set-based upsert;
+  * тональность, эмбеддинги и лемматизированный текст считаются пачкой;
+  * отзывы и их эмбеддинги пишутся multi-row insert'ами в одной транзакции.
+
+При ENRICHMENT_MODE=queue модели не вызываются: чанк пишется вместе с задачами
+обогащения, а тональность и эмбеддинги считает python -m app.worker.
+
+CLI:
+
+    python -m app.ingest reviews.ndjson --user-id 1
+    python -m app.ingest reviews.csv --user-id 1 --format csv --chunk-size 1000
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .cache import recommendation_cache
+from .config import settings
+from .database import SessionLocal
+from .embedding_store import save_review_embeddings
+from .movie_index import movie_index
+from .movie_stats import record_reviews
+from .semantic_embeddings import get_embeddings
+from .sentiment import classify_sentiment_batch
+from .sentiment_types import EnrichmentStatus
+from .text_preprocessing import preprocess_texts
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+
+
+@dataclass
+class IngestReport:
+    rows_imported: int = 0
+    rows_skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_imported / self.seconds if self.seconds else 0.0
+
+
+def _parse_rows(raw_rows: Iterable[dict], report: IngestReport) -> Iterator[schemas.ReviewCreate]:
+    """Валидирует строки той же схемой, что и POST /reviews; некорректные пропускаются."""
+    for raw in raw_rows:
+        try:
+            yield schemas.ReviewCreate(**raw)
+        except (ValidationError, TypeError):
+            report.rows_skipped += 1
+
+
+def _read_ndjson(stream: TextIO, report: IngestReport) -> Iterator[dict]:
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            report.rows_skipped += 1
+
+
+def read_rows(stream: TextIO, fmt: str, report: IngestReport) -> Iterator[schemas.ReviewCreate]:
+    """
+    Потоково читает отзывы из файла.
+
+    Args:
+        stream (TextIO): текстовый поток.
+        fmt (str): "ndjson" (по объекту на строку) или "csv" (с заголовком movie_title,review_text,rating).
+        report (IngestReport): сюда считаются пропущенные строки.
+    """
+    if fmt == "ndjson":
+        raw_rows = _read_ndjson(stream, report)
+    elif fmt == "csv":
+        raw_rows = csv.DictReader(stream)
+    else:
+        raise ValueError(f"Unknown format: {fmt!r}, expected one of {FORMATS}")
+    return _parse_rows(raw_rows, report)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def upsert_movies(db: Session, titles: Iterable[str]) -> dict[str, int]:
+    """
+    Создаёт недостающие фильмы одним INSERT ... ON CONFLICT DO NOTHING
+    и возвращает ID всех переданных названий одним SELECT.
+    """
+    titles = list(set(titles))
+    if not titles:
+        return {}
+    db.execute(
+        pg_insert(models.Movie)
+        .values([{"title": title} for title in titles])
+        .on_conflict_do_nothing(index_elements=[models.Movie.title])
+    )
+    rows = db.execute(select(models.Movie.title, models.Movie.id).where(models.Movie.title.in_(titles))).all()
+    return {row.title: row.id for row in rows}
+
+
+def enqueue_reviews_chunk(db: Session, rows: list[schemas.ReviewCreate], user_id: int) -> int:
+    """ENRICHMENT_MODE=queue: записывает чанк без моделей и ставит задачи обогащения для app.worker."""
+    movie_ids = upsert_movies(db, (row.movie_title for row in rows))
+    params = [
+        {
+            "movie_id": movie_ids[row.movie_title],
+            "user_id": user_id,
+            "rating": row.rating,
+            "review_text": row.review_text,
+            "enrichment_status": EnrichmentStatus.pending,
+        }
+        for row in rows
+    ]
+    inserted = db.execute(
+        insert(models.Review).returning(models.Review.id, sort_by_parameter_order=True), params
+    ).scalars().all()
+    db.execute(insert(models.EnrichmentJob), [{"review_id": review_id} for review_id in inserted])
+    db.commit()
+    recommendation_cache.reviews_written(user_id)
+    return len(inserted)
+
+
+def insert_reviews_chunk(db: Session, rows: list[schemas.ReviewCreate], user_id: int) -> int:
+    """Записывает чанк отзывов в одной транзакции. Возвращает число вставленных строк."""
+    if settings.ENRICHMENT_MODE == "queue":
+        return enqueue_reviews_chunk(db, rows, user_id)
+
+    texts = [row.review_text for row in rows]
+    sentiments = classify_sentiment_batch(texts)
+    embeddings = get_embeddings(texts)
+    processed_texts = preprocess_texts(texts)
+
+    movie_ids = upsert_movies(db, (row.movie_title for row in rows))
+    params = [
+        {
+            "movie_id": movie_ids[row.movie_title],
+            "user_id": user_id,
+            "rating": row.rating,
+            "review_text": row.review_text,
+            "processed_text": processed_text,
+            "sentiment": sentiment,
+        }
+        for row, sentiment, processed_text in zip(rows, sentiments, processed_texts)
+    ]
+    # executemany с RETURNING: SQLAlchemy склеивает строки в multi-row INSERT ... VALUES
+    inserted = db.execute(
+        insert(models.Review).returning(models.Review.id, sort_by_parameter_order=True), params
+    ).scalars().all()
+    record_reviews(db, [(p["movie_id"], p["sentiment"], p["rating"]) for p in params])
+    # Последним перед коммитом — см. MovieIndex.sync
+    save_review_embeddings(db, inserted, embeddings)
+    db.commit()
+
+    for param, embedding in zip(params, embeddings):
+        movie_index.add_review(param["movie_id"], embedding)
+    recommendation_cache.reviews_written(user_id)
+    return len(inserted)
+
+
+def ingest_reviews(
+    db: Session,
+    rows: Iterable[schemas.ReviewCreate],
+    user_id: int,
+    chunk_size: int = 500,
+    report: Optional[IngestReport] = None,
+    on_progress: Optional[Callable[[IngestReport], None]] = None,
+) -> IngestReport:
+    """
+    Импортирует отзывы чанками от имени пользователя user_id.
+
+    Args:
+        db (Session): текущая сессия БД.
+        rows (Iterable[ReviewCreate]): поток отзывов (см. read_rows).
+        user_id (int): автор импортируемых отзывов.
+        chunk_size (int): размер чанка (одна транзакция и один проход моделей).
+        report (IngestReport, optional): отчёт, в который уже посчитаны пропуски при чтении.
+        on_progress (callable, optional): вызывается после каждого чанка.
+
+    Returns:
+        IngestReport: итоговая статистика импорта.
+    """
+    report = report or IngestReport()
+    started = time.perf_counter()
+    for chunk in chunked(rows, chunk_size):
+        report.rows_imported += insert_reviews_chunk(db, chunk, user_id)
+        report.seconds = time.perf_counter() - started
+        logger.info("ingested %d rows, %.1f rows/sec", report.rows_imported, report.rows_per_second)
+        if on_progress:
+            on_progress(report)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Массовый импорт отзывов из NDJSON/CSV")
+    parser.add_argument("path", help="путь к файлу (- для stdin)")
+    parser.add_argument("--user-id", type=int, required=True, help="автор импортируемых отзывов")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="по умолчанию — по расширению файла")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    report = IngestReport()
+
+    def print_progress(r: IngestReport) -> None:
+        print(f"{r.rows_imported} rows, {r.rows_per_second:.1f} rows/sec, skipped {r.rows_skipped}")
+
+    stream = open(args.path, encoding="utf-8", newline="") if args.path != "-" else sys.stdin
+    with stream, SessionLocal() as db:
+        rows = read_rows(stream, fmt, report)
+        ingest_reviews(db, rows, args.user_id, args.chunk_size, report=report, on_progress=print_progress)
+
+    print(
+        f"done: {report.rows_imported} rows in {report.seconds:.1f}s "
+        f"({report.rows_per_second:.1f} rows/sec), skipped {report.rows_skipped}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+item_neighbors.py - предрасчёт соседей фильмов для item-based коллаборативной фильтрации.
+
+Для каждого фильма считаются top-K самых похожих фильмов по косинусному сходству
+столбцов матрицы оценок (фильмы, которые оценивали одни и те же пользователи и похоже)
+и сохраняются в таблицу movie_neighbors. Соседи меняются медленно, поэтому пересчёт
+запускается по расписанию, а запрос рекомендаций лишь сливает готовые списки:
+
+    python -m app.item_neighbors
+    python -m app.item_neighbors --k 100 --block-size 512
+"""
+import argparse
+from itertools import islice
+from typing import Iterator
+
+import numpy as np
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from .cache import recommendation_cache
+from .collaborative_filtering import CFModel, _ratings_query
+from .config import settings
+from .database import SessionLocal
+from .models import MovieNeighbor
+
+
+def iter_item_neighbors(model: CFModel, k: int, block_size: int = 256) -> Iterator[dict]:
+    """
+    Считает top-K соседей для всех фильмов модели.
+
+    Сходство считается блоками по block_size фильмов: разреженное произведение
+    блока на всю матрицу, поэтому память — O(block_size × число фильмов), а не квадрат.
+    """
+    items = model.ratings.T.tocsr()  # фильмы × пользователи
+    norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+    n_items = items.shape[0]
+    k = min(k, n_items - 1)
+    if k <= 0:
+        return
+
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        sims = (items[start:stop] @ items.T).toarray()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims /= norms[start:stop, None] * norms[None, :]
+        sims = np.nan_to_num(sims, nan=0.0)
+        sims[np.arange(stop - start), np.arange(start, stop)] = 0.0  # сам себе не сосед
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        for offset, candidates in enumerate(top):
+            row = sims[offset]
+            candidates = candidates[np.argsort(-row[candidates], kind="stable")]
+            movie_id = int(model.movie_ids[start + offset])
+            for rank, col in enumerate(candidates[row[candidates] > 0]):
+                yield {
+                    "movie_id": movie_id,
+                    "neighbor_id": int(model.movie_ids[col]),
+                    "similarity": float(row[col]),
+                    "rank": rank,
+                }
+
+
+def refresh_item_neighbors(
+    db: Session,
+    k: int = settings.ITEM_CF_NEIGHBORS,
+    block_size: int = 256,
+    min_user_ratings: int = 2,
+    min_movie_ratings: int = 2,
+) -> int:
+    """
+    Полностью пересчитывает movie_neighbors по таблице reviews одной транзакцией.
+
+    Returns:
+        int: количество записанных пар (фильм, сосед).
+    """
+    rows = db.execute(_ratings_query()).all()
+    model = CFModel.from_rows(rows, min_user_ratings, min_movie_ratings)
+
+    db.execute(delete(MovieNeighbor))
+    total = 0
+    if model is not None:
+        pairs = iter_item_neighbors(model, k, block_size)
+        while chunk := list(islice(pairs, 5000)):
+            db.execute(insert(MovieNeighbor), chunk)
+            total += len(chunk)
+    db.commit()
+    # Item-based рекомендации читают movie_neighbors — закешированные результаты устарели
+    recommendation_cache.invalidate_all()
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пересчёт top-K похожих фильмов для item-based рекомендаций")
+    parser.add_argument("--k", type=int, default=settings.ITEM_CF_NEIGHBORS, help="сколько соседей хранить на фильм")
+    parser.add_argument("--block-size", type=int, default=256, help="сколько фильмов обрабатывать за один блок")
+    parser.add_argument("--min-user-ratings", type=int, default=2)
+    parser.add_argument("--min-movie-ratings", type=int, default=2)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        total = refresh_item_neighbors(db, args.k, args.block_size, args.min_user_ratings, args.min_movie_ratings)
+    print(f"movie_neighbors refreshed: {total} pairs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,62 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
 
+from .auth import is_deleted_user_error
+from .config import settings
 from .routes import router
-from .database import Base, engine
+from .database import Base, engine, SessionLocal, async_engine
+from .executor import run_in_model_executor
+from .inference_client import InferenceError
+from .metrics import metrics_middleware
+from .model_registry import MLDisabledError, registry, warmup_names
+from .movie_index import movie_index
 
 from .sentiment import classify_sentiment
-app = FastAPI(title="Movie Reviews API")
+
+logger = logging.getLogger(__name__)
+
+
+def _sync_movie_index() -> None:
+    with SessionLocal() as db:
+        movie_index.sync(db)
+
+
+async def _sync_movie_index_periodically() -> None:
+    """Подтягивает в индекс фильмов эмбеддинги от других воркеров, app.worker, импорта и бэкфилла."""
+    while True:
+        await asyncio.sleep(settings.MOVIE_INDEX_SYNC_SECONDS)
+        try:
+            await run_in_model_executor(_sync_movie_index)
+        except Exception:
+            logger.exception("movie index sync failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    index_sync = None
+    if settings.ENABLE_ML:
+        # Индекс фильмов строится один раз при старте (или читается с диска и догоняет БД)
+        with SessionLocal() as db:
+            movie_index.load_or_build(db)
+        index_sync = asyncio.create_task(_sync_movie_index_periodically())
+        # Модели грузятся лениво; MODEL_WARMUP позволяет загрузить нужные заранее
+        await run_in_model_executor(registry.warmup, warmup_names())
+    yield
+    if index_sync is not None:
+        index_sync.cancel()
+    if settings.ENABLE_ML:
+        # Сохраняем индекс, чтобы следующий старт не пересобирал его по всей БД
+        movie_index.save()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="Movie Reviews API", lifespan=lifespan)
 
 # Добавление CORS middleware (разрешаем доступ к API со всех доменов)
 app.add_middleware(
@@ -14,8 +65,33 @@ app.add_middleware(
     allow_credentials=True,         # Разрешить использование cookie и авторизационных заголовков
     allow_methods=["*"],            # Разрешить все HTTP-методы (GET, POST, PUT, DELETE и т.д.)
     allow_headers=["*"],            # Разрешить любые заголовки в запросах
+    expose_headers=["X-Next-Cursor"],  # Курсор следующей страницы GET /reviews доступен JS-клиентам
 )
 
+# Длительность запросов и число SQL-запросов на эндпоинт (GET /metrics)
+app.middleware("http")(metrics_middleware)
+
+# Воркер запущен с ENABLE_ML=false, а эндпоинту нужна модель
+@app.exception_handler(MLDisabledError)
+async def ml_disabled_handler(request: Request, exc: MLDisabledError):
+    return JSONResponse(status_code=503, content={"detail": "ML models are disabled on this worker"})
+
+# INFERENCE_BACKEND=sidecar, а сайдкар недоступен или вернул ошибку
+@app.exception_handler(InferenceError)
+async def inference_error_handler(request: Request, exc: InferenceError):
+    return JSONResponse(status_code=503, content={"detail": "Inference service is unavailable"})
+
+# Пользователь из ещё действующего токена удалён: запись отклонил внешний ключ на users
+@app.exception_handler(IntegrityError)
+async def integrity_error_handler(request: Request, exc: IntegrityError):
+    if is_deleted_user_error(exc):
+        return JSONResponse(
+            status_code=401,
+            content={"detail": "Could not validate credentials"},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    raise exc  # остальные нарушения — как и раньше, HTTP 500
+
 # Подключение всех маршрутов (эндпоинтов) из файла routes.py
 app.include_router(router)
 
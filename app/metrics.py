@@ -0,0 +1,196 @@
+"""
+metrics.py - задержки по этапам и метрики Prometheus (GET /metrics).
+
+  * movies_http_request_duration_seconds{method, route, status} — middleware, route — шаблон пути;
+  * movies_stage_duration_seconds{stage} — этапы внутри запроса: токенизация и проход моделей,
+    FAISS, рекомендатели, кластеризация (декоратор/контекстный менеджер timed);
+  * movies_db_queries_per_request{method, route} и movies_db_query_duration_seconds{engine} — события
+    SQLAlchemy: рост числа запросов на эндпоинт сразу показывает N+1;
+  * состояние пулов соединений, кеша рекомендаций, кеша инференса и загруженных моделей —
+    снимаются в момент опроса (те же данные, что /metrics/pool, /metrics/cache и т.д.).
+
+    @timed("recommend_semantic")
+    def get_semantic_recommendations(...): ...
+
+    with timed("sentiment_tokenize"):
+        inputs = tokenizer(...)
+
+При нескольких воркерах uvicorn каждый процесс считает своё. Чтобы /metrics суммировал
+гистограммы всех воркеров, задайте PROMETHEUS_MULTIPROC_DIR (пустой каталог, очищается
+при каждом запуске) — снимки пулов и кешей при этом отдаёт только ответивший процесс.
+"""
+import asyncio
+import functools
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Этапы бывают от долей миллисекунды (кеш, FAISS) до минут (обучение кластеров)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+REQUEST_SECONDS = Histogram(
+    "movies_http_request_duration_seconds", "Время обработки HTTP-запроса", ["method", "route", "status"]
+)
+STAGE_SECONDS = Histogram(
+    "movies_stage_duration_seconds", "Время этапа обработки (модели, FAISS, рекомендатели, кластеризация)",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+QUERIES_PER_REQUEST = Histogram(
+    "movies_db_queries_per_request", "Число SQL-запросов за один HTTP-запрос", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+QUERY_SECONDS = Histogram(
+    "movies_db_query_duration_seconds", "Время выполнения SQL-запроса", ["engine"], buckets=STAGE_BUCKETS
+)
+
+# Счётчик запросов текущего HTTP-запроса; список, чтобы копии контекста (threadpool, пул моделей) писали в него же
+_request_queries: ContextVar[Optional[list[int]]] = ContextVar("request_queries", default=None)
+
+
+class timed:
+    """Декоратор (sync и async функций) и контекстный менеджер, пишущий длительность в STAGE_SECONDS."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._histogram = STAGE_SECONDS.labels(stage)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+    def __call__(self, func):
+        histogram = self._histogram
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+
+def track_queries(engine: Engine, name: str) -> None:
+    """Считает SQL-запросы движка: длительность каждого и число за HTTP-запрос."""
+    histogram = QUERY_SECONDS.labels(name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+        counter = _request_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        histogram.observe(time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            starts = context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+async def metrics_middleware(request, call_next):
+    """HTTP-middleware: длительность запроса и число SQL-запросов по шаблону пути."""
+    counter = [0]
+    token = _request_queries.set(counter)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        _request_queries.reset(token)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_SECONDS.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+        QUERIES_PER_REQUEST.labels(request.method, route).observe(counter[0])
+
+
+class SnapshotCollector:
+    """Снимки состояния процесса в момент опроса: пулы, кеши, модели."""
+
+    def describe(self):
+        # Без describe() реестр вызвал бы collect() при регистрации — до инициализации движков БД
+        return []
+
+    def collect(self):
+        from . import inference_cache
+        from .cache import recommendation_cache
+        from .database import async_engine, engine
+        from .model_registry import registry
+        from .pool_metrics import pool_status
+
+        checked_out = GaugeMetricFamily("movies_db_pool_checked_out", "Выданные соединения пула", labels=["engine"])
+        checkouts = CounterMetricFamily("movies_db_pool_checkouts", "Выдачи соединений из пула", labels=["engine"])
+        wait = CounterMetricFamily("movies_db_pool_wait_seconds", "Суммарное ожидание соединения", labels=["engine"])
+        timeouts = CounterMetricFamily("movies_db_pool_timeouts", "Таймауты ожидания соединения", labels=["engine"])
+        for name, eng in (("sync", engine), ("async", async_engine.sync_engine)):
+            status = pool_status(eng)
+            if "checked_out" in status:
+                checked_out.add_metric([name], status["checked_out"])
+                checkouts.add_metric([name], status["checkouts_total"])
+                wait.add_metric([name], status["wait_seconds_total"])
+                timeouts.add_metric([name], status["timeouts_total"])
+        yield from (checked_out, checkouts, wait, timeouts)
+
+        cache_lookups = CounterMetricFamily(
+            "movies_recommendation_cache_lookups", "Обращения к кешу рекомендаций", labels=["algorithm", "result"]
+        )
+        for algorithm, counts in recommendation_cache.stats()["by_algorithm"].items():
+            cache_lookups.add_metric([algorithm, "hit"], counts["hits"])
+            cache_lookups.add_metric([algorithm, "miss"], counts["misses"])
+        yield cache_lookups
+
+        inference_lookups = CounterMetricFamily(
+            "movies_inference_cache_lookups", "Обращения к кешу инференса", labels=["model", "result"]
+        )
+        for model, stats in inference_cache.stats()["models"].items():
+            for result in ("memory_hits", "disk_hits", "misses"):
+                inference_lookups.add_metric([model, result], stats[result])
+        yield inference_lookups
+
+        loaded = GaugeMetricFamily("movies_model_loaded", "Модель загружена в этом процессе", labels=["model"])
+        load_seconds = GaugeMetricFamily("movies_model_load_seconds", "Время загрузки модели", labels=["model"])
+        for model, status in registry.status()["models"].items():
+            loaded.add_metric([model], int(status["loaded"]))
+            load_seconds.add_metric([model], status["load_seconds"])
+        yield from (loaded, load_seconds)
+
+
+REGISTRY.register(SnapshotCollector())
+
+
+def render() -> tuple[bytes, str]:
+    """Текст для GET /metrics и его Content-Type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(SnapshotCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
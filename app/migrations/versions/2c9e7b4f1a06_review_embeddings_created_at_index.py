@@ -0,0 +1,38 @@
+"""review_embeddings created_at index
+
+Revision ID: 2c9e7b4f1a06
+Revises: d81e6f3a4c92
+Create Date: 2026-10-19 10:12:48.305117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "2c9e7b4f1a06"
+down_revision: Union[str, Sequence[str], None] = "d81e6f3a4c92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # MovieIndex.sync каждого процесса API раз в MOVIE_INDEX_SYNC_SECONDS ищет новые эмбеддинги
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_review_embeddings_created_at",
+            "review_embeddings",
+            ["created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_review_embeddings_created_at", table_name="review_embeddings", postgresql_concurrently=True)
@@ -0,0 +1,51 @@
+"""review embeddings
+
+Revision ID: 3f1a9c2b7d41
+Revises: 8c6388412032
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1a9c2b7d41"
+down_revision: Union[str, Sequence[str], None] = "8c6388412032"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "review_embeddings",
+        sa.Column("review_id", sa.Integer(), nullable=False),
+        sa.Column("model_version", sa.String(), nullable=False),
+        sa.Column("vector", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["review_id"],
+            ["reviews.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("review_id"),
+    )
+    op.create_index(
+        op.f("ix_review_embeddings_model_version"),
+        "review_embeddings",
+        ["model_version"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_review_embeddings_model_version"),
+        table_name="review_embeddings",
+    )
+    op.drop_table("review_embeddings")
@@ -0,0 +1,30 @@
+"""review processed text
+
+Revision ID: 5b8e0c4f9d13
+Revises: e19b3d7c5a62
+Create Date: 2026-10-18 16:05:39.211870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b8e0c4f9d13"
+down_revision: Union[str, Sequence[str], None] = "e19b3d7c5a62"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Заполняется при записи отзыва; для существующих отзывов — python -m app.text_preprocessing
+    op.add_column("reviews", sa.Column("processed_text", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("reviews", "processed_text")
@@ -0,0 +1,38 @@
+"""reviews created_at index
+
+Revision ID: 9d2f4a6b1c85
+Revises: 5b8e0c4f9d13
+Create Date: 2026-10-18 18:42:16.570394
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9d2f4a6b1c85"
+down_revision: Union[str, Sequence[str], None] = "5b8e0c4f9d13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset-пагинация GET /reviews; CONCURRENTLY — не блокируем запись в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_reviews_created_at_id",
+            "reviews",
+            ["created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_reviews_created_at_id", table_name="reviews", postgresql_concurrently=True)
@@ -0,0 +1,72 @@
+"""movie stats
+
+Revision ID: a7c2e5d91b08
+Revises: 3f1a9c2b7d41
+Create Date: 2026-10-18 12:31:05.118734
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c2e5d91b08"
+down_revision: Union[str, Sequence[str], None] = "3f1a9c2b7d41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "movie_stats",
+        sa.Column("movie_id", sa.Integer(), nullable=False),
+        sa.Column("positive_count", sa.Integer(), nullable=False),
+        sa.Column("neutral_count", sa.Integer(), nullable=False),
+        sa.Column("negative_count", sa.Integer(), nullable=False),
+        sa.Column("rating_sum", sa.Integer(), nullable=False),
+        sa.Column("rating_count", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["movie_id"],
+            ["movies.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("movie_id"),
+    )
+    op.create_index(
+        "ix_movie_stats_positive_count_movie_id",
+        "movie_stats",
+        ["positive_count", "movie_id"],
+        unique=False,
+    )
+    # Заполняем агрегаты по уже существующим отзывам
+    op.execute(
+        """
+        INSERT INTO movie_stats (
+            movie_id, positive_count, neutral_count, negative_count,
+            rating_sum, rating_count, updated_at
+        )
+        SELECT
+            movie_id,
+            count(*) FILTER (WHERE sentiment = 'positive'),
+            count(*) FILTER (WHERE sentiment = 'neutral'),
+            count(*) FILTER (WHERE sentiment = 'negative'),
+            sum(rating),
+            count(*),
+            now()
+        FROM reviews
+        GROUP BY movie_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_movie_stats_positive_count_movie_id", table_name="movie_stats"
+    )
+    op.drop_table("movie_stats")
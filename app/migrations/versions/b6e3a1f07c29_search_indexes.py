@@ -0,0 +1,63 @@
+"""search indexes
+
+Revision ID: b6e3a1f07c29
+Revises: 9d2f4a6b1c85
+Create Date: 2026-10-18 19:27:53.904117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b6e3a1f07c29"
+down_revision: Union[str, Sequence[str], None] = "9d2f4a6b1c85"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Сгенерированный столбец заполняется для всех существующих строк (перезапись таблицы)
+    op.add_column(
+        "reviews",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('russian', review_text)", persisted=True),
+            nullable=True,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        # ILIKE '%...%' по названию фильма — bitmap-скан триграммного индекса вместо seq scan
+        op.create_index(
+            "ix_movies_title_trgm",
+            "movies",
+            ["title"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_reviews_search_vector",
+            "reviews",
+            ["search_vector"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_reviews_search_vector", table_name="reviews", postgresql_concurrently=True)
+        op.drop_index("ix_movies_title_trgm", table_name="movies", postgresql_concurrently=True)
+    op.drop_column("reviews", "search_vector")
+    # Расширение pg_trgm не удаляем: им могут пользоваться и другие объекты БД
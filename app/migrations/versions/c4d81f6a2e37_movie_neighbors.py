@@ -0,0 +1,46 @@
+"""movie neighbors
+
+Revision ID: c4d81f6a2e37
+Revises: a7c2e5d91b08
+Create Date: 2026-10-18 14:02:47.530218
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d81f6a2e37"
+down_revision: Union[str, Sequence[str], None] = "a7c2e5d91b08"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "movie_neighbors",
+        sa.Column("movie_id", sa.Integer(), nullable=False),
+        sa.Column("neighbor_id", sa.Integer(), nullable=False),
+        sa.Column("similarity", sa.Float(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["movie_id"],
+            ["movies.id"],
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["neighbor_id"],
+            ["movies.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("movie_id", "neighbor_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("movie_neighbors")
@@ -0,0 +1,66 @@
+"""enrichment queue
+
+Revision ID: d81e6f3a4c92
+Revises: f4c7d2b85e10
+Create Date: 2026-10-18 21:04:37.912446
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d81e6f3a4c92"
+down_revision: Union[str, Sequence[str], None] = "f4c7d2b85e10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+enrichment_status = sa.Enum("pending", "done", "failed", name="enrichmentstatus")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    enrichment_status.create(op.get_bind())
+    # Константный DEFAULT: PostgreSQL 11+ добавляет столбец без перезаписи таблицы, старые отзывы — done
+    op.add_column(
+        "reviews",
+        sa.Column("enrichment_status", enrichment_status, nullable=False, server_default="done"),
+    )
+    # Отзыв из очереди живёт без тональности, пока его не обработает app.worker
+    op.alter_column("reviews", "sentiment", existing_type=sa.Enum(name="sentimentenum"), nullable=True)
+
+    op.create_table(
+        "enrichment_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("review_id", sa.Integer(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("run_after", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["review_id"],
+            ["reviews.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("review_id"),
+    )
+    op.create_index(
+        "ix_enrichment_jobs_run_after_id",
+        "enrichment_jobs",
+        ["run_after", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_enrichment_jobs_run_after_id", table_name="enrichment_jobs")
+    op.drop_table("enrichment_jobs")
+    # Перед откатом очередь должна быть разобрана: NOT NULL не встанет на отзывы без тональности
+    op.alter_column("reviews", "sentiment", existing_type=sa.Enum(name="sentimentenum"), nullable=False)
+    op.drop_column("reviews", "enrichment_status")
+    enrichment_status.drop(op.get_bind())
@@ -0,0 +1,40 @@
+"""movie clusters
+
+Revision ID: e19b3d7c5a62
+Revises: c4d81f6a2e37
+Create Date: 2026-10-18 15:20:11.804391
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e19b3d7c5a62"
+down_revision: Union[str, Sequence[str], None] = "c4d81f6a2e37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "movie_clusters",
+        sa.Column("movie_id", sa.Integer(), nullable=False),
+        sa.Column("cluster_id", sa.Integer(), nullable=False),
+        sa.Column("assigned_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["movie_id"],
+            ["movies.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("movie_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("movie_clusters")
@@ -0,0 +1,40 @@
+"""reviews composite indexes
+
+Revision ID: f4c7d2b85e10
+Revises: b6e3a1f07c29
+Create Date: 2026-10-18 20:11:08.345921
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f4c7d2b85e10"
+down_revision: Union[str, Sequence[str], None] = "b6e3a1f07c29"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_reviews_user_id_sentiment": ["user_id", "sentiment"],
+    "ix_reviews_movie_id_created_at": ["movie_id", "created_at"],
+    "ix_reviews_sentiment_created_at_id": ["sentiment", "created_at", "id"],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY — без блокировки записи в reviews на время построения
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, "reviews", columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in reversed(list(INDEXES)):
+            op.drop_index(name, table_name="reviews", postgresql_concurrently=True)
@@ -0,0 +1,78 @@
+"""
+mmap_weights.py - веса моделей из safetensors, отображённые в память (MODEL_WEIGHTS_MMAP=true).
+
+Модель создаётся как обычно, после чего её параметры заменяются тензорами,
+которые смотрят прямо в mmap файла model.safetensors (MAP_PRIVATE, copy-on-write).
+Страницы весов берутся из page cache и общие для всех процессов на машине,
+пока их никто не меняет, — а при инференсе веса только читаются.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_NAME = "model.safetensors"
+
+# Типы safetensors -> имена атрибутов torch
+_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def load_safetensors_mmap(path: str) -> dict:
+    """Читает safetensors без копирования: каждый тензор — окно в общий mmap файла."""
+    import torch
+
+    with open(path, "rb") as f:
+        # ACCESS_COPY = MAP_PRIVATE: чтение идёт из общего page cache, запись (если вдруг) — в приватную копию
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    (header_size,) = struct.unpack("<Q", buffer[:8])
+    header = json.loads(buffer[8:8 + header_size])
+    base = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, _DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=base + start) if count else torch.empty(0, dtype=dtype)
+        tensors[name] = tensor.reshape(info["shape"])
+    return tensors
+
+
+def share_weights(module, model_dir: str) -> int:
+    """
+    Заменяет параметры module тензорами из mmap model_dir/model.safetensors.
+
+    Имена сопоставляются с учётом base_model_prefix (чекпойнты с префиксом "bert." и без);
+    тензоры с другой формой или типом остаются как есть.
+
+    Returns:
+        int: число параметров, переведённых на общий mmap (0 — файла нет).
+    """
+    path = os.path.join(model_dir, WEIGHTS_NAME)
+    if not os.path.isfile(path):
+        logger.warning("MODEL_WEIGHTS_MMAP: %s not found, weights stay in private memory", path)
+        return 0
+
+    own = module.state_dict()
+    prefix = getattr(module, "base_model_prefix", "")
+    shared = {}
+    for name, tensor in load_safetensors_mmap(path).items():
+        for candidate in (name, name.removeprefix(f"{prefix}."), f"{prefix}.{name}"):
+            target = own.get(candidate)
+            if target is not None and target.shape == tensor.shape and target.dtype == tensor.dtype:
+                shared[candidate] = tensor
+                break
+
+    module.load_state_dict(shared, strict=False, assign=True)
+    if hasattr(module, "tie_weights"):
+        module.tie_weights()
+    logger.info("MODEL_WEIGHTS_MMAP: %d/%d tensors of %s are memory-mapped", len(shared), len(own), model_dir)
+    return len(shared)
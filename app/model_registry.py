@@ -0,0 +1,99 @@
+"""
+model_registry.py - ленивая загрузка ML-моделей.
+
+Модели (тональность, эмбеддинги, морфоанализатор, стоп-слова) больше не грузятся
+при импорте модулей: каждая регистрируется загрузчиком и создаётся при первом
+обращении registry.get(name). Импорт app.main поэтому не тянет torch/transformers/
+sentence-transformers/pymorphy2/nltk, а воркеры, обслуживающие только /token и /me,
+не держат модели в памяти.
+
+Настройки:
+  * ENABLE_ML=false — API-only воркер: обращение к модели даёт MLDisabledError (HTTP 503);
+  * MODEL_WARMUP=sentiment,embeddings — какие модели загрузить при старте ("all" — все);
+  * MODEL_ALLOW_DOWNLOADS=false — не ходить в сеть: только локальный кеш HuggingFace/nltk.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MLDisabledError(RuntimeError):
+    """Модель запрошена в процессе, запущенном с ENABLE_ML=false."""
+
+
+class ModelRegistry:
+    """Потокобезопасный реестр лениво загружаемых моделей: загрузчик вызывается ровно один раз."""
+
+    def __init__(self):
+        self._loaders: dict[str, Callable[[], Any]] = {}
+        self._models: dict[str, Any] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self.load_seconds: dict[str, float] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if not settings.ENABLE_ML:
+            raise MLDisabledError(f"model {name!r} requested but ENABLE_ML is false")
+        with self._locks[name]:
+            if name not in self._models:
+                started = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self.load_seconds[name] = time.perf_counter() - started
+                logger.info("model %s loaded in %.2fs", name, self.load_seconds[name])
+        return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warmup(self, names: Iterable[str]) -> None:
+        """Загружает перечисленные модели заранее ("all" — все зарегистрированные)."""
+        names = list(names)
+        if "all" in names:
+            names = list(self._loaders)
+        for name in names:
+            self.get(name)
+
+    def status(self) -> dict:
+        return {
+            "enabled": settings.ENABLE_ML,
+            "runtime": settings.MODEL_RUNTIME,
+            "models": {
+                name: {"loaded": name in self._models, "load_seconds": round(self.load_seconds.get(name, 0.0), 3)}
+                for name in self._loaders
+            },
+        }
+
+
+registry = ModelRegistry()
+
+
+def huggingface_path(repo_id: str) -> str:
+    """
+    Путь к модели в локальном кеше HuggingFace, если она уже скачана, иначе repo_id.
+
+    С локальным путём from_pretrained/SentenceTransformer не делают сетевых запросов
+    (проверку обновлений и т.п.). При MODEL_ALLOW_DOWNLOADS=false отсутствие модели в кеше — ошибка.
+    """
+    from huggingface_hub import snapshot_download
+
+    try:
+        return snapshot_download(repo_id, local_files_only=True)
+    except (OSError, ValueError):
+        if not settings.MODEL_ALLOW_DOWNLOADS:
+            raise
+        return repo_id
+
+
+def warmup_names() -> list[str]:
+    return [name.strip() for name in settings.MODEL_WARMUP.split(",") if name.strip()]
@@ -4,13 +4,16 @@ models.py
 SQLAlchemy ORM-модели
 """
 
-from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, func, Enum
+from typing import Optional
+
+from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, func, Enum, LargeBinary, Index, Float, Computed, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
-from .sentiment_types import SentimentEnum
+from .sentiment_types import EnrichmentStatus, SentimentEnum
 
 class Movie(Base):
     __tablename__ = "movies"  # Название таблицы в базе данных
@@ -27,6 +30,17 @@ class Movie(Base):
     # Отношение "один-ко-многим": один фильм может иметь несколько отзывов
     reviews: Mapped[list["Review"]] = relationship("Review", back_populates="movie")
 
+    __table_args__ = (
+        # Поиск по подстроке названия (ILIKE '%...%') через триграммы pg_trgm
+        Index("ix_movies_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
+
+# Индексу ix_movies_title_trgm нужно расширение pg_trgm (create_all на пустой БД)
+event.listen(Movie.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+# Конфигурация полнотекстового поиска по отзывам (данные на русском)
+SEARCH_CONFIG = "russian"
+
 class Review(Base):
     __tablename__ = "reviews"  # Название таблицы в базе данных
 
@@ -44,7 +58,21 @@ class Review(Base):
     # Текст отзыва (обязательное поле)
     review_text: Mapped[str] = mapped_column(Text, nullable=False)
 
-    sentiment: Mapped[SentimentEnum] = mapped_column(Enum(SentimentEnum), nullable=False)
+    # Лемматизированный текст без стоп-слов для кластеризации; считается при записи (app/text_preprocessing.py)
+    processed_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Лексемы текста для полнотекстового поиска; столбец вычисляет сама PostgreSQL при записи
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}', review_text)", persisted=True), deferred=True
+    )
+
+    # Тональность; NULL, пока отзыв ждёт обогащения в очереди (ENRICHMENT_MODE=queue)
+    sentiment: Mapped[Optional[SentimentEnum]] = mapped_column(Enum(SentimentEnum), nullable=True)
+
+    # Посчитаны ли тональность, эмбеддинг и агрегаты фильма (app/worker.py)
+    enrichment_status: Mapped[EnrichmentStatus] = mapped_column(
+        Enum(EnrichmentStatus), nullable=False, default=EnrichmentStatus.done, server_default=EnrichmentStatus.done.value
+    )
 
     # Дата и время создания отзыва, по умолчанию — текущее время
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
@@ -53,6 +81,41 @@ class Review(Base):
     movie: Mapped[Movie] = relationship("Movie", back_populates="reviews")
     user: Mapped["User"] = relationship("User", back_populates="reviews")
 
+    # Предвычисленный эмбеддинг текста отзыва (один к одному)
+    embedding: Mapped["ReviewEmbedding"] = relationship(
+        "ReviewEmbedding", back_populates="review", uselist=False, cascade="all, delete-orphan"
+    )
+
+    __table_args__ = (
+        # GET /reviews: ORDER BY created_at DESC, id DESC и keyset-условие (created_at, id) < курсор
+        Index("ix_reviews_created_at_id", "created_at", "id"),
+        # Полнотекстовый поиск: search_vector @@ websearch_to_tsquery(...)
+        Index("ix_reviews_search_vector", "search_vector", postgresql_using="gin"),
+        # Отзывы пользователя (рекомендатели, anti-join «уже оценил») и его положительные отзывы (семантические рекомендации)
+        Index("ix_reviews_user_id_sentiment", "user_id", "sentiment"),
+        # Отзывы фильма от новых к старым (GET /reviews?movie=...), каскадные удаления по movie_id
+        Index("ix_reviews_movie_id_created_at", "movie_id", "created_at"),
+        # GET /reviews?sentiment=...: фильтр и keyset-сортировка одним индексом
+        Index("ix_reviews_sentiment_created_at_id", "sentiment", "created_at", "id"),
+    )
+
+class ReviewEmbedding(Base):
+    __tablename__ = "review_embeddings"
+
+    # Один эмбеддинг на отзыв — ID отзыва одновременно является первичным ключом
+    review_id: Mapped[int] = mapped_column(ForeignKey("reviews.id", ondelete="CASCADE"), primary_key=True)
+
+    # Версия модели, которой посчитан вектор; при смене модели строка считается устаревшей
+    model_version: Mapped[str] = mapped_column(String, nullable=False, index=True)
+
+    # Нормализованный вектор float32, сохранённый как сырые байты
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    # По нему процессы API находят эмбеддинги, которых ещё нет в их индексе фильмов (MovieIndex.sync)
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now(), index=True)
+
+    review: Mapped[Review] = relationship("Review", back_populates="embedding")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -62,3 +125,68 @@ class User(Base):
     hashed_password: Mapped[str] = mapped_column(String, nullable=False)
 
     reviews: Mapped[list["Review"]] = relationship("Review", back_populates="user")
+
+class EnrichmentJob(Base):
+    """Задача обогащения отзыва в очереди; разбирается python -m app.worker через FOR UPDATE SKIP LOCKED."""
+    __tablename__ = "enrichment_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    # Одна задача на отзыв; удаляется вместе с отзывом и после успешного обогащения
+    review_id: Mapped[int] = mapped_column(ForeignKey("reviews.id", ondelete="CASCADE"), unique=True, nullable=False)
+
+    # Сколько попыток уже упало и когда можно брать задачу снова (экспоненциальная задержка);
+    # run_after = NULL — попытки исчерпаны, отзыв помечен failed
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    run_after: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True, default=func.now())
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+
+    __table_args__ = (
+        # Выборка готовых задач: WHERE run_after <= now() ORDER BY run_after, id
+        Index("ix_enrichment_jobs_run_after_id", "run_after", "id"),
+    )
+
+class MovieStats(Base):
+    """Агрегаты по отзывам фильма; поддерживаются при вставке отзыва и пересчитываются python -m app.movie_stats."""
+    __tablename__ = "movie_stats"
+
+    movie_id: Mapped[int] = mapped_column(ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+
+    # Количество отзывов по тональности
+    positive_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    neutral_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    negative_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # Сумма и количество оценок — средняя оценка = rating_sum / rating_count
+    rating_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rating_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    updated_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Рекомендатель популярного: ORDER BY positive_count DESC, movie_id DESC LIMIT k (обратный скан индекса)
+        Index("ix_movie_stats_positive_count_movie_id", "positive_count", "movie_id"),
+    )
+
+
+class MovieNeighbor(Base):
+    """Предрасчитанные top-K похожих фильмов по совместным оценкам (python -m app.item_neighbors)."""
+    __tablename__ = "movie_neighbors"
+
+    movie_id: Mapped[int] = mapped_column(ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    neighbor_id: Mapped[int] = mapped_column(ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+
+    # Косинусное сходство столбцов матрицы оценок и место соседа в списке (0 — самый похожий)
+    similarity: Mapped[float] = mapped_column(Float, nullable=False)
+    rank: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class MovieCluster(Base):
+    """Тематический кластер фильма по текстам отзывов (python -m app.clustering)."""
+    __tablename__ = "movie_clusters"
+
+    movie_id: Mapped[int] = mapped_column(ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    cluster_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    assigned_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
@@ -0,0 +1,311 @@
+"""
+movie_index.py - долгоживущий FAISS-индекс векторов фильмов.
+
+Индекс строится один раз при старте приложения (или читается с диска) и
+обновляется инкрементально при добавлении отзыва: для фильма пересчитывается
+бегущее среднее эмбеддингов, после чего его вектор заменяется в индексе
+через remove_ids/add_with_ids. Запрос рекомендаций стоит один index.search.
+
+Тип индекса задаётся settings.FAISS_INDEX_KIND. IVF-индексы обучаются на
+подвыборке при полной сборке; пока векторов слишком мало для обучения,
+используется точный flat-индекс. HNSW не поддерживает remove_ids, поэтому
+изменённые фильмы копятся и индекс пересобирается из памяти не чаще
+раза в FAISS_REBUILD_INTERVAL секунд.
+
+add_review видит только отзывы своего процесса, а эмбеддинги пишут и другие воркеры uvicorn,
+app.worker, app.ingest и бэкфилл. Поэтому индекс помнит отметку времени БД (watermark),
+до которой он согласован с review_embeddings, и раз в MOVIE_INDEX_SYNC_SECONDS перечитывает
+фильмы с более новыми эмбеддингами (sync). Отметка сохраняется вместе с индексом, и после
+загрузки с диска индекс сначала догоняет БД.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .embedding_store import load_movie_vector_sums
+from .metrics import timed
+from .model_registry import MLDisabledError
+from .models import Review, ReviewEmbedding
+from .semantic_embeddings import EMBEDDING_VERSION, make_faiss_index, set_search_params, train_faiss_index
+
+if TYPE_CHECKING:
+    import faiss
+
+# Запас окна sync: created_at эмбеддинга ставится в момент вставки (clock_timestamp), а виден он только
+# после коммита писателя. Все писатели (create_review, app.worker, app.ingest, бэкфилл) вставляют эмбеддинги
+# последним оператором перед коммитом, после инференса и обновления movie_stats, так что разрыв — это
+# время самого upsert и коммита. Строку, закоммиченную позже чем через SYNC_OVERLAP_SECONDS после вставки,
+# подтянет только полная пересборка индекса
+SYNC_OVERLAP_SECONDS = 60
+
+
+class MovieIndex:
+    """Индекс фильмов, в котором ID вектора в FAISS = ID фильма."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._index: Optional["faiss.Index"] = None
+        # Суммы эмбеддингов и число отзывов по фильму — для бегущего среднего
+        self._sums: dict[int, np.ndarray] = {}
+        self._counts: dict[int, int] = {}
+        self._kind = "flat"
+        # Фильмы, чей вектор изменился, но ещё не заменён в индексе (только для HNSW)
+        self._pending: set[int] = set()
+        self._built_at = 0.0
+        # Время БД, до которого индекс согласован с review_embeddings (watermark)
+        self._synced_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._sums)
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        return (vector / np.linalg.norm(vector)).astype("float32")
+
+    def _new_index(self, vectors: np.ndarray) -> "faiss.Index":
+        """Создаёт (и при необходимости обучает) индекс настроенного типа под данный набор векторов."""
+        import faiss
+
+        kind = settings.FAISS_INDEX_KIND
+        if len(vectors) < self._min_train_size():
+            # Слишком мало точек для обучения кластеров — точный поиск здесь и так быстрый
+            kind = "flat"
+        index = make_faiss_index(
+            vectors.shape[1],
+            kind,
+            nlist=settings.FAISS_NLIST,
+            hnsw_m=settings.FAISS_HNSW_M,
+            pq_m=settings.FAISS_PQ_M,
+        )
+        if kind in ("flat", "hnsw"):
+            # IVF-индексы сами хранят произвольные ID; flat и HNSW — только через обёртку
+            index = faiss.IndexIDMap2(index)
+        train_faiss_index(index, vectors, settings.FAISS_TRAIN_SAMPLE)
+        self._kind = kind
+        return index
+
+    @staticmethod
+    def _min_train_size() -> int:
+        """Минимальное число векторов для обучения настроенного типа индекса."""
+        if settings.FAISS_INDEX_KIND == "ivf_flat":
+            return 39 * settings.FAISS_NLIST
+        if settings.FAISS_INDEX_KIND == "ivf_pq":
+            return max(39 * settings.FAISS_NLIST, 256)  # PQ8 обучает 256 центроидов на подвектор
+        return 0
+
+    def _can_upgrade(self) -> bool:
+        """Набралось ли достаточно фильмов, чтобы заменить временный flat-индекс на настроенный."""
+        return self._kind != settings.FAISS_INDEX_KIND and len(self._sums) >= self._min_train_size()
+
+    @timed("faiss_build")
+    def _rebuild(self) -> None:
+        """Пересобирает FAISS-индекс из сумм, уже лежащих в памяти (без обращения к БД)."""
+        self._pending.clear()
+        self._built_at = time.monotonic()
+        if not self._sums:
+            self._index = None
+            return
+        ids = np.fromiter(self._sums.keys(), dtype="int64", count=len(self._sums))
+        vectors = np.stack([self._normalize(self._sums[movie_id]) for movie_id in ids.tolist()])
+        index = self._new_index(vectors)
+        index.add_with_ids(vectors, ids)
+        self._index = index
+
+    @staticmethod
+    def _db_now(db: Session) -> datetime:
+        return db.scalar(select(func.localtimestamp()))
+
+    def build(self, db: Session) -> None:
+        """Полностью строит индекс по эмбеддингам из БД."""
+        # Отметка до чтения: эмбеддинги, записанные во время чтения, подтянет следующий sync
+        synced_at = self._db_now(db)
+        movie_ids, sums, counts = load_movie_vector_sums(db)
+        with self._lock:
+            self._sums = {movie_id: sums[i].copy() for i, movie_id in enumerate(movie_ids)}
+            self._counts = {movie_id: int(counts[i]) for i, movie_id in enumerate(movie_ids)}
+            self._rebuild()
+            self._synced_at = synced_at
+
+    def add_review(self, movie_id: int, embedding: np.ndarray) -> None:
+        """Учитывает эмбеддинг нового отзыва в векторе фильма."""
+        embedding = np.asarray(embedding, dtype="float32")
+        with self._lock:
+            is_new = movie_id not in self._sums
+            if is_new:
+                self._sums[movie_id] = embedding.copy()
+                self._counts[movie_id] = 1
+            else:
+                self._sums[movie_id] = self._sums[movie_id] + embedding
+                self._counts[movie_id] += 1
+
+            self._update_vector(movie_id, is_new)
+
+    def _update_vector(self, movie_id: int, is_new: bool) -> None:
+        """Заменяет вектор фильма в FAISS-индексе после изменения его суммы (вызывается под self._lock)."""
+        if self._index is None or (is_new and self._can_upgrade()):
+            self._rebuild()
+            return
+
+        ids = np.array([movie_id], dtype="int64")
+        if not is_new:
+            if self._kind == "hnsw":
+                self._pending.add(movie_id)
+                return
+            self._index.remove_ids(ids)
+        self._index.add_with_ids(self._normalize(self._sums[movie_id]).reshape(1, -1), ids)
+
+    def refresh_movies(self, db: Session, movie_ids: list[int]) -> int:
+        """
+        Перечитывает из БД суммы эмбеддингов указанных фильмов и заменяет их векторы.
+        В отличие от add_review, повторный вызов для тех же фильмов ничего не портит.
+
+        Returns:
+            int: число фильмов, у которых нашлись эмбеддинги.
+        """
+        if not movie_ids:
+            return 0
+        loaded_ids, sums, counts = load_movie_vector_sums(db, movie_ids)
+        with self._lock:
+            for i, movie_id in enumerate(loaded_ids):
+                is_new = movie_id not in self._sums
+                self._sums[movie_id] = sums[i].copy()
+                self._counts[movie_id] = int(counts[i])
+                self._update_vector(movie_id, is_new)
+        return len(loaded_ids)
+
+    def sync(self, db: Session) -> int:
+        """
+        Перечитывает фильмы, у которых появились эмбеддинги новее отметки (review_embeddings.created_at).
+
+        created_at ставится при вставке или перезаписи эмбеддинга, но виден только после коммита
+        писателя, поэтому окно берётся с запасом SYNC_OVERLAP_SECONDS; фильмы из перекрытия
+        просто перечитываются ещё раз.
+
+        Returns:
+            int: число перечитанных фильмов.
+        """
+        now = self._db_now(db)
+        since = (self._synced_at or now) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        movie_ids = list(db.scalars(
+            select(Review.movie_id)
+            .join(ReviewEmbedding, ReviewEmbedding.review_id == Review.id)
+            .where(ReviewEmbedding.created_at >= since)
+            .distinct()
+        ))
+        refreshed = self.refresh_movies(db, movie_ids)
+        self._synced_at = now
+        return refreshed
+
+    @timed("faiss_search")
+    def search(
+        self,
+        query_vector: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> list[int]:
+        """
+        Возвращает ID до k ближайших фильмов (по косинусному сходству).
+
+        Args:
+            nprobe (int, optional): число просматриваемых кластеров для IVF-индексов.
+            ef_search (int, optional): ширина поиска для HNSW.
+        """
+        if not settings.ENABLE_ML:
+            # При ENABLE_ML=false индекс не загружается; пустой список выглядел бы как «рекомендаций нет»
+            # и попал бы в кеш рекомендаций, а MLDisabledError даёт HTTP 503
+            raise MLDisabledError("movie index requested but ENABLE_ML is false")
+        with self._lock:
+            if self._pending and time.monotonic() - self._built_at >= settings.FAISS_REBUILD_INTERVAL:
+                self._rebuild()
+            if self._index is None or self._index.ntotal == 0:
+                return []
+            # Параметры выставляются под блокировкой, поэтому их можно менять на каждый запрос
+            set_search_params(
+                self._index,
+                nprobe=nprobe or settings.FAISS_NPROBE,
+                ef_search=ef_search or settings.FAISS_EF_SEARCH,
+            )
+            query = np.asarray(query_vector, dtype="float32").reshape(1, -1)
+            _, ids = self._index.search(query, min(k, self._index.ntotal))
+        return [int(movie_id) for movie_id in ids[0] if movie_id >= 0]
+
+    def save(self, path: str = settings.MOVIE_INDEX_PATH) -> None:
+        """
+        Сохраняет индекс, суммы векторов и отметку синхронизации в один файл path.npz.
+
+        Файл пишется во временный и подменяется через os.replace: воркеры uvicorn, сохраняющие
+        индекс одновременно при остановке, не смешивают данные, а читатель не видит недописанный файл.
+        """
+        import faiss
+
+        with self._lock:
+            if self._pending:
+                self._rebuild()
+            if self._index is None or self._synced_at is None:
+                return
+            movie_ids = list(self._sums.keys())
+            data = {
+                "version": np.array(EMBEDDING_VERSION),
+                "kind": np.array(self._kind),
+                "synced_at": np.array(self._synced_at.isoformat()),
+                "index": faiss.serialize_index(self._index),
+                "movie_ids": np.array(movie_ids, dtype="int64"),
+                "sums": np.stack([self._sums[m] for m in movie_ids]),
+                "counts": np.array([self._counts[m] for m in movie_ids], dtype="int64"),
+            }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, **data)
+            os.replace(tmp_path, f"{path}.npz")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, path: str = settings.MOVIE_INDEX_PATH) -> bool:
+        """
+        Загружает индекс с диска. Векторы, записанные в БД после сохранения, файл не содержит —
+        их подтягивает sync (см. load_or_build).
+
+        Returns:
+            bool: False, если файла нет, он старого формата или посчитан другой версией модели.
+        """
+        if not os.path.exists(f"{path}.npz"):
+            return False
+        data = np.load(f"{path}.npz")
+        if "synced_at" not in data.files or str(data["version"]) != EMBEDDING_VERSION:
+            return False
+        if str(data["kind"]) not in (settings.FAISS_INDEX_KIND, "flat"):
+            return False  # тип индекса поменялся в настройках — пересобираем
+        import faiss
+
+        with self._lock:
+            self._index = faiss.deserialize_index(data["index"])
+            self._kind = str(data["kind"])
+            self._pending.clear()
+            self._built_at = time.monotonic()
+            self._sums = {int(m): data["sums"][i] for i, m in enumerate(data["movie_ids"])}
+            self._counts = {int(m): int(data["counts"][i]) for i, m in enumerate(data["movie_ids"])}
+            self._synced_at = datetime.fromisoformat(str(data["synced_at"]))
+        return True
+
+    def load_or_build(self, db: Session, path: str = settings.MOVIE_INDEX_PATH) -> None:
+        """Читает индекс с диска и догоняет по БД, а при отсутствии файла строит по БД и сохраняет."""
+        if self.load(path):
+            self.sync(db)
+        else:
+            self.build(db)
+            self.save(path)
+
+
+# Единственный экземпляр индекса на процесс приложения
+movie_index = MovieIndex()
@@ -0,0 +1,100 @@
+"""
+movie_stats.py - материализованные агрегаты отзывов по фильмам (таблица movie_stats).
+
+Агрегаты инкрементально обновляются в той же транзакции, что и вставка отзыва
+(при ENRICHMENT_MODE=queue — в транзакции воркера, посчитавшего тональность).
+Полный пересчёт (например, по расписанию или после ручных правок в reviews):
+
+    python -m app.movie_stats
+"""
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import MovieStats, Review
+from .sentiment_types import EnrichmentStatus, SentimentEnum
+
+COUNTERS = ("positive_count", "neutral_count", "negative_count", "rating_sum", "rating_count")
+
+
+def _increment_stmt(reviews: Iterable[tuple[int, SentimentEnum, int]]):
+    """
+    Строит upsert, прибавляющий вклад пачки отзывов к агрегатам их фильмов.
+
+    Args:
+        reviews: тройки (movie_id, sentiment, rating).
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for movie_id, sentiment, rating in reviews:
+        delta = deltas[movie_id]
+        delta[f"{SentimentEnum(sentiment).value}_count"] += 1
+        delta["rating_sum"] += rating
+        delta["rating_count"] += 1
+    if not deltas:
+        return None
+
+    stmt = pg_insert(MovieStats).values([{"movie_id": movie_id, **delta} for movie_id, delta in deltas.items()])
+    return stmt.on_conflict_do_update(
+        index_elements=[MovieStats.movie_id],
+        set_={
+            **{name: getattr(MovieStats, name) + getattr(stmt.excluded, name) for name in COUNTERS},
+            "updated_at": func.now(),
+        },
+    )
+
+
+def record_reviews(db: Session, reviews: Iterable[tuple[int, SentimentEnum, int]]) -> None:
+    """Учитывает новые отзывы в movie_stats. Коммит остаётся на стороне вызывающего кода."""
+    stmt = _increment_stmt(reviews)
+    if stmt is not None:
+        db.execute(stmt)
+
+
+async def record_reviews_async(db: AsyncSession, reviews: Iterable[tuple[int, SentimentEnum, int]]) -> None:
+    """Асинхронный вариант record_reviews."""
+    stmt = _increment_stmt(reviews)
+    if stmt is not None:
+        await db.execute(stmt)
+
+
+def refresh_movie_stats(db: Session) -> int:
+    """
+    Полностью пересчитывает movie_stats по таблице reviews одной транзакцией.
+
+    Returns:
+        int: количество фильмов с агрегатами.
+    """
+    def count_of(sentiment: SentimentEnum):
+        return func.count(case((Review.sentiment == sentiment, 1)))
+
+    aggregates = select(
+        Review.movie_id,
+        count_of(SentimentEnum.positive),
+        count_of(SentimentEnum.neutral),
+        count_of(SentimentEnum.negative),
+        func.sum(Review.rating),
+        func.count(Review.id),
+    ).where(
+        # Отзывы из очереди обогащения учтёт app.worker, когда посчитает их тональность
+        Review.enrichment_status == EnrichmentStatus.done
+    ).group_by(Review.movie_id)
+
+    db.execute(delete(MovieStats))
+    result = db.execute(insert(MovieStats).from_select(["movie_id", *COUNTERS], aggregates))
+    db.commit()
+    return result.rowcount
+
+
+def main() -> None:
+    with SessionLocal() as db:
+        total = refresh_movie_stats(db)
+    print(f"movie_stats refreshed for {total} movies")
+
+
+if __name__ == "__main__":
+    main()
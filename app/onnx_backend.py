@@ -0,0 +1,242 @@
+"""
+onnx_backend.py - инференс тональности и эмбеддингов через ONNX Runtime (MODEL_RUNTIME=onnx).
+
+Модели экспортируются один раз (нужны torch и transformers — например, при сборке образа):
+
+    python -m app.onnx_backend export              # float32
+    python -m app.onnx_backend export --quantize   # + динамическое int8-квантование весов
+
+В ONNX_MODEL_DIR появляются каталоги sentiment/ и embeddings/ с model.onnx,
+model.int8.onnx (после --quantize), файлами токенизатора и meta.json.
+Во время работы torch не нужен: только токенизатор и onnxruntime.
+
+Настройки:
+  * ONNX_QUANTIZED=true — использовать int8-версию моделей;
+  * ONNX_INTRA_OP_THREADS — потоки внутри одного прогона модели (0 — решает ONNX Runtime).
+
+Точность и скорость относительно PyTorch: python benchmarks/onnx_parity.py
+"""
+import argparse
+import json
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+from .metrics import timed
+from .model_registry import huggingface_path
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+META_FILE = "meta.json"
+
+# opset 17 поддерживают и onnxruntime, и экспортёр torch из requirements
+OPSET_VERSION = 17
+
+# Пример для трассировки: два текста разной длины, чтобы паддинг попал в граф
+_SAMPLE_TEXTS = ["Отличный фильм, всем советую!", "Скучно."]
+
+
+def model_dir(name: str) -> str:
+    return os.path.join(settings.ONNX_MODEL_DIR, name)
+
+
+def _session(path: str, threads: Optional[int] = None):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS if threads is None else threads
+    # Параллелизм между запросами дают MicroBatcher и пул потоков, а не ORT
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class OnnxModel:
+    """Токенизатор + сессия ONNX Runtime для одной экспортированной модели."""
+
+    # Префикс этапов в метриках (app/metrics.py)
+    stage = "onnx"
+
+    def __init__(self, directory: str, quantized: Optional[bool] = None, threads: Optional[int] = None):
+        from transformers import AutoTokenizer
+
+        quantized = settings.ONNX_QUANTIZED if quantized is None else quantized
+        path = os.path.join(directory, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        if not os.path.isfile(path):
+            hint = "export --quantize" if quantized else "export"
+            raise FileNotFoundError(f"{path} not found, run: python -m app.onnx_backend {hint}")
+
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.session = _session(path, threads)
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.quantized = quantized
+
+    def run(self, texts: list[str]) -> np.ndarray:
+        with timed(f"{self.stage}_tokenize"):
+            encoded = self.tokenizer(
+                texts, padding=True, truncation=True, max_length=self.meta["max_length"], return_tensors="np"
+            )
+            feed = {name: encoded[name].astype("int64") for name in self.input_names}
+        with timed(f"{self.stage}_forward"):
+            return self.session.run(None, feed)[0]
+
+
+class OnnxClassifier(OnnxModel):
+    """Классификатор тональности: логиты пачки текстов."""
+
+    stage = "sentiment"
+
+    def logits(self, texts: list[str]) -> np.ndarray:
+        return self.run(texts)
+
+
+class OnnxSentenceEncoder(OnnxModel):
+    """Энкодер с mean pooling внутри графа; encode повторяет интерфейс SentenceTransformer.encode."""
+
+    stage = "embeddings"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.meta["dim"]
+
+    def encode(self, texts: list[str], batch_size: int = 64, normalize_embeddings: bool = True) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.meta["dim"]), dtype="float32")
+        # Как SentenceTransformer: пачки из текстов близкой длины — меньше паддинга
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), self.meta["dim"]), dtype="float32")
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            embeddings[idx] = self.run([texts[i] for i in idx])
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+
+def load_sentiment(quantized: Optional[bool] = None, threads: Optional[int] = None) -> OnnxClassifier:
+    return OnnxClassifier(model_dir("sentiment"), quantized, threads)
+
+
+def load_embeddings(quantized: Optional[bool] = None, threads: Optional[int] = None) -> OnnxSentenceEncoder:
+    return OnnxSentenceEncoder(model_dir("embeddings"), quantized, threads)
+
+
+def _export(module, tokenizer, directory: str, output_name: str, meta: dict) -> str:
+    """Трассирует module(input_ids, attention_mask[, token_type_ids]) в directory/model.onnx."""
+    import torch
+
+    os.makedirs(directory, exist_ok=True)
+    sample = tokenizer(_SAMPLE_TEXTS, padding=True, truncation=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"}
+
+    path = os.path.join(directory, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            tuple(sample[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET_VERSION,
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(directory)
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    logger.info("exported %s to %s", meta["model"], path)
+    return path
+
+
+def export_sentiment(directory: Optional[str] = None) -> str:
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    from .sentiment import MODEL_NAME, labels
+
+    path = huggingface_path(MODEL_NAME)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    model = AutoModelForSequenceClassification.from_pretrained(path)
+
+    class Classifier(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).logits
+
+    meta = {"model": MODEL_NAME, "max_length": min(tokenizer.model_max_length, 512), "labels": labels}
+    return _export(Classifier().eval(), tokenizer, directory or model_dir("sentiment"), "logits", meta)
+
+
+def export_embeddings(directory: Optional[str] = None) -> str:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    from .semantic_embeddings import EMBEDDING_MODEL_NAME
+
+    repo_id = f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+    st_model = SentenceTransformer(huggingface_path(repo_id), device="cpu")
+    transformer = st_model[0]
+
+    class MeanPooledEncoder(torch.nn.Module):
+        """Трансформер + mean pooling по маске внимания (нормализация — в OnnxSentenceEncoder.encode)."""
+
+        def __init__(self):
+            super().__init__()
+            self.model = transformer.auto_model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            hidden = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+
+    meta = {
+        "model": repo_id,
+        "max_length": transformer.max_seq_length,
+        "dim": st_model.get_sentence_embedding_dimension(),
+    }
+    return _export(MeanPooledEncoder().eval(), transformer.tokenizer, directory or model_dir("embeddings"), "embedding", meta)
+
+
+def quantize(directory: str) -> str:
+    """Динамическое int8-квантование: веса MatMul хранятся в int8, активации квантуются на лету."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(directory, MODEL_FILE)
+    target = os.path.join(directory, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    logger.info("quantized %s -> %s (%.1f -> %.1f MB)", source, target,
+                os.path.getsize(source) / 2**20, os.path.getsize(target) / 2**20)
+    return target
+
+
+EXPORTERS = {"sentiment": export_sentiment, "embeddings": export_embeddings}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Экспорт моделей тональности и эмбеддингов в ONNX")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="экспортировать модели в ONNX_MODEL_DIR")
+    export.add_argument("--model", choices=sorted(EXPORTERS), action="append", help="какие модели (по умолчанию все)")
+    export.add_argument("--quantize", action="store_true", help="дополнительно сохранить int8-версию")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for name in args.model or list(EXPORTERS):
+        EXPORTERS[name]()
+        if args.quantize:
+            quantize(model_dir(name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+pagination.py - курсоры keyset-пагинации.
+
+Курсор — непрозрачная для клиента строка (base64url от JSON) с ключом сортировки
+последней строки страницы: (created_at, id) для ленты отзывов или (rank, id) для
+поиска. Следующая страница начинается строго после этого ключа, поэтому её стоимость
+не зависит от того, насколько далеко клиент пролистал, а новые отзывы не сдвигают
+уже выданные страницы.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable
+
+
+def encode_cursor(*key: Any) -> str:
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, *parsers: Callable[[Any], Any]) -> tuple:
+    """
+    Разбирает курсор из encode_cursor: каждое значение ключа — своим парсером
+    (например, datetime.fromisoformat, int). При любом искажении — ValueError.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("wrong cursor length")
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as exc:
+        raise ValueError(f"invalid cursor: {cursor!r}") from exc
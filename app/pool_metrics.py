@@ -0,0 +1,125 @@
+"""
+pool_metrics.py - метрики пулов соединений SQLAlchemy.
+
+Для каждого движка считаются:
+  * checked_out — сколько соединений сейчас выдано из пула;
+  * checkouts_total / wait_seconds_total / wait_seconds_max — сколько раз брали
+    соединение и сколько ждали его (включая установку нового соединения);
+  * overflow_events_total — сколько раз пул открывал соединение сверх pool_size;
+  * timeouts_total — сколько раз ожидание закончилось TimeoutError.
+
+Время ожидания меряется в подклассе пула вокруг _do_get, поэтому метрики
+одинаково работают для QueuePool, AsyncAdaptedQueuePool и NullPool.
+QueuePool._do_get рекурсивно вызывает себя на ветках overflow и повтора —
+пишет метрики только внешний вызов.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+
+class PoolMetrics:
+    """Потокобезопасные счётчики одного пула."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.checkouts_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_events_total = 0
+        self.timeouts_total = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts_total += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "checkouts_total": self.checkouts_total,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "overflow_events_total": self.overflow_events_total,
+                "timeouts_total": self.timeouts_total,
+            }
+
+
+# Метрики по имени движка ("sync", "async")
+registry: dict[str, PoolMetrics] = {}
+
+# Признак «уже внутри _do_get». Не threading.local: асинхронный пул ждёт соединение в гринлетах
+# одного потока, и у каждого запроса (задачи asyncio) свой контекст
+_in_do_get: ContextVar[bool] = ContextVar("pool_in_do_get", default=False)
+
+
+def instrumented_pool(pool_cls: type[Pool], name: str) -> type[Pool]:
+    """
+    Возвращает подкласс pool_cls, который пишет метрики в registry[name].
+    Подкласс переживает engine.dispose(): пул пересоздаётся через self.__class__.
+    """
+    metrics = registry.setdefault(name, PoolMetrics())
+
+    def _do_get(self):
+        if _in_do_get.get():
+            return pool_cls._do_get(self)
+        token = _in_do_get.set(True)
+        start = time.perf_counter()
+        try:
+            return pool_cls._do_get(self)
+        except exc.TimeoutError:
+            metrics.increment("timeouts_total")
+            raise
+        finally:
+            metrics.record_wait(time.perf_counter() - start)
+            _in_do_get.reset(token)
+
+    namespace = {"_do_get": _do_get, "metrics": metrics}
+
+    if hasattr(pool_cls, "_inc_overflow"):
+        def _inc_overflow(self):
+            created = pool_cls._inc_overflow(self)
+            # _overflow отсчитывается от -pool_size: положительное значение — соединения сверх пула
+            if created and self._overflow > 0:
+                metrics.increment("overflow_events_total")
+            return created
+
+        namespace["_inc_overflow"] = _inc_overflow
+
+    return type(f"Instrumented{pool_cls.__name__}", (pool_cls,), namespace)
+
+
+def track_checkouts(engine: Engine, name: str) -> None:
+    """Подписывается на события пула движка, чтобы считать выданные соединения."""
+    metrics = registry.setdefault(name, PoolMetrics())
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.increment("checked_out")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.increment("checked_out", -1)
+
+
+def pool_status(engine: Engine) -> dict:
+    """Текущее состояние пула движка: размер и overflow (для QueuePool) плюс накопленные метрики."""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__mro__[1].__name__}
+    if hasattr(pool, "size") and hasattr(pool, "overflow"):
+        status.update({"size": pool.size(), "overflow": max(pool.overflow(), 0)})
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
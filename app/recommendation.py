@@ -1,26 +1,28 @@
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .models import Review, Movie
-from collections import Counter
-from .sentiment_types import SentimentEnum
+from .metrics import timed
+from .models import Review, Movie, MovieStats
 
-def recommend_movies_for_user(user_id: int, db: Session, top_k=5) -> list[str]:
-    # Получаем фильмы, которые пользователь уже оценил (любые отзывы)
-    watched_movie_ids = set(
-        r.movie_id for r in db.query(Review).filter_by(user_id=user_id).all()
+def _popular_unwatched_query(user_id: int, top_k: int):
+    """
+    Топ-K фильмов по числу положительных отзывов (из movie_stats),
+    исключая фильмы, которые пользователь уже оценил (anti-join по reviews).
+    """
+    watched = exists().where(Review.user_id == user_id, Review.movie_id == MovieStats.movie_id)
+    return (
+        select(Movie.title)
+        .join(MovieStats, MovieStats.movie_id == Movie.id)
+        .where(MovieStats.positive_count > 0, ~watched)
+        .order_by(MovieStats.positive_count.desc(), MovieStats.movie_id.desc())
+        .limit(top_k)
     )
-    
-    # Получаем все положительные отзывы всех пользователей
-    positive_reviews = db.query(Review).filter_by(sentiment=SentimentEnum.positive).all()
-    
-    # Считаем популярность фильмов среди всех пользователей
-    popular_movies_counter = Counter(r.movie.title for r in positive_reviews)
-    
-    # Исключаем фильмы, которые пользователь уже смотрел
-    for watched_id in watched_movie_ids:
-        movie = db.query(Movie).filter_by(id=watched_id).first()
-        if movie and movie.title in popular_movies_counter:
-            del popular_movies_counter[movie.title]
-    
-    # Возвращаем топ-K популярных фильмов, которые пользователь не смотрел
-    top_movies = [movie for movie, _ in popular_movies_counter.most_common(top_k)]
-    return top_movies
+
+@timed("recommend_popular")
+def recommend_movies_for_user(user_id: int, db: Session, top_k=5) -> list[str]:
+    # Один индексированный запрос: стоимость не зависит от общего числа отзывов
+    return list(db.scalars(_popular_unwatched_query(user_id, top_k)).all())
+
+@timed("recommend_popular")
+async def recommend_movies_for_user_async(user_id: int, db: AsyncSession, top_k=5) -> list[str]:
+    return list((await db.scalars(_popular_unwatched_query(user_id, top_k))).all())
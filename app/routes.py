@@ -3,82 +3,105 @@ routes.py
 
 Эндпоинты FastAPI для отзывов о фильмах.
 """
+import io
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, File, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from . import schemas, crud
-from .database import get_db
+from .config import settings
+from .database import get_db, get_async_db, engine, async_engine, AsyncSessionLocal
+from .pool_metrics import pool_status
+from .model_registry import registry
+from .cache import recommendation_cache
+from . import metrics
+from . import inference_cache
+from .executor import run_in_model_executor
 
-from .sentiment import classify_sentiment
-from .recommendation import recommend_movies_for_user
+from .recommendation import recommend_movies_for_user_async
 
 from fastapi import Depends, HTTPException, status
-from .auth import get_current_user
+from .auth import Principal, get_current_user
 from . import models
 from .models import User
 from . import auth
 from fastapi.security import OAuth2PasswordRequestForm
 
-from .semantic_recommender import get_semantic_recommendations
+from .semantic_recommender import get_semantic_recommendations_async
 
-from .clustering import cluster_movies_by_reviews
+from .clustering import cluster_movies_by_reviews_async
 
-from .collaborative_filtering import collaborative_filtering_recommendations
+from .collaborative_filtering import collaborative_filtering_recommendations_async, item_based_recommendations_async
+
+from .als_recommender import als_recommendations_async
+
+from .ingest import ingest_reviews, read_rows, IngestReport
+
+from .export import MEDIA_TYPES, export_chunks_async
 
 router = APIRouter()
 
 @router.post("/register", response_model=schemas.UserRead)
-def register_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == user_in.email).first()
+async def register_user(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = (await db.execute(select(User).where(User.email == user_in.email))).scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_pw = auth.hash_password(user_in.password)
+    hashed_pw = await run_in_model_executor(auth.hash_password, user_in.password)
     user = User(name=user_in.name, email=user_in.email, hashed_password=hashed_pw)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return schemas.UserRead(id=user.id, name=user.name, email=user.email)
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)
 ):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    user = await auth.authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": str(user.id)})
+    access_token = auth.create_access_token(data=auth.token_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Пример защищенного эндпоинта:
 @router.get("/me", response_model=schemas.UserRead)
-def read_users_me(current_user: User = Depends(auth.get_current_user)):
+async def read_users_me(current_user: Principal = Depends(auth.get_current_user)):
     return schemas.UserRead(id=current_user.id, name=current_user.name, email=current_user.email)
 
 
 @router.get("/semantic-recommendations", response_model=List[str])
-def semantic_recommendation_endpoint(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def semantic_recommendation_endpoint(
+    nprobe: Optional[int] = Query(None, ge=1, description="IVF: сколько кластеров просматривать"),
+    ef_search: Optional[int] = Query(None, ge=1, description="HNSW: ширина поиска"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    return get_semantic_recommendations(db, user_id=current_user.id)
+    return await recommendation_cache.get_or_compute_async(
+        "semantic", current_user.id,
+        lambda: get_semantic_recommendations_async(db, user_id=current_user.id, nprobe=nprobe, ef_search=ef_search),
+        nprobe, ef_search,
+    )
 
 @router.post("/reviews", response_model=schemas.ReviewRead)
-def create_review_endpoint(
+async def create_review_endpoint(
     review_in: schemas.ReviewCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user) 
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user) 
 ) -> schemas.ReviewRead:
-    movie = crud.get_or_create_movie(db, review_in.movie_title)
-    sentiment = classify_sentiment(review_in.review_text)
+    movie = await crud.get_or_create_movie_async(db, review_in.movie_title)
 
-    # Теперь передаём user_id текущего пользователя
-    review = crud.create_review(db, movie.id, review_in.rating, review_in.review_text, sentiment, current_user.id)
+    # Передаём user_id текущего пользователя; тональность считается внутри create_review
+    # (или воркером очереди при ENRICHMENT_MODE=queue — тогда в ответе sentiment=null, enrichment_status=pending)
+    review = await crud.create_review_async(db, movie.id, review_in.rating, review_in.review_text, current_user.id)
 
     return schemas.ReviewRead(
         id=review.id,
@@ -86,51 +109,161 @@ def create_review_endpoint(
         rating=review.rating,
         review_text=review.review_text,
         sentiment=review.sentiment,
+        enrichment_status=review.enrichment_status,
         created_at=review.created_at,
     )
 
 
-@router.get("/reviews", response_model=List[schemas.ReviewRead])
-def list_reviews_endpoint(
+@router.post("/reviews/import", response_model=schemas.ImportReport)
+def import_reviews_endpoint(
+    file: UploadFile = File(..., description="NDJSON или CSV с полями movie_title, review_text, rating"),
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$", description="по умолчанию — по расширению файла"),
+    chunk_size: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+) -> schemas.ImportReport:
+    # Синхронный эндпоинт: длинный пакетный импорт выполняется в threadpool и не занимает event loop
+    fmt = format or ("csv" if (file.filename or "").endswith(".csv") else "ndjson")
+
+    # Файл читается потоково, чанками — целиком в память он не загружается
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    report = IngestReport()
+    ingest_reviews(db, read_rows(stream, fmt, report), current_user.id, chunk_size, report=report)
+
+    return schemas.ImportReport(
+        rows_imported=report.rows_imported,
+        rows_skipped=report.rows_skipped,
+        seconds=report.seconds,
+        rows_per_second=report.rows_per_second,
+    )
+
+
+@router.get("/reviews", response_model=List[schemas.ReviewListItem], response_model_exclude_unset=True)
+async def list_reviews_endpoint(
+    response: Response,
     movie: Optional[str] = Query(None),
     sentiment: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    fields: Optional[str] = Query(None, description="поля через запятую, например id,movie_title,rating (по умолчанию все)"),
+    q: Optional[str] = Query(None, description="поиск по тексту отзыва: слова, \"фраза\", -исключение; сортировка по релевантности"),
+    cursor: Optional[str] = Query(None, description="значение заголовка X-Next-Cursor предыдущей страницы"),
+    limit: int = Query(settings.REVIEWS_PAGE_SIZE, ge=1, le=settings.REVIEWS_PAGE_MAX_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
     
-) -> List[schemas.ReviewRead]:
-    # Получаем список отзывов (при наличии фильтра — только по фильму)
-    reviews = crud.get_reviews(db, movie_filter=movie, sentiment_filter=sentiment)
-
-    # Преобразуем объекты SQLAlchemy в Pydantic-схемы
-    return [
-        schemas.ReviewRead(
-            id=r.id,
-            movie_title=r.movie.title,
-            rating=r.rating,
-            review_text=r.review_text,
-            sentiment=r.sentiment,
-            created_at=r.created_at
-        )
-        for r in reviews
-    ]
+) -> List[schemas.ReviewListItem]:
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else list(crud.REVIEW_COLUMNS)
+    unknown = [name for name in names if name not in crud.REVIEW_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    # Страница отзывов (при наличии фильтров — только подходящие), от новых к старым
+    try:
+        rows, next_cursor = await crud.get_reviews_async(db, movie, sentiment, names, cursor, limit, search=q)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Курсор следующей страницы; заголовка нет — страница последняя
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    # Заполняем только запрошенные поля
+    return [schemas.ReviewListItem(**{name: row._mapping[name] for name in names}) for row in rows]
+
+@router.get("/reviews/export")
+async def export_reviews_endpoint(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    movie: Optional[str] = Query(None),
+    sentiment: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None, description="только отзывы, созданные не раньше (для инкрементальной выгрузки)"),
+    q: Optional[str] = Query(None, description="поиск по тексту отзыва, как в GET /reviews"),
+    current_user: Principal = Depends(get_current_user)
+) -> StreamingResponse:
+    async def body():
+        # Своя сессия: сессия из Depends закрывается раньше, чем ответ успевает отдаться
+        async with AsyncSessionLocal() as db:
+            rows = crud.iter_reviews_export_async(db, movie, sentiment, since, search=q)
+            async for chunk in export_chunks_async(rows, format):
+                yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="reviews.{format}"'},
+    )
+
 @router.get("/recommendations", response_model=List[str])
-def get_recommendations(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_recommendations(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    return recommend_movies_for_user(current_user.id, db)
+    return await recommendation_cache.get_or_compute_async(
+        "content", current_user.id, lambda: recommend_movies_for_user_async(current_user.id, db)
+    )
 
 @router.get("/clustered-movies")
-def get_clustered_movies(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_clustered_movies(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    clusters = cluster_movies_by_reviews(db)
+    # Кластеры общие для всех пользователей: кешируются без user_id
+    clusters = await recommendation_cache.get_or_compute_async("clusters", None, lambda: cluster_movies_by_reviews_async(db))
     return clusters
 
 @router.get("/collaborative-recommendations", response_model=List[str])
-def get_collaborative_recommendations(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_collaborative_recommendations(
+    method: str = Query("item", pattern="^(item|user)$"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # item — готовые списки соседей из movie_neighbors; user — сходство пользователей по матрице оценок
+    async def compute():
+        if method == "item":
+            recommendations = await item_based_recommendations_async(db, current_user.id)
+            # Если соседи ещё не посчитаны или у пользователя нет высоких оценок — используем user-based
+            if recommendations:
+                return recommendations
+        return await collaborative_filtering_recommendations_async(db, current_user.id)
+
+    return await recommendation_cache.get_or_compute_async("collaborative", current_user.id, compute, method)
+
+@router.get("/als-recommendations", response_model=List[str])
+async def get_als_recommendations(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    return collaborative_filtering_recommendations(db, current_user.id)
\ No newline at end of file
+    # Факторы обучаются офлайн (python -m app.als_recommender train); запрос — одно произведение матрицы на вектор
+    return await als_recommendations_async(db, current_user.id)
+
+
+# Метрики в формате Prometheus: задержки запросов и этапов, SQL-запросы, пулы, кеши, модели
+@router.get("/metrics")
+async def get_prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+# Метрики пулов соединений: сколько соединений выдано, сколько ждали, сколько раз уходили в overflow
+@router.get("/metrics/pool")
+async def get_pool_metrics():
+    return {
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+    }
+
+
+# Попадания и промахи кеша рекомендаций по алгоритмам
+@router.get("/metrics/cache")
+async def get_cache_metrics():
+    return recommendation_cache.stats()
+
+
+# Попадания кеша результатов моделей (тональность, эмбеддинги) по уровням: память и SQLite
+@router.get("/metrics/inference-cache")
+async def get_inference_cache_metrics():
+    return inference_cache.stats()
+
+
+# Какие модели загружены в этом процессе и сколько заняла загрузка
+@router.get("/metrics/models")
+async def get_model_metrics():
+    return registry.status()
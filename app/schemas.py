@@ -4,10 +4,11 @@ schemas.py
 Pydantic-схемы для валидации запросов и ответов.
 """
 from datetime import datetime
+from typing import Optional
 
 from pydantic import BaseModel, Field, EmailStr  
 
-from .sentiment_types import SentimentEnum
+from .sentiment_types import EnrichmentStatus, SentimentEnum
 
 
 class ReviewCreate(BaseModel):
@@ -21,9 +22,28 @@ class ReviewRead(BaseModel):
     movie_title: str                 # Название фильма
     rating: int                      # Оценка отзыва
     review_text: str                 # Содержание отзыва
-    sentiment: SentimentEnum
+    sentiment: Optional[SentimentEnum]  # None, пока отзыв ждёт обогащения (ENRICHMENT_MODE=queue)
+    enrichment_status: EnrichmentStatus
     created_at: datetime             # Время создания
 
+# Строка списка отзывов: заполняются только поля, запрошенные в ?fields=...
+# (эндпоинт отдаёт её с response_model_exclude_unset, незапрошенных полей в ответе нет)
+class ReviewListItem(BaseModel):
+    id: Optional[int] = None
+    movie_title: Optional[str] = None
+    rating: Optional[int] = None
+    review_text: Optional[str] = None
+    sentiment: Optional[SentimentEnum] = None
+    enrichment_status: Optional[EnrichmentStatus] = None
+    created_at: Optional[datetime] = None
+
+# Итог массового импорта отзывов
+class ImportReport(BaseModel):
+    rows_imported: int
+    rows_skipped: int
+    seconds: float
+    rows_per_second: float
+
 # Схема регистрации пользователя
 class UserCreate(BaseModel):
     name: str
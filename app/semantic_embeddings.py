@@ -1,24 +1,145 @@
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Optional
+
 import numpy as np
-import faiss
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from .config import settings
+from .inference_cache import InferenceCache, runtime_tag
+from .inference_client import client, use_sidecar
+from .metrics import timed
+from .model_registry import huggingface_path, registry
+
+if TYPE_CHECKING:
+    import faiss
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Версия сохранённых эмбеддингов: меняется при смене модели или способа нормализации,
+# после чего бэкфилл пересчитывает все устаревшие векторы
+EMBEDDING_VERSION = f'{EMBEDDING_MODEL_NAME}:1'
+
+def _load_model():
+    if settings.MODEL_RUNTIME == "onnx":
+        # OnnxSentenceEncoder.encode повторяет интерфейс SentenceTransformer.encode
+        from .onnx_backend import load_embeddings
+        return load_embeddings()
+    return _load_torch_model()
+
+def _load_torch_model():
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(huggingface_path(f'sentence-transformers/{EMBEDDING_MODEL_NAME}'))
+    if settings.MODEL_WEIGHTS_MMAP:
+        from .mmap_weights import share_weights
+        # Веса трансформера лежат в корне репозитория модели, модуль — первый в пайплайне SentenceTransformer
+        share_weights(model[0].auto_model, huggingface_path(f'sentence-transformers/{EMBEDDING_MODEL_NAME}'))
+    return model
+
+# Модель грузится при первом вычислении эмбеддинга (или при прогреве, см. MODEL_WARMUP)
+registry.register("embeddings", _load_model)
 
 # Генерация эмбединга из текста
+@timed("embedding")
 def get_embedding(text: str) -> np.ndarray:
-    emb = model.encode([text])[0]
-    emb = emb / np.linalg.norm(emb)  # нормализация для косинусного сходства
-    return emb.astype('float32')
+    return get_embeddings([text])[0]
+
+# Повторяющиеся тексты не прогоняются через модель повторно (app/inference_cache.py)
+embedding_cache = InferenceCache(
+    "embeddings",
+    f"{EMBEDDING_VERSION}:{runtime_tag()}",
+    encode=lambda emb: np.asarray(emb, dtype='float32').tobytes(),
+    decode=lambda raw: np.frombuffer(raw, dtype='float32'),
+)
+
+# Генерация эмбедингов для пачки текстов за один проход модели
+@timed("embeddings")
+def get_embeddings(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    if not texts:
+        return _embed_uncached(texts, batch_size)
+    # Строки копируются, чтобы кеш не держал в памяти целые матрицы пачек
+    rows = embedding_cache.get_or_compute(texts, lambda chunk: [emb.copy() for emb in _embed_uncached(chunk, batch_size)])
+    return np.stack(rows)
+
+@timed("embeddings_model")
+def _embed_uncached(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    if use_sidecar():
+        return client.embed(texts)
+    return get_embeddings_local(texts, batch_size)
+
+# Инференс в текущем процессе (так работает и сам сайдкар)
+def get_embeddings_local(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    model = registry.get("embeddings")
+    if not texts:
+        # Форма (0, dim), чтобы пустой результат можно было склеивать с настоящими эмбеддингами
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype='float32')
+    embs = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    return np.asarray(embs, dtype='float32')
+
+# Сериализация эмбединга в байты для хранения в БД
+def embedding_to_bytes(emb: np.ndarray) -> bytes:
+    return np.asarray(emb, dtype='float32').tobytes()
+
+# Десериализация пачки эмбедингов из БД в матрицу (n, dim)
+def embeddings_from_bytes(blobs: list[bytes]) -> np.ndarray:
+    if not blobs:
+        return np.empty((0, 0), dtype='float32')
+    dim = len(blobs[0]) // 4
+    return np.frombuffer(b''.join(blobs), dtype='float32').reshape(len(blobs), dim)
+
+# Поддерживаемые типы FAISS-индексов:
+#   flat     — точный поиск перебором (по умолчанию)
+#   ivf_flat — инвертированные списки, ищем только в nprobe ближайших кластерах
+#   hnsw     — граф HNSW, точность/скорость регулируется efSearch, обучения не требует
+#   ivf_pq   — IVF со сжатием векторов product quantization (минимум памяти)
+INDEX_KINDS = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# Описание индекса в формате faiss.index_factory
+def index_factory_string(kind: str = "flat", nlist: int = 100, hnsw_m: int = 32, pq_m: int = 16, pq_nbits: int = 8) -> str:
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if kind == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    raise ValueError(f"Unknown FAISS index kind: {kind!r}, expected one of {INDEX_KINDS}")
+
+# Создание пустого индекса заданного типа (метрика — скалярное произведение)
+def make_faiss_index(dim: int, kind: str = "flat", **params) -> "faiss.Index":
+    import faiss
+    return faiss.index_factory(dim, index_factory_string(kind, **params), faiss.METRIC_INNER_PRODUCT)
+
+# Обучение индекса (IVF/PQ) на случайной подвыборке векторов
+def train_faiss_index(index: "faiss.Index", embeddings: np.ndarray, train_sample: Optional[int] = None, seed: int = 42) -> None:
+    if index.is_trained:
+        return
+    embeddings = np.asarray(embeddings, dtype='float32')
+    if train_sample is not None and len(embeddings) > train_sample:
+        rng = np.random.default_rng(seed)
+        embeddings = embeddings[rng.choice(len(embeddings), train_sample, replace=False)]
+    index.train(embeddings)
+
+# Параметры поиска: nprobe для IVF-индексов, efSearch для HNSW.
+# ParameterSpace умеет проходить сквозь обёртки вроде IndexIDMap2.
+def set_search_params(index: "faiss.Index", nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    import faiss
+    space = faiss.ParameterSpace()
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if nprobe is not None and faiss.try_extract_index_ivf(base) is not None:
+        space.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and isinstance(base, faiss.IndexHNSW):
+        space.set_index_parameter(index, "efSearch", ef_search)
 
 # Построение FAISS-индекса по списку эмбедингов
-def build_faiss_index(embeddings: list[np.ndarray]) -> faiss.IndexFlatL2:
-    dim = len(embeddings[0])
-    index = faiss.IndexFlatIP(dim)  
-    index.add(np.array(embeddings, dtype='float32'))
+@timed("faiss_build")
+def build_faiss_index(embeddings: list[np.ndarray], kind: str = "flat", train_sample: Optional[int] = None, **params) -> "faiss.Index":
+    embeddings = np.asarray(embeddings, dtype='float32')
+    index = make_faiss_index(embeddings.shape[1], kind, **params)
+    train_faiss_index(index, embeddings, train_sample)
+    index.add(embeddings)
     return index
 
 # Поиск top-K похожих эмбедингов
-def get_top_k_similar(index: faiss.IndexFlatIP, query_embedding: np.ndarray, k: int = 5) -> list[int]:
+def get_top_k_similar(index: "faiss.IndexFlatIP", query_embedding: np.ndarray, k: int = 5) -> list[int]:
     query_embedding = query_embedding.reshape(1, -1).astype('float32')
     distances, indices = index.search(query_embedding, k)
-    return indices[0].tolist()
\ No newline at end of file
+    return indices[0].tolist()
@@ -1,63 +1,86 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .models import Review, Movie
-from .semantic_embeddings import get_embedding, build_faiss_index, get_top_k_similar
+from .models import Movie
+from .embedding_store import load_user_vectors, load_user_vectors_async
+from .executor import run_in_model_executor
+from .metrics import timed
+from .movie_index import movie_index
 from .sentiment_types import SentimentEnum
 import numpy as np
 
-def get_semantic_recommendations(db: Session, user_id: int, top_k: int = 5) -> list[str]:
+@timed("recommend_semantic")
+def get_semantic_recommendations(
+    db: Session,
+    user_id: int,
+    top_k: int = 5,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> list[str]:
     """
     Формирует рекомендации на основе семантической близости отзывов.
+    Использует только предвычисленные эмбеддинги и общий индекс фильмов movie_index.
+
+    nprobe / ef_search переопределяют точность приближённого поиска (IVF / HNSW) для одного запроса.
     """
-    # Получаем положительные отзывы пользователя
-    user_reviews = db.query(Review).filter(
-        Review.user_id == user_id,
-        Review.sentiment == SentimentEnum.positive
-    ).all()
+    # Фильмы из положительных отзывов пользователя и эмбеддинги этих отзывов
+    watched_movie_ids, user_embs = load_user_vectors(db, user_id, sentiment=SentimentEnum.positive)
 
-    if not user_reviews:
+    if len(user_embs) == 0:
         return []
 
-    # Фильмы, которые пользователь уже оценивал
-    watched_movie_ids = {r.movie_id for r in user_reviews}
-
-    # Эмбеддинги всех фильмов в базе (по среднему эмбеддингу отзывов)
-    movie_embeddings = []
-    movie_ids = []
-
-    all_movies = db.query(Movie).all()
-    for movie in all_movies:
-        reviews = db.query(Review).filter(Review.movie_id == movie.id).all()
-        if not reviews:
-            continue
-        emb_list = [get_embedding(r.review_text) for r in reviews]
-        avg_emb = sum(emb_list) / len(emb_list)
-        avg_emb = avg_emb / np.linalg.norm(avg_emb)  # нормализация
-        movie_embeddings.append(avg_emb)
-        movie_ids.append(movie.id)
-
-    if not movie_embeddings:
+    # Поиск похожих фильмов в долгоживущем индексе
+    candidate_ids = _search_candidates(watched_movie_ids, user_embs, top_k, nprobe, ef_search)
+
+    # Названия фильмов одним запросом, порядок — по близости
+    titles = dict(db.execute(_titles_query(candidate_ids)).all())
+    return [titles[movie_id] for movie_id in candidate_ids if movie_id in titles]
+
+
+@timed("recommend_semantic")
+async def get_semantic_recommendations_async(
+    db: AsyncSession,
+    user_id: int,
+    top_k: int = 5,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> list[str]:
+    """Асинхронный вариант get_semantic_recommendations: FAISS-поиск выполняется в пуле моделей."""
+    watched_movie_ids, user_embs = await load_user_vectors_async(db, user_id, sentiment=SentimentEnum.positive)
+
+    if len(user_embs) == 0:
         return []
 
-    # Строим FAISS-индекс
-    index = build_faiss_index(movie_embeddings)
+    candidate_ids = await run_in_model_executor(
+        _search_candidates, watched_movie_ids, user_embs, top_k, nprobe, ef_search
+    )
+
+    titles = dict((await db.execute(_titles_query(candidate_ids))).all())
+    return [titles[movie_id] for movie_id in candidate_ids if movie_id in titles]
+
 
+def _search_candidates(
+    watched_movie_ids: set[int],
+    user_embs: np.ndarray,
+    top_k: int,
+    nprobe: Optional[int],
+    ef_search: Optional[int],
+) -> list[int]:
     # Вектор предпочтений пользователя (среднее по его позитивным отзывам)
-    user_embs = [get_embedding(r.review_text) for r in user_reviews]
-    user_vector = sum(user_embs) / len(user_embs)
+    user_vector = user_embs.mean(axis=0)
     user_vector = user_vector / np.linalg.norm(user_vector)
 
-    # Поиск похожих фильмов
-    top_indices = get_top_k_similar(index, user_vector, k=top_k * 2)
+    # Запрашиваем с запасом на уже просмотренные фильмы
+    top_movie_ids = movie_index.search(
+        user_vector, k=top_k + len(watched_movie_ids), nprobe=nprobe, ef_search=ef_search
+    )
 
     # Отбираем только новые фильмы
-    recommended_titles = []
-    for idx in top_indices:
-        movie_id = movie_ids[idx]
-        if movie_id not in watched_movie_ids:
-            movie = db.query(Movie).filter(Movie.id == movie_id).first()
-            if movie:
-                recommended_titles.append(movie.title)
-        if len(recommended_titles) >= top_k:
-            break
-
-    return recommended_titles
+    candidate_ids = [movie_id for movie_id in top_movie_ids if movie_id not in watched_movie_ids]
+    return candidate_ids[:top_k]
+
+
+def _titles_query(movie_ids: list[int]):
+    return select(Movie.id, Movie.title).where(Movie.id.in_(movie_ids))
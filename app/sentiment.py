@@ -1,29 +1,101 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import asyncio
+
+import numpy as np
 from scipy.special import softmax
-import torch
+from .batching import MicroBatcher
+from .config import settings
+from .executor import run_in_model_executor
+from .inference_cache import InferenceCache, runtime_tag
+from .inference_client import client, use_sidecar
+from .metrics import timed
+from .model_registry import huggingface_path, registry
 from .sentiment_types import SentimentEnum
 
 # Более точная и сбалансированная модель для анализа тональности на русском
 MODEL_NAME = "cointegrated/rubert-tiny-sentiment-balanced"
 
-# Загружаем токенизатор и модель
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+def _load_model():
+    """Загружает модель для выбранного рантайма (MODEL_RUNTIME)."""
+    if settings.MODEL_RUNTIME == "onnx":
+        from .onnx_backend import load_sentiment
+        return load_sentiment()
+    return _load_torch_model()
+
+def _load_torch_model():
+    """Загружает токенизатор и модель (из локального кеша HuggingFace, если он есть)."""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    path = huggingface_path(MODEL_NAME)
+    model = AutoModelForSequenceClassification.from_pretrained(path)
+    if settings.MODEL_WEIGHTS_MMAP:
+        from .mmap_weights import share_weights
+        share_weights(model, huggingface_path(MODEL_NAME))
+    return AutoTokenizer.from_pretrained(path), model
+
+# Модель грузится при первой классификации (или при прогреве, см. MODEL_WARMUP)
+registry.register("sentiment", _load_model)
 
 # Метки классов строго соответствуют выходу модели
 labels = ['negative', 'neutral', 'positive']
 
-def classify_sentiment(text: str) -> SentimentEnum:
-    # Токенизация входного текста
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
+# Повторяющиеся тексты не прогоняются через модель повторно (app/inference_cache.py)
+sentiment_cache = InferenceCache(
+    "sentiment",
+    f"{MODEL_NAME}:{runtime_tag()}",
+    encode=lambda sentiment: sentiment.value.encode(),
+    decode=lambda raw: SentimentEnum(raw.decode()),
+)
 
-    # Вычисление предсказания без вычисления градиентов
-    with torch.no_grad():
-        logits = model(**inputs).logits
+def classify_sentiment_batch(texts: list[str]) -> list[SentimentEnum]:
+    """Классифицирует пачку текстов за один проход модели (с паддингом до самого длинного)."""
+    if not texts:
+        return []
+    return sentiment_cache.get_or_compute(texts, _classify_uncached)
+
+@timed("sentiment_model")
+def _classify_uncached(texts: list[str]) -> list[SentimentEnum]:
+    if use_sidecar():
+        return [SentimentEnum(label) for label in client.sentiment(texts)]
+    return classify_sentiment_local(texts)
+
+def classify_sentiment_local(texts: list[str]) -> list[SentimentEnum]:
+    """Инференс в текущем процессе (так работает и сам сайдкар)."""
+    model = registry.get("sentiment")
+    if settings.MODEL_RUNTIME == "onnx":
+        logits = model.logits(texts)
+    else:
+        logits = torch_logits(*model, texts)
 
     # Преобразование логитов в вероятности
-    probs = softmax(logits.numpy()[0])
-    predicted_index = probs.argmax()
-    predicted_label = labels[predicted_index]
+    probs = softmax(logits, axis=1)
+    return [SentimentEnum(labels[i]) for i in probs.argmax(axis=1)]
+
+def torch_logits(tokenizer, model, texts: list[str]) -> np.ndarray:
+    """Логиты пачки текстов на PyTorch (MODEL_RUNTIME=torch)."""
+    import torch
+
+    # Токенизация всей пачки
+    with timed("sentiment_tokenize"):
+        inputs = tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
+
+    # Вычисление предсказания без вычисления градиентов
+    with timed("sentiment_forward"), torch.no_grad():
+        return model(**inputs).logits.numpy()
+
+
+# Конкурентные вызовы из разных потоков объединяются в один проход модели
+batcher = MicroBatcher(classify_sentiment_batch, settings.SENTIMENT_BATCH_MAX_SIZE, settings.SENTIMENT_BATCH_MAX_WAIT_MS, name="sentiment-batcher")
+
+@timed("sentiment")
+def classify_sentiment(text: str) -> SentimentEnum:
+    if settings.SENTIMENT_BATCHING:
+        return batcher(text)
+    return classify_sentiment_batch([text])[0]
+
 
-    return SentimentEnum(predicted_label)
\ No newline at end of file
+@timed("sentiment")
+async def classify_sentiment_async(text: str) -> SentimentEnum:
+    """Асинхронный вариант classify_sentiment: не блокирует event loop на время инференса."""
+    if settings.SENTIMENT_BATCHING:
+        return await asyncio.wrap_future(batcher.submit(text))
+    return (await run_in_model_executor(classify_sentiment_batch, [text]))[0]
@@ -3,4 +3,9 @@ import enum
 class SentimentEnum(str, enum.Enum):
     positive = "positive"
     neutral = "neutral"
-    negative = "negative"
\ No newline at end of file
+    negative = "negative"
+
+class EnrichmentStatus(str, enum.Enum):
+    pending = "pending"   # отзыв записан, задача обогащения в очереди
+    done = "done"         # тональность, эмбеддинг и агрегаты посчитаны
+    failed = "failed"     # попытки исчерпаны (python -m app.worker --retry-failed)
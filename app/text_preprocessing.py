@@ -0,0 +1,227 @@
+"""
+text_preprocessing.py - предобработка текстов отзывов для тематической кластеризации.
+
+Токенизация, лемматизация pymorphy2 и удаление стоп-слов выполняются один раз
+при записи отзыва; результат хранится в reviews.processed_text. Леммы кешируются
+в два уровня: LRU в памяти процесса и общий SQLite-файл на диске
+(LEMMA_CACHE_PATH), который переживает перезапуски и разделяется воркерами uvicorn.
+
+Бэкфилл для существующих отзывов (пул процессов для морфологии):
+
+    python -m app.text_preprocessing --workers 4 --batch-size 2000
+"""
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .inference_client import client, use_sidecar
+from .model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Ожидание блокировки SQLite-файла лемм: кеш не должен задерживать запись отзыва —
+# при занятом файле слово просто лемматизируется заново
+LEMMA_CACHE_TIMEOUT = 1.0
+
+def _load_morph():
+    import pymorphy2
+    return pymorphy2.MorphAnalyzer()
+
+def _load_stop_words() -> frozenset[str]:
+    """Стоп-слова nltk; скачиваются только если их нет в локальных данных nltk."""
+    import nltk
+    try:
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        if not settings.MODEL_ALLOW_DOWNLOADS:
+            raise
+        nltk.download('stopwords', quiet=True)
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('russian'))
+
+# Морфоанализатор и стоп-слова грузятся при первой предобработке текста
+registry.register("morph", _load_morph)
+registry.register("stopwords", _load_stop_words)
+
+# Регулярка для токенизации русских слов
+WORD_RE = re.compile(r'[а-яё]+', re.IGNORECASE)
+
+
+class LemmaCache:
+    """
+    Кеш word -> лемма: LRU в памяти плюс общий SQLite-файл.
+
+    Блокировка защищает только словарь в памяти: чтение SQLite, морфология и запись
+    идут без неё, через соединение своего потока, и параллельная предобработка
+    не выстраивается в очередь за диском. Ошибки SQLite (файл занят, только для чтения,
+    нет места) не ломают предобработку: остаются pymorphy2 и память. Соединения открываются
+    лениво и заново после fork, поэтому кеш можно использовать и из воркеров ProcessPoolExecutor.
+    """
+
+    def __init__(self, path: str, max_memory_size: int = 100_000):
+        self.path = path
+        self.max_memory_size = max_memory_size
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=LEMMA_CACHE_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")  # читатели не блокируют писателя из другого процесса
+            conn.execute("CREATE TABLE IF NOT EXISTS lemmas (word TEXT PRIMARY KEY, lemma TEXT NOT NULL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def lemmatize(self, words: Iterable[str]) -> dict[str, str]:
+        """Возвращает леммы для набора слов; pymorphy2 вызывается только для слов, которых нет ни в одном кеше."""
+        words = set(words)
+        with self._lock:
+            result = {}
+            for word in words:
+                if word in self._memory:
+                    self._memory.move_to_end(word)
+                    result[word] = self._memory[word]
+        missing = [word for word in words if word not in result]
+        if not missing:
+            return result
+
+        found: dict[str, str] = {}
+        try:
+            conn = self._connection()
+            if conn is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    found.update(conn.execute(f"SELECT word, lemma FROM lemmas WHERE word IN ({placeholders})", chunk))
+        except (sqlite3.Error, OSError) as exc:  # OSError — не удалось создать каталог файла
+            logger.warning("lemma cache read failed: %s", exc)
+            conn = None
+        missing = [word for word in missing if word not in found]
+
+        morph = registry.get("morph") if missing else None
+        parsed = {word: morph.parse(word)[0].normal_form for word in missing}
+        if parsed and conn is not None:
+            try:
+                conn.executemany("INSERT OR IGNORE INTO lemmas (word, lemma) VALUES (?, ?)", parsed.items())
+                conn.commit()
+            except sqlite3.Error as exc:
+                logger.warning("lemma cache write failed: %s", exc)
+                conn.rollback()
+        found.update(parsed)
+
+        with self._lock:
+            for word, lemma in found.items():
+                self._memory[word] = lemma
+                self._memory.move_to_end(word)
+            while len(self._memory) > self.max_memory_size:
+                self._memory.popitem(last=False)
+        result.update(found)
+        return result
+
+
+lemma_cache = LemmaCache(settings.LEMMA_CACHE_PATH)
+
+def lemmatize_word(word: str) -> str:
+    """Лемматизация с кешированием."""
+    return lemma_cache.lemmatize([word])[word]
+
+def preprocess_texts(texts: list[str]) -> list[str]:
+    """Токенизация, лемматизация и удаление стоп-слов для пачки текстов (одно обращение к кешу лемм)."""
+    if use_sidecar() and texts:
+        return client.preprocess(texts)
+    return preprocess_texts_local(texts)
+
+def preprocess_texts_local(texts: list[str]) -> list[str]:
+    """Предобработка в текущем процессе (так работает и сам сайдкар)."""
+    tokenized = [WORD_RE.findall(text.lower()) for text in texts]
+    lemmas = lemma_cache.lemmatize(word for words in tokenized for word in words)
+    stop_words = registry.get("stopwords")
+    return [
+        ' '.join(lemma for lemma in (lemmas[w] for w in words) if lemma not in stop_words)
+        for words in tokenized
+    ]
+
+def preprocess_text(text: str) -> str:
+    """Токенизация, лемматизация и удаление стоп-слов."""
+    return preprocess_texts([text])[0]
+
+
+def backfill_processed_text(db: Session, batch_size: int = 2000, workers: int = 1, recompute: bool = False) -> int:
+    """
+    Заполняет reviews.processed_text для отзывов, где он ещё не посчитан.
+
+    Args:
+        db (Session): текущая сессия БД.
+        batch_size (int): сколько отзывов читать и коммитить за раз.
+        workers (int): число процессов для морфологии (1 — в текущем процессе).
+        recompute (bool): пересчитать все отзывы (например, после смены списка стоп-слов).
+
+    Returns:
+        int: количество обработанных отзывов.
+    """
+    from .models import Review
+
+    processed = 0
+    last_id = 0
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        while True:
+            query = select(Review.id, Review.review_text).where(Review.id > last_id)
+            if not recompute:
+                query = query.where(Review.processed_text.is_(None))
+            rows = db.execute(query.order_by(Review.id).limit(batch_size)).all()
+            if not rows:
+                break
+
+            texts = [r.review_text for r in rows]
+            if pool is None:
+                results = preprocess_texts(texts)
+            else:
+                chunk = -(-len(texts) // workers)
+                parts = [texts[i:i + chunk] for i in range(0, len(texts), chunk)]
+                results = [text for part in pool.map(preprocess_texts, parts) for text in part]
+
+            # ORM bulk UPDATE по первичному ключу (executemany)
+            db.execute(update(Review), [{"id": r.id, "processed_text": text} for r, text in zip(rows, results)])
+            db.commit()
+
+            processed += len(rows)
+            last_id = rows[-1].id
+            print(f"preprocessed {processed} reviews (last id {last_id})")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return processed
+
+
+def main() -> None:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Бэкфилл предобработанного текста отзывов для кластеризации")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов для лемматизации")
+    parser.add_argument("--recompute", action="store_true", help="пересчитать и уже заполненные отзывы")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        total = backfill_processed_text(db, args.batch_size, args.workers, args.recompute)
+    print(f"done: {total} reviews preprocessed")
+
+
+if __name__ == "__main__":
+    main()
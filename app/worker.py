@@ -0,0 +1,270 @@
+"""
+worker.py - фоновое обогащение отзывов из очереди enrichment_jobs (ENRICHMENT_MODE=queue).
+
+В режиме queue POST /reviews и импорт только вставляют отзыв и задачу одной транзакцией.
+Воркер забирает пачку готовых задач через SELECT ... FOR UPDATE SKIP LOCKED и в той же
+транзакции:
+  * одним проходом моделей считает тональность (если её не передали), эмбеддинги
+    и лемматизированный текст;
+  * обновляет отзывы (enrichment_status = done), review_embeddings и movie_stats;
+  * удаляет задачи.
+Блокировки строк держатся до коммита: параллельные воркеры (в том числе на других машинах)
+берут разные задачи, а задачи упавшего процесса возвращаются в очередь вместе с откатом.
+Пропускная способность масштабируется числом запущенных воркеров.
+
+Если пачка падает, её задачи повторяются по одной, чтобы один «плохой» отзыв не задерживал
+остальные. Упавшая задача откладывается на ENRICHMENT_RETRY_BASE_SECONDS * 2^(попытка - 1)
+секунд (не больше ENRICHMENT_RETRY_MAX_SECONDS); после ENRICHMENT_MAX_ATTEMPTS попыток
+отзыв помечается failed, а задача остаётся в таблице с текстом последней ошибки.
+
+    python -m app.worker                  # разбирать очередь, пока не остановят (Ctrl+C / SIGTERM)
+    python -m app.worker --once           # разобрать текущую очередь и выйти
+    python -m app.worker --retry-failed   # вернуть failed-отзывы в очередь
+    python -m app.worker --stats          # размер очереди
+
+Индекс фильмов в процессах API подтягивает новые векторы сам (см. MovieIndex.sync; после
+перезапуска — начиная с отметки, сохранённой вместе с индексом), а кеш рекомендаций
+сбрасывается отсюда через общее хранилище: режим queue требует CACHE_BACKEND=redis.
+"""
+import argparse
+import logging
+import signal
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from .cache import recommendation_cache
+from .config import settings
+from .database import SessionLocal
+from .embedding_store import save_review_embeddings
+from .models import EnrichmentJob, Review
+from .movie_stats import record_reviews
+from .semantic_embeddings import get_embeddings
+from .sentiment import classify_sentiment_batch
+from .sentiment_types import EnrichmentStatus
+from .text_preprocessing import preprocess_texts
+
+logger = logging.getLogger(__name__)
+
+# Сколько символов последней ошибки хранить в задаче
+MAX_ERROR_LENGTH = 2000
+
+
+def _claim_query(limit: int, job_id: Optional[int] = None):
+    """Готовые задачи вместе с нужными полями отзыва; занятые другими воркерами пропускаются."""
+    query = (
+        select(
+            EnrichmentJob.id,
+            EnrichmentJob.attempts,
+            EnrichmentJob.review_id,
+            Review.movie_id,
+            Review.user_id,
+            Review.rating,
+            Review.review_text,
+            Review.sentiment,
+        )
+        .join(Review, Review.id == EnrichmentJob.review_id)
+        .where(EnrichmentJob.run_after <= func.now())
+        .order_by(EnrichmentJob.run_after, EnrichmentJob.id)
+        .limit(limit)
+        .with_for_update(of=EnrichmentJob, skip_locked=True)
+    )
+    if job_id is not None:
+        query = query.where(EnrichmentJob.id == job_id)
+    return query
+
+
+def retry_delay(attempts: int) -> float:
+    """Экспоненциальная задержка перед попыткой номер attempts + 1."""
+    return min(settings.ENRICHMENT_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.ENRICHMENT_RETRY_MAX_SECONDS)
+
+
+def enrich(db: Session, jobs: list) -> None:
+    """
+    Обогащает отзывы захваченных задач и удаляет задачи. Коммит остаётся на стороне вызывающего кода.
+
+    Args:
+        db (Session): сессия, в транзакции которой задачи захвачены.
+        jobs (list): строки _claim_query.
+    """
+    texts = [job.review_text for job in jobs]
+
+    # Тональность могли передать при записи (create_review(..., sentiment=...)) — тогда не пересчитываем
+    sentiments = [job.sentiment for job in jobs]
+    missing = [i for i, sentiment in enumerate(sentiments) if sentiment is None]
+    for i, sentiment in zip(missing, classify_sentiment_batch([texts[i] for i in missing])):
+        sentiments[i] = sentiment
+    embeddings = get_embeddings(texts)
+    processed_texts = preprocess_texts(texts)
+
+    # executemany UPDATE по первичному ключу
+    db.execute(
+        update(Review),
+        [
+            {
+                "id": job.review_id,
+                "sentiment": sentiment,
+                "processed_text": processed_text,
+                "enrichment_status": EnrichmentStatus.done,
+            }
+            for job, sentiment, processed_text in zip(jobs, sentiments, processed_texts)
+        ],
+    )
+    record_reviews(db, [(job.movie_id, sentiment, job.rating) for job, sentiment in zip(jobs, sentiments)])
+    db.execute(delete(EnrichmentJob).where(EnrichmentJob.id.in_([job.id for job in jobs])))
+    # Последним перед коммитом: created_at эмбеддингов отстаёт от коммита на миллисекунды (см. MovieIndex.sync)
+    save_review_embeddings(db, [job.review_id for job in jobs], embeddings)
+
+
+def _reviews_written(jobs: list) -> None:
+    for user_id in {job.user_id for job in jobs}:
+        recommendation_cache.reviews_written(user_id)
+
+
+def _record_failure(db: Session, job, error: Exception) -> None:
+    """Откладывает упавшую задачу или, если попытки исчерпаны, помечает отзыв failed."""
+    attempts = job.attempts + 1
+    failed = attempts >= settings.ENRICHMENT_MAX_ATTEMPTS
+    run_after = None if failed else func.now() + timedelta(seconds=retry_delay(attempts))
+    # attempts в условии: если задачу успел взять и уронить другой воркер, попытка не посчитается дважды
+    result = db.execute(
+        update(EnrichmentJob)
+        .where(EnrichmentJob.id == job.id, EnrichmentJob.attempts == job.attempts)
+        .values(attempts=attempts, run_after=run_after, last_error=repr(error)[:MAX_ERROR_LENGTH])
+    )
+    if failed and result.rowcount:
+        db.execute(update(Review).where(Review.id == job.review_id).values(enrichment_status=EnrichmentStatus.failed))
+    db.commit()
+    logger.warning("enrichment of review %d failed (attempt %d/%d): %r",
+                   job.review_id, attempts, settings.ENRICHMENT_MAX_ATTEMPTS, error)
+
+
+def _run_single(db: Session, job_id: int) -> int:
+    """Повторяет одну задачу из упавшей пачки в отдельной транзакции."""
+    jobs = db.execute(_claim_query(1, job_id)).all()
+    if not jobs:
+        db.rollback()  # задачу уже забрал другой воркер
+        return 0
+    try:
+        enrich(db, jobs)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        _record_failure(db, jobs[0], exc)
+        return 0
+    _reviews_written(jobs)
+    return 1
+
+
+def run_once(db: Session, batch_size: int = settings.ENRICHMENT_BATCH_SIZE) -> int:
+    """
+    Захватывает до batch_size готовых задач и обрабатывает их одной транзакцией.
+
+    Returns:
+        int: число захваченных задач (0 — очередь пуста).
+    """
+    jobs = db.execute(_claim_query(batch_size)).all()
+    if not jobs:
+        db.rollback()
+        return 0
+    try:
+        enrich(db, jobs)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        if len(jobs) == 1:
+            _record_failure(db, jobs[0], exc)
+        else:
+            logger.warning("batch of %d jobs failed (%r), retrying one by one", len(jobs), exc)
+            for job in jobs:
+                _run_single(db, job.id)
+        return len(jobs)
+    _reviews_written(jobs)
+    logger.info("enriched %d reviews", len(jobs))
+    return len(jobs)
+
+
+def retry_failed(db: Session) -> int:
+    """Возвращает в очередь задачи с исчерпанными попытками. Returns: число задач."""
+    review_ids = db.scalars(
+        update(EnrichmentJob)
+        .where(EnrichmentJob.run_after.is_(None))
+        .values(attempts=0, run_after=func.now())
+        .returning(EnrichmentJob.review_id)
+    ).all()
+    if review_ids:
+        db.execute(update(Review).where(Review.id.in_(review_ids)).values(enrichment_status=EnrichmentStatus.pending))
+    db.commit()
+    return len(review_ids)
+
+
+def queue_stats(db: Session) -> dict:
+    """Размер очереди: готовые к обработке, отложенные после ошибки и с исчерпанными попытками."""
+    row = db.execute(
+        select(
+            func.count(case((EnrichmentJob.run_after <= func.now(), 1))).label("ready"),
+            func.count(case((EnrichmentJob.run_after > func.now(), 1))).label("delayed"),
+            func.count(case((EnrichmentJob.run_after.is_(None), 1))).label("failed"),
+        )
+    ).one()
+    return dict(row._mapping)
+
+
+def run(batch_size: int, poll_interval: float, once: bool = False) -> int:
+    """
+    Разбирает очередь до остановки (SIGTERM/SIGINT) или, при once, пока она не опустеет.
+
+    Returns:
+        int: число обработанных задач.
+    """
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        # Текущая пачка дорабатывается и коммитится, новая не берётся
+        signal.signal(sig, lambda *_: stop.set())
+
+    total = 0
+    with SessionLocal() as db:
+        while not stop.is_set():
+            try:
+                processed = run_once(db, batch_size)
+            except Exception:
+                # Например, БД недоступна: транзакция откатывается, задачи остаются в очереди
+                logger.exception("enrichment worker iteration failed")
+                db.rollback()
+                stop.wait(poll_interval)
+                continue
+            total += processed
+            if not processed:
+                if once:
+                    break
+                stop.wait(poll_interval)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Фоновое обогащение отзывов из очереди enrichment_jobs")
+    parser.add_argument("--batch-size", type=int, default=settings.ENRICHMENT_BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=settings.ENRICHMENT_POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="разобрать текущую очередь и выйти")
+    parser.add_argument("--retry-failed", action="store_true", help="вернуть в очередь задачи с исчерпанными попытками")
+    parser.add_argument("--stats", action="store_true", help="напечатать размер очереди")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.retry_failed or args.stats:
+        with SessionLocal() as db:
+            if args.retry_failed:
+                print(f"requeued {retry_failed(db)} jobs")
+            if args.stats:
+                print(queue_stats(db))
+        return
+
+    total = run(args.batch_size, args.poll_interval, once=args.once)
+    print(f"done: {total} jobs processed")
+
+
+if __name__ == "__main__":
+    main()
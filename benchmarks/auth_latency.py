@@ -0,0 +1,85 @@
+"""
+auth_latency.py - задержка авторизованного запроса и число SQL-запросов на него.
+
+Через ASGI-клиент (без сети) регистрирует временного пользователя (в конце он удаляется) и много раз
+вызывает GET /me в трёх режимах get_current_user:
+  * db      — SELECT users на каждый запрос (AUTH_PRINCIPAL_CACHE_TTL_SECONDS=0);
+  * cache   — пользователь из кеша principal_cache;
+  * claims  — имя и email из самого токена (AUTH_EMBED_USER_CLAIMS=true).
+
+    python benchmarks/auth_latency.py --requests 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.config import settings
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.models import User
+
+MODES = {
+    "db": {"AUTH_PRINCIPAL_CACHE_TTL_SECONDS": 0, "AUTH_EMBED_USER_CLAIMS": False},
+    "cache": {"AUTH_PRINCIPAL_CACHE_TTL_SECONDS": 300, "AUTH_EMBED_USER_CLAIMS": False},
+    "claims": {"AUTH_PRINCIPAL_CACHE_TTL_SECONDS": 0, "AUTH_EMBED_USER_CLAIMS": True},
+}
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def run_mode(client: TestClient, email: str, password: str, requests: int, counter: QueryCounter) -> tuple[list[float], int]:
+    # Токен выпускается заново: в режиме claims в нём должны оказаться имя и email
+    token = client.post("/token", data={"username": email, "password": password}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/me", headers=headers)  # прогрев
+    latencies = []
+    queries_before = counter.count
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get("/me", headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return latencies, counter.count - queries_before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Задержка get_current_user: БД, кеш пользователей, claims в токене")
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    counter = QueryCounter(async_engine.sync_engine)
+    email, password = f"bench-{uuid.uuid4().hex[:12]}@example.com", uuid.uuid4().hex
+    try:
+        with TestClient(app) as client:
+            client.post("/register", json={"name": "bench", "email": email, "password": password}).raise_for_status()
+            print(f"{'mode':<8} {'mean, ms':>9} {'p50, ms':>8} {'p95, ms':>8} {'queries/req':>12}")
+            for mode, overrides in MODES.items():
+                for name, value in overrides.items():
+                    setattr(settings, name, value)
+                latencies, queries = run_mode(client, email, password, args.requests, counter)
+                p95 = statistics.quantiles(latencies, n=20)[-1]
+                print(f"{mode:<8} {statistics.mean(latencies):>9.3f} {statistics.median(latencies):>8.3f} "
+                      f"{p95:>8.3f} {queries / args.requests:>12.2f}")
+    finally:
+        # Временный пользователь не должен оставаться в базе из .env
+        with SessionLocal() as db:
+            db.execute(delete(User).where(User.email == email))
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
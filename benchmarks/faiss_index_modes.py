@@ -0,0 +1,91 @@
+"""
+faiss_index_modes.py - сравнение типов FAISS-индексов по точности и задержке.
+
+На синтетическом корпусе (смесь гауссиан на единичной сфере, как у нормализованных
+эмбеддингов) строит каждый индекс из semantic_embeddings.INDEX_KINDS и сравнивает
+его выдачу с точным flat-индексом: recall@k и среднее время одного запроса
+для разных nprobe / efSearch.
+
+    python benchmarks/faiss_index_modes.py --n 200000 --dim 384 --queries 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.semantic_embeddings import build_faiss_index, set_search_params
+
+
+def synthetic_corpus(n: int, dim: int, n_topics: int, seed: int = 0) -> np.ndarray:
+    """Векторы, сгруппированные вокруг n_topics «тем», нормализованные для косинусного сходства."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_topics, dim)).astype("float32")
+    data = centers[rng.integers(0, n_topics, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype("float32")
+    faiss.normalize_L2(data)
+    return data
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run_queries(index: faiss.Index, queries: np.ndarray, k: int) -> tuple[np.ndarray, float]:
+    """Ищет по одному запросу за раз (как в API) и возвращает найденные ID и среднее время, мс."""
+    found = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, ids = index.search(query.reshape(1, -1), k)
+        found[i] = ids[0]
+    return found, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall vs latency для типов FAISS-индексов")
+    parser.add_argument("--n", type=int, default=100_000, help="размер корпуса")
+    parser.add_argument("--dim", type=int, default=384, help="размерность (384 у all-MiniLM-L6-v2)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--train-sample", type=int, default=50_000)
+    parser.add_argument("--threads", type=int, default=1, help="потоки OpenMP (1 — как на один запрос API)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    corpus = synthetic_corpus(args.n, args.dim, n_topics=max(args.n // 500, 10))
+    queries = synthetic_corpus(args.queries, args.dim, n_topics=max(args.n // 500, 10), seed=1)
+
+    exact = build_faiss_index(corpus, "flat")
+    truth, exact_ms = run_queries(exact, queries, args.k)
+
+    print(f"corpus={args.n} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"{'mode':<10} {'param':<14} {'build, s':>9} {'recall@k':>9} {'ms/query':>9}")
+    print(f"{'flat':<10} {'-':<14} {'-':>9} {1.0:>9.3f} {exact_ms:>9.3f}")
+
+    sweeps = {
+        "ivf_flat": [("nprobe", v) for v in (1, 4, 16, 64)],
+        "hnsw": [("efSearch", v) for v in (16, 32, 64, 128)],
+        "ivf_pq": [("nprobe", v) for v in (1, 4, 16, 64)],
+    }
+    params = {"nlist": args.nlist, "hnsw_m": args.hnsw_m, "pq_m": args.pq_m}
+    for kind, sweep in sweeps.items():
+        start = time.perf_counter()
+        index = build_faiss_index(corpus, kind, train_sample=args.train_sample, **params)
+        build_s = time.perf_counter() - start
+        for name, value in sweep:
+            if name == "nprobe":
+                set_search_params(index, nprobe=value)
+            else:
+                set_search_params(index, ef_search=value)
+            found, ms = run_queries(index, queries, args.k)
+            print(f"{kind:<10} {f'{name}={value}':<14} {build_s:>9.2f} {recall_at_k(found, truth):>9.3f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+inference_cache.py - эффект кеша результатов моделей на реальных отзывах.
+
+Тексты берутся из отзывов в БД (или из файла, по одному на строку) и прогоняются
+через классификацию тональности и эмбеддинги пачками:
+  * off  — кеш выключен, каждый текст идёт в модель;
+  * cold — пустой кеш: модель вызывается только для уникальных текстов;
+  * warm — второй проход по тем же текстам, всё из памяти.
+Дисковый уровень в замере не участвует (INFERENCE_CACHE_PATH="").
+
+    python benchmarks/inference_cache.py --limit 5000 --batch-size 64
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ["INFERENCE_CACHE_PATH"] = ""
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import inference_cache
+from app.config import settings
+from app.semantic_embeddings import get_embeddings
+from app.sentiment import classify_sentiment_batch
+
+
+def load_texts(path: str, limit: int) -> list[str]:
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:limit]
+    from sqlalchemy import select
+
+    from app.database import SessionLocal
+    from app.models import Review
+
+    with SessionLocal() as db:
+        return list(db.scalars(select(Review.review_text).order_by(Review.id).limit(limit)))
+
+
+def run(texts: list[str], batch_size: int) -> float:
+    """Тональность и эмбеддинги для всех текстов пачками; возвращает текстов в секунду."""
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        chunk = texts[i:i + batch_size]
+        classify_sentiment_batch(chunk)
+        get_embeddings(chunk)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пропускная способность инференса с кешем и без")
+    parser.add_argument("--file", default="", help="файл с текстами (по одному на строку); по умолчанию — отзывы из БД")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    texts = load_texts(args.file, args.limit)
+    if not texts:
+        sys.exit("no texts")
+    unique = len({inference_cache.normalize_text(text) for text in texts})
+    print(f"texts={len(texts)} unique={unique} ({1 - unique / len(texts):.1%} repeats) batch={args.batch_size}")
+
+    run(texts[:args.batch_size], args.batch_size)  # прогрев моделей
+    settings.INFERENCE_CACHE_ENABLED = False
+    print(f"{'off':<5} {run(texts, args.batch_size):>9.1f} texts/s")
+
+    settings.INFERENCE_CACHE_ENABLED = True
+    for cache in inference_cache.caches:
+        cache._memory.clear()
+    print(f"{'cold':<5} {run(texts, args.batch_size):>9.1f} texts/s")
+    print(f"{'warm':<5} {run(texts, args.batch_size):>9.1f} texts/s")
+    for name, stats in inference_cache.stats()["models"].items():
+        print(f"{name}: hit ratio {stats['hit_ratio']:.2%}, {stats['memory_entries']} entries")
+
+
+if __name__ == "__main__":
+    main()
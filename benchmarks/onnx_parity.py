@@ -0,0 +1,105 @@
+"""
+onnx_parity.py - сравнение ONNX Runtime (float32 и int8) с PyTorch по точности и скорости.
+
+Для тональности считается доля совпавших меток и максимальное расхождение логитов,
+для эмбеддингов — косинусное сходство с векторами PyTorch (среднее и минимум).
+Скорость — тексты в секунду при заданном размере пачки и числе потоков.
+Тексты берутся из файла (по одному на строку) или из отзывов в БД.
+
+    python -m app.onnx_backend export --quantize
+    python benchmarks/onnx_parity.py --limit 1000 --batch-size 32 --threads 4
+    python benchmarks/onnx_parity.py --file texts.txt --min-agreement 0.98 --min-cosine 0.99
+
+С --min-agreement / --min-cosine скрипт завершается с ненулевым кодом, если
+какой-либо ONNX-вариант хуже порога, — его можно запускать в CI после экспорта.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import onnx_backend
+from app.semantic_embeddings import _load_torch_model as load_torch_encoder
+from app.sentiment import _load_torch_model as load_torch_classifier, torch_logits
+
+
+def load_texts(path: str, limit: int) -> list[str]:
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:limit]
+    from sqlalchemy import select
+
+    from app.database import SessionLocal
+    from app.models import Review
+
+    with SessionLocal() as db:
+        return list(db.scalars(select(Review.review_text).order_by(Review.id).limit(limit)))
+
+
+def batched(fn: Callable[[list[str]], np.ndarray], texts: list[str], batch_size: int) -> tuple[np.ndarray, float]:
+    """Прогоняет тексты пачками и возвращает результат и пропускную способность (текстов/с)."""
+    fn(texts[:batch_size])  # прогрев: первые прогоны медленнее
+    start = time.perf_counter()
+    result = np.concatenate([fn(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+    return result, len(texts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Точность и скорость ONNX Runtime относительно PyTorch")
+    parser.add_argument("--file", default="", help="файл с текстами (по одному на строку); по умолчанию — отзывы из БД")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=1, help="потоки torch и ONNX Runtime (1 — как один поток воркера)")
+    parser.add_argument("--min-agreement", type=float, default=None, help="порог доли совпавших меток тональности")
+    parser.add_argument("--min-cosine", type=float, default=None, help="порог минимального косинуса эмбеддингов")
+    args = parser.parse_args()
+
+    import torch
+
+    torch.set_num_threads(args.threads)
+    texts = load_texts(args.file, args.limit)
+    if not texts:
+        sys.exit("no texts to compare")
+
+    variants = {"onnx": False}
+    if os.path.isfile(os.path.join(onnx_backend.model_dir("sentiment"), onnx_backend.QUANTIZED_MODEL_FILE)):
+        variants["onnx-int8"] = True
+
+    print(f"texts={len(texts)} batch={args.batch_size} threads={args.threads}")
+    failed = False
+
+    tokenizer, model = load_torch_classifier()
+    reference, torch_speed = batched(lambda chunk: torch_logits(tokenizer, model, chunk), texts, args.batch_size)
+    print("\nsentiment")
+    print(f"{'runtime':<10} {'agreement':>10} {'max |Δlogit|':>13} {'texts/s':>9}")
+    print(f"{'torch':<10} {1.0:>10.4f} {0.0:>13.4f} {torch_speed:>9.1f}")
+    for name, quantized in variants.items():
+        onnx_model = onnx_backend.load_sentiment(quantized=quantized, threads=args.threads)
+        logits, speed = batched(onnx_model.logits, texts, args.batch_size)
+        agreement = float(np.mean(logits.argmax(axis=1) == reference.argmax(axis=1)))
+        print(f"{name:<10} {agreement:>10.4f} {np.abs(logits - reference).max():>13.4f} {speed:>9.1f}")
+        failed |= args.min_agreement is not None and agreement < args.min_agreement
+
+    encoder = load_torch_encoder()
+    encode = lambda chunk: np.asarray(encoder.encode(chunk, batch_size=args.batch_size, normalize_embeddings=True))
+    reference, torch_speed = batched(encode, texts, args.batch_size)
+    print("\nembeddings")
+    print(f"{'runtime':<10} {'mean cos':>10} {'min cos':>10} {'texts/s':>9}")
+    print(f"{'torch':<10} {1.0:>10.4f} {1.0:>10.4f} {torch_speed:>9.1f}")
+    for name, quantized in variants.items():
+        onnx_model = onnx_backend.load_embeddings(quantized=quantized, threads=args.threads)
+        vectors, speed = batched(lambda chunk: onnx_model.encode(chunk, batch_size=args.batch_size), texts, args.batch_size)
+        cosine = np.sum(vectors * reference, axis=1)  # обе стороны нормализованы
+        print(f"{name:<10} {cosine.mean():>10.4f} {cosine.min():>10.4f} {speed:>9.1f}")
+        failed |= args.min_cosine is not None and cosine.min() < args.min_cosine
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+query_plans.py - проверка планов запросов рекомендателей и списка отзывов.
+
+Для каждого запроса из crud и рекомендателей выполняется EXPLAIN (FORMAT JSON) на
+локальной PostgreSQL (настройки из .env) и проверяется, что таблица reviews читается
+через ожидаемый индекс, а не последовательным сканированием.
+
+На маленькой тестовой БД планировщик честно предпочитает seq scan, поэтому по
+умолчанию он запрещён (enable_seqscan = off): проверяется, что подходящий индекс
+существует и применим к запросу. С --real-costs планы строятся как есть — так
+удобно смотреть на БД с продовыми объёмами.
+
+    alembic upgrade head
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --real-costs --verbose
+
+Завершается с ненулевым кодом, если хотя бы один запрос не использует свой индекс, —
+его можно запускать в CI против БД с применёнными миграциями.
+"""
+import argparse
+import json
+import os
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import crud
+from app.als_recommender import _user_ratings_query
+from app.collaborative_filtering import _item_based_query
+from app.database import engine
+from app.embedding_store import _user_vectors_query
+from app.recommendation import _popular_unwatched_query
+from app.sentiment_types import SentimentEnum
+
+USER_ID = 1
+
+# Запрос -> индекс reviews, которым он должен читать таблицу
+CHECKS = [
+    ("recommendations: popular unwatched", lambda: _popular_unwatched_query(USER_ID, 5), "ix_reviews_user_id_sentiment"),
+    ("semantic: positive reviews of user", lambda: _user_vectors_query(USER_ID, SentimentEnum.positive), "ix_reviews_user_id_sentiment"),
+    ("item-based: liked movies", lambda: _item_based_query(USER_ID, 5, 7), "ix_reviews_user_id_sentiment"),
+    ("als: ratings of user", lambda: _user_ratings_query(USER_ID), "ix_reviews_user_id_sentiment"),
+    ("reviews: newest page", lambda: crud._reviews_query(), "ix_reviews_created_at_id"),
+    ("reviews: by sentiment", lambda: crud._reviews_query(sentiment_filter="negative"), "ix_reviews_sentiment_created_at_id"),
+    ("reviews: by movie title", lambda: crud._reviews_query(movie_filter="матрица"), "ix_reviews_movie_id_created_at"),
+    ("reviews: full-text search", lambda: crud._reviews_query(search="отличный фильм"), "ix_reviews_search_vector"),
+]
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(conn, query) -> dict:
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    return conn.execute(text("EXPLAIN (FORMAT JSON) " + sql.replace(":", r"\:"))).scalar()[0]["Plan"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Проверка использования индексов в запросах к reviews")
+    parser.add_argument("--real-costs", action="store_true", help="не запрещать seq scan (для БД с реальными объёмами)")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы целиком")
+    args = parser.parse_args()
+
+    failed = 0
+    with engine.connect() as conn:
+        if not args.real_costs:
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, build, expected in CHECKS:
+            plan = explain(conn, build())
+            nodes = list(plan_nodes(plan))
+            # У Bitmap Index Scan нет Relation Name — индексы reviews узнаём по префиксу имени
+            used = sorted({node["Index Name"] for node in nodes if node.get("Index Name", "").startswith("ix_reviews_")})
+            seq_scan = any(node["Node Type"] == "Seq Scan" and node.get("Relation Name") == "reviews" for node in nodes)
+            ok = expected in used and not seq_scan
+            failed += not ok
+            print(f"{'ok' if ok else 'FAIL':<5} {name:<38} expected {expected}, used: {', '.join(used) or '-'}"
+                  f"{' + seq scan' if seq_scan else ''}")
+            if args.verbose or not ok:
+                print(json.dumps(plan, indent=2, ensure_ascii=False))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
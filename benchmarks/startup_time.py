@@ -0,0 +1,73 @@
+"""
+startup_time.py - время импорта app.main и старта приложения.
+
+Каждый замер — отдельный процесс: импорт app.main и прогон lifespan
+(как при запуске воркера uvicorn). Дополнительно проверяется, что после
+импорта не загружены тяжёлые ML-библиотеки: модели должны грузиться лениво
+(app/model_registry.py), иначе каждый воркер платит за них при старте.
+
+    python benchmarks/startup_time.py --runs 5
+    python benchmarks/startup_time.py --api-only --max-seconds 2
+
+С --max-seconds скрипт завершается с ненулевым кодом, если медиана превышает
+порог или при импорте подтянулась тяжёлая библиотека, — его можно запускать в CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Библиотеки, которых не должно быть в sys.modules сразу после импорта app.main
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "pymorphy2", "nltk", "sklearn", "faiss", "onnxruntime")
+
+# heavy_after_import считается до lifespan: прогрев (MODEL_WARMUP) имеет право грузить модели
+PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+heavy_after_import = [name for name in {heavy!r} if name in sys.modules]
+async def run_lifespan():
+    async with app.main.lifespan(app.main.app):
+        pass
+asyncio.run(run_lifespan())
+finished = time.perf_counter()
+print(json.dumps({{"import": imported - started, "startup": finished - started, "heavy_after_import": heavy_after_import}}))
+"""
+
+
+def measure(api_only: bool) -> dict:
+    env = dict(os.environ)
+    if api_only:
+        env["ENABLE_ML"] = "false"
+    code = PROBE.format(heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замер времени старта приложения")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--api-only", action="store_true", help="ENABLE_ML=false, как у API-only воркеров")
+    parser.add_argument("--max-seconds", type=float, default=None, help="порог медианы времени старта")
+    args = parser.parse_args()
+
+    runs = [measure(args.api_only) for _ in range(args.runs)]
+    imports = [r["import"] for r in runs]
+    startups = [r["startup"] for r in runs]
+    heavy = sorted({name for r in runs for name in r["heavy_after_import"]})
+
+    print(f"import app.main: median {statistics.median(imports):.3f}s, max {max(imports):.3f}s")
+    print(f"import + lifespan: median {statistics.median(startups):.3f}s, max {max(startups):.3f}s")
+    print(f"heavy modules after import: {', '.join(heavy) or 'none'}")
+
+    if args.max_seconds is not None and (statistics.median(startups) > args.max_seconds or heavy):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()